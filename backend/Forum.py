@@ -1,72 +1,49 @@
-from typing import List
+from typing import List, Optional, Tuple
 from backend.Messages import Post, Comment
 from backend.User import User
 
 # DB imports
-from .db import SessionLocal, init_db
 from .models import ForumModel, UserModel, PostModel
-from .object_registry import register, get as registry_get
+from .object_registry import get as registry_get, get_or_register, discard
+from .wrapper_fields import lazy_list, MemberSet
 
 # Service imports
-from .forum_services import ForumMembershipService, ForumPostService, ForumRepository
+from .forum_services import ForumMembershipService, ForumPostService, ForumRepository, ForumStatsRepository
 
-import random
 
-# Ensure DB tables exist
-init_db()
+
+class _DeletedUser:
+    # Forum.DELETED_USER without touching the users table at import time
+    def __get__(self, instance, owner) -> User:
+        return ForumMembershipService.deleted_user()
+
 
 class Forum:
-    def __new__(cls, *args, **kwargs):
-        # Allow kwargs for course name and details
-        course_name = kwargs.get('course_name')
-        if course_name is None and len(args) > 0:
-            course_name = args[0]
+    __slots__ = ('course_name', 'forum_id', 'db_id', 'created_at',
+                 '_posts', '_users', '_authorized', '_restricted', '__weakref__')
+
+    # Relationship lists, allocated on first access. Members are MemberSets keyed by
+    # user id, read from the association tables then (load_members fills many at once)
+    posts = lazy_list()
+    users = lazy_list(lambda forum: ForumMembershipService.members_of(forum, 'users'))
+    authorized = lazy_list(lambda forum: ForumMembershipService.members_of(forum, 'authorized'))
+    restricted = lazy_list(lambda forum: ForumMembershipService.members_of(forum, 'restricted'))
+
+    def __new__(cls, course_name: str = None):
+        # Without a course name __init__ reports it
         if course_name is None:
             return object.__new__(cls)
+        # Insert the row or find it by course name in one go; the wrapper is built from that row
+        return cls.get_or_create(course_name)[0]
 
-        # Check if forum already exists
-        forum_model = ForumRepository.find_by_course_name(course_name)
-        if forum_model is not None:
-            existing = registry_get('Forum', getattr(forum_model, 'id', None))
-            if existing is not None:
-                return existing
-            wrapper = cls.from_model(forum_model)
-            return wrapper
-        # if not found, create new
-        return object.__new__(cls)
-
-    # Class-level deleted user instance for maintaining post history
-    DELETED_USER = User("[deleted]", "deleted@scu.edu", "N/A", 1, None, None, None)
+    # Class-level deleted user instance for maintaining post history, resolved on first use
+    DELETED_USER = _DeletedUser()
 
     def __init__(self, course_name: str) -> None:
-        # Check for existing forum by course_name
-        forum_model = ForumRepository.find_by_course_name(course_name)
-        if forum_model is not None:
-            existing = registry_get('Forum', getattr(forum_model, 'id', None))
-            if existing is not None:
-                self.__dict__ = existing.__dict__
-                return
-            wrapper = self.from_model(forum_model)
-            self.__dict__ = wrapper.__dict__
+        # __new__ already returned the wrapper for this course's row
+        if getattr(self, 'db_id', None) is not None:
             return
-        
-        self.course_name: str = course_name
-        self.forum_id: int = random.randint(1000, 9999)
-        self.posts: list[Post] = []
-        self.users: List[User] = []
-        self.authorized: List[User] = []
-        self.restricted: List[User] = []
-        
-        # Create in database via repository
-        forum_model = ForumRepository.create(course_name)
-        self.db_id = forum_model.id
-        self.created_at = getattr(forum_model, 'created_at', None)
-        
-        # register wrapper
-        register('Forum', getattr(self, 'db_id', None), self)
-        
-        # Set DELETED_USER on service
-        ForumMembershipService.DELETED_USER = self.DELETED_USER
+        raise ValueError("Course name must be a non-empty string")
 
     @classmethod
     def from_model(cls, forum_model, session=None):
@@ -75,33 +52,32 @@ class Forum:
         if existing is not None:
             return existing
 
-        # Build a Forum wrapper from a ForumModel without creating a duplicate
-        close_session = False
-        if session is None:
-            session = SessionLocal()
-            close_session = True
-        try:
-            f = object.__new__(cls)
-            f.course_name = forum_model.course_name
-            f.forum_id = int(forum_model.id)
-            f.posts = []
-            # Load users from the forum_model's users relationship
-            from backend.User import User
-            f.users = [User.from_model(user_model) for user_model in forum_model.users]
-            # Load authorized/restricted user wrappers from relationships
-            f.authorized = [User.from_model(user_model) for user_model in getattr(forum_model, 'authorized_users', [])]
-            f.restricted = [User.from_model(user_model) for user_model in getattr(forum_model, 'restricted_users', [])]
-            f.db_id = int(forum_model.id)
-            f.created_at = getattr(forum_model, 'created_at', None)
-            # register wrapper
-            register('Forum', f.db_id, f)
-            return f
-        finally:
-            if close_session:
-                session.close()
+        # Build a Forum wrapper from a ForumModel without creating a duplicate.
+        # Member lists are not touched here; they load on first access.
+        f = object.__new__(cls)
+        f.course_name = forum_model.course_name
+        f.forum_id = int(forum_model.id)
+        f.db_id = int(forum_model.id)
+        f.created_at = getattr(forum_model, 'created_at', None)
+        # register wrapper; a concurrent load of the same row may have won
+        return get_or_register('Forum', f.db_id, f)
     
 
     # Loaders from DB
+    @classmethod
+    def get_or_create(cls, course_name: str) -> Tuple['Forum', bool]:
+        # Canonical wrapper for course_name, creating the forum if needed; (forum, created)
+        if not course_name or not isinstance(course_name, str):
+            raise ValueError("Course name must be a non-empty string")
+        forum_model, created = ForumRepository.get_or_create(course_name)
+        forum = cls.from_model(forum_model)
+        if created:
+            # a new forum has no members, nothing to load later
+            forum.users = MemberSet()
+            forum.authorized = MemberSet()
+            forum.restricted = MemberSet()
+        return forum, created
+
     @classmethod
     def load_by_course_name(cls, course_name: str):
         return ForumRepository.load_by_course_name(course_name)
@@ -138,6 +114,20 @@ class Forum:
     
     def getUsers(self) -> List[User]:
         return ForumMembershipService.get_users(self)
+
+    def member_count(self) -> int:
+        return ForumMembershipService.member_count(self)
+
+    def stats(self) -> dict:
+        # member/post/comment/reaction counts and last_post_at from forum_stats
+        return ForumStatsRepository.get(self.db_id)
+
+    def is_member(self, user_id: int) -> bool:
+        return ForumMembershipService.is_member(self, user_id)
+
+    def posting_status(self, user_id: int) -> Tuple[bool, bool]:
+        # (is member, is restricted) in one query
+        return ForumMembershipService.posting_status(self, user_id)
     
     # Post relation methods
     def addPost(self, post: Post) -> None:
@@ -145,11 +135,13 @@ class Forum:
     
     def getPosts(self) -> List[Post]:
         return ForumPostService.get_posts(self)
+
+    def getPostsPage(self, limit: int, cursor: Optional[str] = None) -> Tuple[List[Post], Optional[str]]:
+        return ForumPostService.get_posts_page(self, limit, cursor)
     
     # Used for reg tests
     def getCourseName(self) -> str:
         return self.course_name
     
     def removePost(self, post: Post) -> None:
-        if post in self.posts:
-            self.posts.remove(post)
\ No newline at end of file
+        discard(self, self.posts, post)
\ No newline at end of file
@@ -1,22 +1,29 @@
 from __future__ import annotations
-from typing import List, Optional, TYPE_CHECKING
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
 import random
 
 # DB imports
-from .db import SessionLocal, init_db
+from .db import SessionLocal, begin_write
 from .models import PostModel, ReactionModel
-from .object_registry import register, get as registry_get
+from .object_registry import register, unregister, get as registry_get, get_or_register, mutation_lock, add_unique
+from .wrapper_fields import lazy_list
 
 # Service imports
 from .messages_services import PostRepository, ReactionRepository
 
-# Ensure DB tables exist
-init_db()
 
 if TYPE_CHECKING:
     from backend.User import User  # Only imported for type checking
 
 class Post:
+    __slots__ = ('id', 'message', 'title', 'poster', 'parent', 'is_deleted', 'db_id', 'created_at',
+                 'forum_id', 'forum_name', 'comment_count', 'descendant_count', 'last_activity_at',
+                 '_comments', '_reactions', '__weakref__')
+
+    # Relationship lists, allocated on first access
+    comments = lazy_list()
+    reactions = lazy_list()
+
     # List of words that are not allowed in posts
     EXPLICIT_CONTENT = ["explicit_word1", "explicit_word2"]  # Need to udate with actual words
     DELETED_MESSAGE = "[deleted]"
@@ -51,9 +58,10 @@ class Post:
         self.title: str = title
         self.id: int = random.randint(1000, 9999)
         self.poster: User = poster
-        # use a per-instance list
-        self.comments: List['Comment'] = comments if comments is not None else []
-        self.reactions: List['Reaction'] = reactions if reactions is not None else []
+        if comments is not None:
+            self.comments = comments
+        if reactions is not None:
+            self.reactions = reactions
         # Flag to track if post is deleted. If the poster is already deleted, delete.
         self.is_deleted: bool = getattr(self.poster, "is_deleted", False)
         
@@ -67,6 +75,9 @@ class Post:
         )
         self.db_id = post_model.id
         self.created_at = getattr(post_model, 'created_at', None)
+        self.comment_count = 0
+        self.descendant_count = 0
+        self.last_activity_at = getattr(post_model, 'last_activity_at', None)
         
         # register wrapper to preserve identity
         register('Post', getattr(self, 'db_id', None), self)
@@ -75,8 +86,7 @@ class Post:
         if not isinstance(comment, Comment):
             raise TypeError("comment must be a Comment instance")
         # append only if not already present
-        if comment not in self.comments:
-            self.comments.append(comment)
+        add_unique(self, self.comments, comment)
         comment.parent = self
 
     def remove_comment(self, comment: 'Comment') -> None:
@@ -103,43 +113,47 @@ class Post:
         # Toggle reaction on/off
         if not isinstance(reaction, Reaction):
             raise TypeError("reaction must be a Reaction instance")
-            
-        # Check if user already has a reaction of this type
-        for existing_reaction in self.reactions:
-            if existing_reaction == reaction:
-                # if yes, toggle reaction off
-                self.reactions.remove(existing_reaction)
-                try:
-                    session = SessionLocal()
-                    from .models import ReactionModel
-                    reaction_model = session.get(ReactionModel, getattr(existing_reaction, 'db_id', None))
-                    if reaction_model is not None:
-                        session.delete(reaction_model)
-                        session.commit()
-                finally:
-                    try:
-                        session.close()
-                    except Exception:
-                        pass
-                return False  # Reaction removed
-                
-        # else toggle reaction on
-        self.reactions.append(reaction)
-        reaction.parent = self
+        added, _ = self.react(reaction.user, reaction.reaction_type, reaction)
+        return added
+
+    def react(self, user: User, reaction_type: str, reaction: Optional['Reaction'] = None) -> Tuple[bool, Dict[str, int]]:
+        # Toggle user's reaction_type on this post; returns (added, counts per type),
+        # both read in the toggle's own transaction so concurrent toggles cannot mix them up.
+        # reaction is an existing wrapper to attach if it has no parent yet.
+        if user is None:
+            raise TypeError("user cannot be None")
+        if reaction_type not in Reaction.VALID_REACTION_TYPES:
+            raise ValueError(f"Invalid reaction type. Must be one of: {', '.join(Reaction.VALID_REACTION_TYPES)}")
+        reuse_id = None
+        if reaction is not None and reaction.parent is None:
+            reuse_id = getattr(reaction, 'db_id', None)
+        session = SessionLocal()
         try:
-            session = SessionLocal()
-            from .models import ReactionModel
-            reaction_model = session.get(ReactionModel, getattr(reaction, 'db_id', None))
-            if reaction_model is not None:
-                reaction_model.parent_id = getattr(self, 'db_id', None)
-                session.add(reaction_model)
+            # Take the database write lock before this post's lock (the order every
+            # write request uses) so toggles on one post apply to the list and the
+            # table in the same order without deadlocking against other writers
+            begin_write(session)
+            with mutation_lock(self):
+                added, reaction_id = ReactionRepository.toggle(
+                    session, reaction_type, getattr(user, 'db_id', None), getattr(self, 'db_id', None), reuse_id)
+                counts = ReactionRepository.count_by_type(getattr(self, 'db_id', None), session=session)
                 session.commit()
+                if added:
+                    if reaction is None or getattr(reaction, 'db_id', None) != reaction_id:
+                        reaction = Reaction._attached(reaction_id, reaction_type, user, self)
+                    reaction.parent = self
+                    add_unique(self, self.reactions, reaction)
+                else:
+                    for existing in [r for r in self.reactions if getattr(r, 'db_id', None) == reaction_id
+                                     or (r.reaction_type == reaction_type and r.user == user)]:
+                        self.reactions.remove(existing)
+                    unregister('Reaction', reaction_id)
+            return added, counts
         finally:
-            try:
-                session.close()
-            except Exception:
-                pass
-        return True  
+            session.close()
+
+    def reactioncounts(self) -> Dict[str, int]:
+        return ReactionRepository.count_by_type(getattr(self, 'db_id', None))
 
     def __repr__(self) -> str:
         return f"Post(id={self.id!r}, title={self.title!r}, message={self.message!r}, comments={len(self.comments)})"
@@ -147,67 +161,140 @@ class Post:
     @classmethod
     def from_model(cls, post_model, session=None):
         # Build a Post wrapper from a PostModel without creating a duplicate
+        return cls.from_models([post_model], session=session)[0]
+
+    @classmethod
+    def _from_row(cls, post_model, poster) -> 'Post':
+        # Bare wrapper for a single row; comments and reactions are attached by from_models
+        p = object.__new__(cls)
+        p.message = post_model.message
+        p.title = post_model.title
+        # Use DB id as wrapper id for stability
+        p.id = int(post_model.id)
+        p.poster = poster
+        p.is_deleted = bool(post_model.is_deleted)
+        p.db_id = int(post_model.id)
+        p.created_at = getattr(post_model, 'created_at', None)
+        # thread stats maintained on the row (see PostRepository.record_reply)
+        p.comment_count = post_model.comment_count or 0
+        p.descendant_count = post_model.descendant_count or 0
+        p.last_activity_at = post_model.last_activity_at or p.created_at
+        # get forum relationship id for serialization
+        try:
+            p.forum_id = getattr(post_model, 'forum_id', None)
+            p.forum_name = getattr(post_model, 'forum_name', None)
+        except Exception:
+            p.forum_id = None
+            p.forum_name = None
+        p.parent = None
+        return p
+
+    @classmethod
+    def from_models(cls, post_models, session=None) -> List['Post']:
+        # Build wrappers for several posts and their whole comment trees with one
+        # recursive CTE for the descendants plus one query each for reactions and users
+        from backend.User import User
+        from .models import UserModel
+        from .thread_services import ThreadRepository
         close_session = False
         if session is None:
             session = SessionLocal()
             close_session = True
         try:
-            # return existing wrapper if present to preserve identity
-            existing = registry_get('Post', getattr(post_model, 'id', None))
-            if existing is not None:
-                return existing
+            # existing wrappers are returned as-is to preserve identity; held here because
+            # publishing the new roots may push them out of the bounded registry
+            existing = {}
+            new_roots = []
+            for m in post_models:
+                wrapper = registry_get('Post', getattr(m, 'id', None))
+                if wrapper is not None:
+                    existing[m.id] = wrapper
+                elif m.id not in existing:
+                    new_roots.append(m)
+            child_models = []
+            reaction_models = []
+            users = {}
+            if new_roots:
+                try:
+                    child_models = ThreadRepository.load_descendants(session, [m.id for m in new_roots])
+                    ids = [m.id for m in new_roots] + [m.id for m in child_models]
+                    reaction_models = (session.query(ReactionModel)
+                                       .filter(ReactionModel.parent_id.in_(ids))
+                                       .order_by(ReactionModel.id)
+                                       .all())
+                    user_ids = {m.poster_id for m in new_roots + child_models}
+                    user_ids |= {r.user_id for r in reaction_models}
+                    user_ids = [uid for uid in user_ids if uid is not None and registry_get('User', uid) is None]
+                    if user_ids:
+                        for user_model in session.query(UserModel).filter(UserModel.id.in_(user_ids)).all():
+                            users[user_model.id] = User.from_model(user_model)
+                except Exception:
+                    # if any DB access fails here, return partially populated wrappers
+                    child_models, reaction_models = [], []
 
-            p = object.__new__(cls)
-            p.message = post_model.message
-            p.title = post_model.title
-            # Use DB id as wrapper id for stability
-            p.id = int(post_model.id)
-            
-            poster = None
-            if post_model.poster is not None:
-                from backend.User import User
-                poster = User.from_model(post_model.poster)
-            p.poster = poster
-            p.comments = []
-            p.reactions = []
-            p.is_deleted = bool(post_model.is_deleted)
-            p.db_id = int(post_model.id)
-            p.created_at = getattr(post_model, 'created_at', None)
-            # get forum relationship id for serialization
-            try:
-                p.forum_id = getattr(post_model, 'forum_id', None)
-                p.forum_name = getattr(post_model, 'forum_name', None)
-            except Exception:
-                p.forum_id = None
-                p.forum_name = None
-            p.parent = None
-            # register wrapper
-            register('Post', p.db_id, p)
+            def poster_for(model):
+                if model.poster_id is None:
+                    return None
+                poster = registry_get('User', model.poster_id) or users.get(model.poster_id)
+                if poster is None and model.poster is not None:
+                    poster = User.from_model(model.poster)
+                return poster
 
-            # load comments
-            try:
-                from .models import PostModel, ReactionModel
-                child_models = session.query(PostModel).filter(PostModel.parent_id == p.db_id).all()
-                for child_model in child_models:
-                    child = Post.from_model(child_model, session=session)
-                    child.parent = p
-                    p.comments.append(child)
-
-                # load reactions for this post
-                reaction_models = session.query(ReactionModel).filter(ReactionModel.parent_id == p.db_id).all()
-                for r_model in reaction_models:
-                    r = Reaction.from_model(r_model, session=session)
-                    r.parent = p
-                    p.reactions.append(r)
-            except Exception:
-                # if any DB access fails here, return the partially populated wrapper
-                pass
+            # wrappers are built privately and only registered once their trees are complete
+            built = {}
+            for m in new_roots:
+                built[m.id] = cls._from_row(m, poster_for(m))
+
+            # descendants arrive parents first, so every parent is attached before its children
+            for child_model in child_models:
+                parent = built.get(child_model.parent_id)
+                if parent is None:
+                    # below a wrapper that already existed, which has its own comments
+                    continue
+                child = registry_get('Post', child_model.id)
+                if child is None:
+                    child = Post._from_row(child_model, poster_for(child_model))
+                    built[child.db_id] = child
+                child.parent = parent
+                parent.comments.append(child)
+
+            for r_model in reaction_models:
+                owner = built.get(r_model.parent_id)
+                if owner is None:
+                    continue
+                r = Reaction.from_model(r_model, session=session)
+                r.parent = owner
+                owner.reactions.append(r)
 
-            return p
+            existing.update(cls._publish(built, [m.id for m in new_roots]))
+            return [existing[m.id] for m in post_models]
         finally:
             if close_session:
                 session.close()
     
+    @staticmethod
+    def _publish(built, root_ids) -> dict:
+        # Register built trees parents first. A root another thread registered in the
+        # meantime wins and our copy of that tree is dropped; a comment someone loaded
+        # on its own is swapped in for ours so each row keeps a single wrapper.
+        # Returns root id -> the wrapper that ended up registered for it.
+        roots = dict.fromkeys(root_ids)
+        pending = [built[root_id] for root_id in root_ids]
+        while pending:
+            post = pending.pop()
+            winner = get_or_register('Post', post.db_id, post)
+            if post.db_id in roots and roots[post.db_id] is None:
+                roots[post.db_id] = winner
+            if winner is not post:
+                parent = post.parent
+                if parent is not None:
+                    with mutation_lock(parent):
+                        parent.comments[parent.comments.index(post)] = winner
+                continue
+            if Post.comments.is_loaded(post):
+                pending.extend(c for c in post.comments if built.get(c.db_id) is c)
+        return roots
+
     @classmethod
     def load_by_id(cls, post_id: int):
         """Load a Post wrapper from the DB by post ID (returns None if not found)."""
@@ -215,6 +302,8 @@ class Post:
 
 
 class Comment(Post):
+    __slots__ = ()
+
     def __init__(self, poster: User, message: str, title: str, parent: Post, comments: Optional[List['Comment']] = None, reactions: Optional[List['Reaction']] = None):
         # A Comment is a specialized Post with a parent Post. Use Post to assign id and store poster/message/title.
         super().__init__(poster=poster, message=message, title=title, comments=comments, reactions=reactions)
@@ -227,19 +316,25 @@ class Comment(Post):
         self.parent: Optional[Post] = None
         # Update DB to set parent_id for this comment row
         parent.add_comment(self)
+        stats = []
         try:
             session = SessionLocal()
             from .models import PostModel
             comment_model = session.get(PostModel, getattr(self, 'db_id', None))
             if comment_model is not None:
-                comment_model.parent_id = getattr(parent, 'db_id', None)
+                # sets parent_id along with the thread path and depth
+                PostRepository.set_parent(session, comment_model, getattr(parent, 'db_id', None))
                 session.add(comment_model)
+                session.flush()
+                # counted on every ancestor in the same transaction
+                stats = PostRepository.record_reply(session, comment_model)
                 session.commit()
         finally:
             try:
                 session.close()
             except Exception:
                 pass
+        PostRepository.apply_thread_stats(stats)
         
     def remove_comment(self, comment: 'Comment') -> None:
         # Override to mark deleted comments while preserving existance
@@ -253,57 +348,50 @@ class Comment(Post):
         return f"Comment(id={self.id!r}, title={self.title!r}, parent_id={parent_id!r})"
 
 class Reaction():
+    __slots__ = ('reaction_type', 'user', 'parent', 'db_id', '__weakref__')
+
     # Define allowed reaction types
     VALID_REACTION_TYPES = ["like", "dislike", "heart", "flag"] # These are temp types
 
-    def __new__(cls, *args, **kwargs):
-        # Support flexible args/kwargs
-        reaction_type = kwargs.get('reaction_type') if 'reaction_type' in kwargs else (args[0] if len(args) > 0 else None)
-        user = kwargs.get('user') if 'user' in kwargs else (args[1] if len(args) > 1 else None)
-        parent = kwargs.get('parent') if 'parent' in kwargs else (args[2] if len(args) > 2 else None)
+    def __new__(cls, reaction_type: str = None, user: User = None, parent: Optional[Post] = None):
+        # Without a type or user __init__ reports it
         if reaction_type is None or user is None:
             return object.__new__(cls)
-
-        # Prevent duplicate: return existing wrapper if a matching reaction exists
-        user_id = getattr(user, 'db_id', None)
-        parent_id = getattr(parent, 'db_id', None) if parent is not None else None
-        reaction_model = ReactionRepository.find_by_type_user_parent(reaction_type, user_id, parent_id)
-        if reaction_model is not None:
-            existing = registry_get('Reaction', getattr(reaction_model, 'id', None))
-            if existing is not None:
-                return existing
-            wrapper = cls.from_model(reaction_model)
-            return wrapper
-        # not found create a new one
-        return object.__new__(cls)
+        # Insert the row or find the matching one; the wrapper is built from that row
+        return cls.get_or_create(reaction_type, user, parent)[0]
 
     def __init__(self, reaction_type: str, user: User, parent: Optional[Post] = None):
+        # __new__ already returned the wrapper for this reaction's row
+        if getattr(self, 'db_id', None) is not None:
+            return
         if user is None:
             raise TypeError("user cannot be None")
-        if reaction_type not in self.VALID_REACTION_TYPES:
-            raise ValueError(f"Invalid reaction type. Must be one of: {', '.join(self.VALID_REACTION_TYPES)}")
+        raise ValueError(f"Invalid reaction type. Must be one of: {', '.join(self.VALID_REACTION_TYPES)}")
 
-        # If wrapper already has db_id, skip
-        if getattr(self, 'db_id', None) is not None:
-            return
+    @classmethod
+    def get_or_create(cls, reaction_type: str, user: User, parent: Optional[Post] = None) -> Tuple['Reaction', bool]:
+        # Canonical wrapper for (type, user, parent), creating the row if needed; (reaction, created)
+        if user is None:
+            raise TypeError("user cannot be None")
+        if reaction_type not in cls.VALID_REACTION_TYPES:
+            raise ValueError(f"Invalid reaction type. Must be one of: {', '.join(cls.VALID_REACTION_TYPES)}")
+        user_id = getattr(user, 'db_id', None)
+        parent_id = getattr(parent, 'db_id', None)
+        reaction_model = None
+        if parent_id is None:
+            # the unique index never matches a NULL parent, so look the loose reaction up first
+            reaction_model = ReactionRepository.find_by_type_user_parent(reaction_type, user_id, None)
+        created = False
+        if reaction_model is None:
+            reaction_model, created = ReactionRepository.get_or_create(
+                reaction_type=reaction_type, user_id=user_id, parent_id=parent_id)
+        if created:
+            return cls._attached(reaction_model.id, reaction_type, user, parent), True
+        reaction = cls.from_model(reaction_model)
+        if parent is not None:
+            reaction.parent = parent
+        return reaction, False
 
-        self.reaction_type: str = reaction_type
-        self.user: User = user
-        self.parent: Optional[Post] = parent
-        
-        # Create in database via repository
-        user_id = getattr(self.user, 'db_id', None)
-        parent_id = getattr(self.parent, 'db_id', None)
-        reaction_model = ReactionRepository.create(
-            reaction_type=self.reaction_type,
-            user_id=user_id,
-            parent_id=parent_id
-        )
-        self.db_id = reaction_model.id
-        
-        # register wrapper to preserve identity
-        register('Reaction', getattr(self, 'db_id', None), self)
-    
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Reaction):
             return NotImplemented
@@ -314,6 +402,16 @@ class Reaction():
         user_id = getattr(self.user, 'db_id', None)
         return f"Reaction(type={self.reaction_type!r}, user_id={user_id!r})"
 
+    @classmethod
+    def _attached(cls, db_id: int, reaction_type: str, user: User, parent: Post) -> 'Reaction':
+        # Wrapper for a row the caller just wrote, without reading it back
+        r = object.__new__(cls)
+        r.reaction_type = reaction_type
+        r.user = user
+        r.parent = parent
+        r.db_id = int(db_id)
+        return get_or_register('Reaction', r.db_id, r)
+
     @classmethod
     def from_model(cls, reaction_model, session=None):
         close_session = False
@@ -329,16 +427,15 @@ class Reaction():
             r = object.__new__(cls)
             r.reaction_type = reaction_model.reaction_type
             # Build user wrapper if available
-            user = None
-            if reaction_model.user is not None:
-                from backend.User import User
+            from backend.User import User
+            user = registry_get('User', reaction_model.user_id)
+            if user is None and reaction_model.user is not None:
                 user = User.from_model(reaction_model.user)
             r.user = user
             r.parent = None
             r.db_id = int(reaction_model.id)
-            # register wrapper
-            register('Reaction', r.db_id, r)
-            return r
+            # register wrapper; a concurrent load of the same row may have won
+            return get_or_register('Reaction', r.db_id, r)
         finally:
             if close_session:
                 session.close()
\ No newline at end of file
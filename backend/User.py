@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import List, Optional, TYPE_CHECKING
+from typing import List, Optional, Tuple, TYPE_CHECKING
 from backend.Messages import Post, Comment, Reaction
 import random
 
@@ -7,47 +7,55 @@ if TYPE_CHECKING:
     from backend.Forum import Forum
 
 # DB imports
-from .db import SessionLocal, init_db
+from .db import SessionLocal
 from .models import UserModel
-from .object_registry import register, get as registry_get
+from .object_registry import get as registry_get, get_or_register, add_unique
+from .wrapper_fields import lazy_list
 
 # Service imports
 from .user_services import UserRepository
 
-# Ensure DB tables exist
-init_db()
 
 
 class User:
-    def __new__(cls, *args, **kwargs):
-        # Allow kwargs for username and email due to expanded params
-        email = kwargs.get('email')
-        if email is None and len(args) > 1:
-            email = args[1]
+    __slots__ = ('user_id', 'username', 'email', 'major', 'year', 'first_name', 'last_name',
+                 'is_deleted', 'is_admin', 'db_id', '_posts', '_forum', '_reactions', '__weakref__')
+
+    # Relationship lists, allocated on first access
+    posts = lazy_list()
+    forum = lazy_list()
+    reactions = lazy_list()
+
+    def __new__(cls, username: str = None, email: str = None, major: str = None, year: int = None,
+                posts: Optional[List[Post]] = None, forum: Optional[List[Forum]] = None,
+                reactions: Optional[List[Forum]] = None, is_admin: bool = False, **kwargs):
+        # Without an email __init__ reports the bad traits
         if email is None:
             return object.__new__(cls)
 
-        # If a DB row exists for this email, return it
-        user_model = UserRepository.find_by_email(email)
-        if user_model is not None:
-            existing = registry_get('User', getattr(user_model, 'id', None))
-            if existing is not None:
-                return existing
-            # build wrapper and return it
-            wrapper = cls.from_model(user_model)
-            return wrapper
-        # not found, create new user
-        return object.__new__(cls)
+        # Insert the row or find it by email in one go; the wrapper is built from that row
+        user, created = cls.get_or_create(username, email, major, year, is_admin=is_admin,
+                                          first_name=kwargs.get('first_name', ''),
+                                          last_name=kwargs.get('last_name', ''))
+        if created:
+            if posts is not None:
+                user.posts = posts
+            if forum is not None:
+                user.forum = forum
+            if reactions is not None:
+                user.reactions = reactions
+        return user
 
     def __init__(self, username: str, email: str, major: str, year: int, posts: Optional[List[Post]], forum: Optional[List[Forum]], reactions: Optional[List[Forum]], is_admin: bool = False, **kwargs) -> None:
-        # If this wrapper already has a db_id, skip
+        # __new__ already returned the wrapper for this email's row
         if getattr(self, 'db_id', None) is not None:
             return
+        self._validate(username, email, major, year)
 
-        # Validate traits
+    @staticmethod
+    def _validate(username: str, email: str, major: str, year: int) -> None:
         if not username or not isinstance(username, str):
             raise ValueError("Username must be a non-empty string")
-        self.is_deleted: bool = False  # Flag to track if user is deleted
         if not isinstance(email, str):
             raise ValueError("Email must be a string")
         if not email or "@" not in email or not email.endswith("@scu.edu") or email == "@scu.edu":
@@ -59,45 +67,18 @@ class User:
         if year < 1:
             raise ValueError("Year must be positive")
 
-        # Check if user with this email exists in DB
-        user_model = UserRepository.find_by_email(email)
-        if user_model is not None:
-            existing = registry_get('User', getattr(user_model, 'id', None))
-            if existing is not None:
-                self.__dict__ = existing.__dict__
-                return
-            wrapper = self.from_model(user_model)
-            self.__dict__ = wrapper.__dict__
-            return
+    @classmethod
+    def get_or_create(cls, username: str, email: str, major: str, year: int, is_admin: bool = False,
+                      first_name: str = '', last_name: str = '') -> Tuple['User', bool]:
+        # Canonical wrapper for email, creating the user if needed; (user, created).
+        # Safe against concurrent creates: the unique email index decides the winner.
+        cls._validate(username, email, major, year)
+        user_model, created = UserRepository.get_or_create(
+            username=username, email=email, major=major, year=year, is_deleted=False, is_admin=bool(is_admin),
+            first_name=first_name if isinstance(first_name, str) else '',
+            last_name=last_name if isinstance(last_name, str) else '')
+        return cls.from_model(user_model), created
 
-        self.user_id: int = random.randint(10000, 99999)
-        self.username: str = username
-        self.email: str = email
-        self.major: str = major
-        self.year: int = year
-        self.first_name: str = kwargs.get('first_name', '') if isinstance(kwargs.get('first_name', ''), str) else ''
-        self.last_name: str = kwargs.get('last_name', '') if isinstance(kwargs.get('last_name', ''), str) else ''
-        self.posts: List[Post] = posts if posts is not None else []
-        self.forum: List[Forum] = forum if forum is not None else []
-        self.reactions: List[Reaction] = reactions if reactions is not None else []
-        self.is_admin: bool = bool(is_admin)
-        
-        # Create in database via repository
-        user_model = UserRepository.create(
-            username=self.username,
-            email=self.email,
-            major=self.major,
-            year=self.year,
-            is_deleted=self.is_deleted,
-            is_admin=self.is_admin,
-            first_name=self.first_name,
-            last_name=self.last_name
-        )
-        self.db_id = user_model.id
-        
-        # register wrapper to preserve identity when loading from DB
-        register('User', getattr(self, 'db_id', None), self)
-    
     # Getters using services
     def getposts(self) -> List[Post]:
         return UserRepository.get_posts(self)
@@ -142,14 +123,10 @@ class User:
         u.year = int(user_model.year)
         u.first_name = getattr(user_model, 'first_name', '') or ''
         u.last_name = getattr(user_model, 'last_name', '') or ''
-        u.posts = []
-        u.forum = []
-        u.reactions = []
         u.is_admin = bool(getattr(user_model, 'is_admin', False))
         u.db_id = int(user_model.id)
-        # register wrapper
-        register('User', u.db_id, u)
-        return u
+        # register wrapper; a concurrent load of the same row may have won
+        return get_or_register('User', u.db_id, u)
     
     # Manage Forum and post relations
     def addForum(self, forum: Forum) -> None:
@@ -173,14 +150,18 @@ class User:
             raise TypeError("forum must be a Forum instance")
         if not isinstance(post, Post):
             raise TypeError("post must be a Post instance")
-        if forum not in self.forum:
-            raise ValueError("User is not part of the specified forum")
-        if post not in self.posts:
-            self.posts.append(post)
-            forum.addPost(post)
+        # Forum.addPost checks membership with one indexed query, so the user's
+        # forum list (all of their enrollments) is not needed here
+        forum.addPost(post)
+        add_unique(self, self.posts, post)
 
 
 class Admin(User):
+    __slots__ = ()
+
+    def __new__(cls, username: str = None, email: str = None, major: str = None, year: int = None):
+        return super().__new__(cls, username, email, major, year, None, None, None, is_admin=True)
+
     def __init__(self, username: str, email: str, major: str, year: int) -> None:
         super().__init__(username, email, major, year, None, None, None, is_admin=True)
 
@@ -192,7 +173,7 @@ class Admin(User):
             raise TypeError("user must be a User instance")
         if user.is_deleted:
             raise ValueError("Cannot restrict a deleted user")
-        if user not in forum.getUsers():
+        if user not in forum.users:
             raise ValueError("User is not a member of this forum")
         forum.restrictUser(user)
     
@@ -214,7 +195,7 @@ class Admin(User):
             raise TypeError("user must be a User instance")
         if user.is_deleted:
             raise ValueError("Cannot authorize a deleted user")
-        if user not in forum.getUsers():
+        if user not in forum.users:
             raise ValueError("User is not a member of this forum")
         forum.authorizeUser(user)
     
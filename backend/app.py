@@ -1,11 +1,19 @@
 from flask import Flask, request, jsonify
+from sqlalchemy.exc import OperationalError
 from backend.User import User
 from backend.Forum import Forum
 from backend.Messages import Post
-from backend.db import SessionLocal
+from backend.forum_services import ForumMembershipService, ForumStatsRepository
+from backend.permission_services import PermissionService
+from backend.messages_services import PostRepository, ReactionRepository
+from backend.reaction_buffer import ReactionBuffer
+from backend.db import SessionLocal, ensure_db, begin_unit_of_work, end_unit_of_work, in_unit_of_work, ENGINE_PROFILE, LOCK_METRICS
 from backend.models import UserModel
-from google.oauth2 import id_token
-from google.auth.transport import requests
+from backend.serializers import ForumSerializer, CommentTreeSerializer, ThreadPageSerializer, FieldSelection, ALL_FIELDS
+from backend.pagination import decode_cursor, parse_limit
+from backend.thread_services import ThreadRepository
+from backend.object_registry import stats as registry_stats
+from backend.coherence import sync_registry, stats as coherence_stats
 from backend.key import GOOGLE_ID
 
 app = Flask(__name__)
@@ -27,9 +35,47 @@ def add_cors_headers(response):
     return response
 
 
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
 
-def _serialize_user(user: User):
-    return {
+
+# One session and one transaction per request: repository commits only flush,
+# and the request's work is committed once here (rolled back on 4xx/5xx)
+@app.before_request
+def open_unit_of_work():
+    # Schema check/migrations run once, before the first request is served
+    ensure_db()
+    # Drop wrappers other worker processes changed since the last request
+    sync_registry()
+    # Write requests take the database write lock up front
+    try:
+        begin_unit_of_work(write=request.method in WRITE_METHODS)
+    except OperationalError:
+        return jsonify({'error': 'Database is busy, please retry'}), 503
+
+
+@app.after_request
+def commit_unit_of_work(response):
+    if not in_unit_of_work():
+        return response
+    try:
+        end_unit_of_work(commit=response.status_code < 400)
+    except Exception as e:
+        response = jsonify({'error': f'Could not save changes: {e}'})
+        response.status_code = 500
+    return response
+
+
+@app.teardown_request
+def close_unit_of_work(exc):
+    # Unhandled errors skip after_request; make sure the transaction is not left open
+    if in_unit_of_work():
+        end_unit_of_work(commit=False)
+
+
+
+def _serialize_user(user: User, sel: FieldSelection = ALL_FIELDS):
+    # Relationships left out of sel are skipped before their queries run
+    data = sel.pick({
         'id': user.db_id,
         'username': user.username,
         'email': user.email,
@@ -39,45 +85,53 @@ def _serialize_user(user: User):
         'last_name': getattr(user, 'last_name', ''),
         'is_deleted': user.is_deleted,
         'is_admin': getattr(user, 'is_admin', False),
-        'forums': [
-            _serialize_forum(forum)
+    })
+    if sel.expands('forums'):
+        data['forums'] = [
+            _serialize_forum(forum, sel.child())
             for forum in user.getforums()
-        ],
-        'posts': [
-            _serialize_post(post)
+        ]
+    if sel.expands('posts'):
+        data['posts'] = [
+            _serialize_post(post, sel.child())
             for post in user.getposts()
         ]
-    }
+    return data
 
 
 
-def _serialize_forum(forum: Forum):
-    return {
+def _serialize_forum(forum: Forum, sel: FieldSelection = ALL_FIELDS):
+    data = sel.pick({
         'id': forum.db_id,
         'course_name': forum.course_name,
         'created_at': (getattr(forum, 'created_at', None).isoformat() + 'Z') if getattr(forum, 'created_at', None) else None,
-        'posts': [
-            _serialize_post(post)
+    })
+    if sel.expands('posts'):
+        data['posts'] = [
+            _serialize_post(post, sel.child())
             for post in forum.getPosts()
-        ],
-        'users': [
+        ]
+    if sel.expands('users'):
+        data['users'] = [
             {
                 'id': user.db_id,
                 'username': user.username,
                 'email': user.email,
                 'is_admin': getattr(user, 'is_admin', False)
             }
-            for user in forum.getUsers()
-        ],
-        'authorized_users': [
+            for user in forum.users
+        ]
+    if sel.expands('authorized_users'):
+        data['authorized_users'] = [
             {
                 'id': user.db_id,
                 'username': user.username,
                 'email': user.email
             }
             for user in getattr(forum, 'authorized', [])
-        ],
-        'restricted_users': [
+        ]
+    if sel.expands('restricted_users'):
+        data['restricted_users'] = [
             {
                 'id': user.db_id,
                 'username': user.username,
@@ -85,12 +139,12 @@ def _serialize_forum(forum: Forum):
             }
             for user in getattr(forum, 'restricted', [])
         ]
-    }
+    return data
 
 
 
-def _serialize_post(post: Post):
-    return {
+def _serialize_post(post: Post, sel: FieldSelection = ALL_FIELDS):
+    data = sel.pick({
         'id': post.db_id,
         'forum_id': getattr(post, 'forum_id', None),
         'forum_name': getattr(post, 'forum_name', None),
@@ -99,16 +153,45 @@ def _serialize_post(post: Post):
         'poster': post.poster.username if post.poster else None,
         'is_deleted': post.is_deleted,
         'created_at': (getattr(post, 'created_at', None).isoformat() + 'Z') if getattr(post, 'created_at', None) else None,
-        'reactions': [
+        'comment_count': getattr(post, 'comment_count', 0),
+        'descendant_count': getattr(post, 'descendant_count', 0),
+        'last_activity_at': (getattr(post, 'last_activity_at', None).isoformat() + 'Z') if getattr(post, 'last_activity_at', None) else None,
+    })
+    if sel.expands('reactions') and sel.reaction_counts:
+        # counts-only mode: read the counter table instead of every reaction row
+        data['reaction_counts'] = post.reactioncounts()
+        if sel.viewer_id is not None:
+            data['viewer_reactions'] = ReactionRepository.types_by_user([post.db_id], sel.viewer_id).get(post.db_id, [])
+    elif sel.expands('reactions'):
+        data['reactions'] = [
             {
                 'id': reaction.db_id,
                 'reaction_type': reaction.reaction_type,
                 'user': reaction.user.username if reaction.user else None
             }
             for reaction in post.getreactions()
-        ],
-        'comments': [_serialize_post(comment) for comment in post.getcomments()]
-    }
+        ]
+    if sel.expands('comments'):
+        data['comments'] = [_serialize_post(comment, sel.child()) for comment in post.getcomments()]
+    return data
+
+
+
+def _field_selection():
+    # ?fields=a,b&depth=N from the query string; raises ValueError on bad input
+    return FieldSelection.from_args(request.args)
+
+
+
+def _comment_tree_args():
+    # (max_depth, max_children) if a truncated comment tree was requested, else None
+    if request.args.get('max_depth') is None and request.args.get('max_children') is None:
+        return None
+    max_depth = parse_limit(request.args.get('max_depth'), CommentTreeSerializer.DEFAULT_DEPTH,
+                            CommentTreeSerializer.MAX_DEPTH, 'max_depth')
+    max_children = parse_limit(request.args.get('max_children'), CommentTreeSerializer.DEFAULT_CHILDREN,
+                               name='max_children')
+    return max_depth, max_children
 
 
 
@@ -120,6 +203,13 @@ def googlelogin():
     token = data.get('credential')
     print(token)
     try:
+        sel = _field_selection()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        # google-auth is only needed here; importing it up front slows every cold start
+        from google.oauth2 import id_token
+        from google.auth.transport import requests
         id_info = id_token.verify_oauth2_token(
             token,
             requests.Request(),
@@ -135,7 +225,7 @@ def googlelogin():
         
         user = User.load_by_email(email)
         if user is not None:
-            return jsonify(_serialize_user(user)), 200
+            return jsonify(_serialize_user(user, sel)), 200
         else:
             return jsonify({'error': 'User not found', 'email': email}), 404
     except ValueError:
@@ -160,11 +250,6 @@ def create_user():
     if not email or not isinstance(email, str) or not email.endswith('@scu.edu'):
         return jsonify({'error': 'A valid scu.edu email is required'}), 400
 
-    # Check for existing user
-    existing_user = User.load_by_email(email)
-    if existing_user is not None:
-        return jsonify({'error': 'User already exists'}), 400
-
     # Validate and create new user
     missing = []
     if not username:
@@ -186,7 +271,10 @@ def create_user():
             kwargs['first_name'] = first_name
         if isinstance(last_name, str):
             kwargs['last_name'] = last_name
-        new_user = User(username, email, major, year, None, None, None, **kwargs)
+        # one lookup/insert; the unique email index settles concurrent sign-ups
+        new_user, created = User.get_or_create(username, email, major, year, **kwargs)
+        if not created:
+            return jsonify({'error': 'User already exists'}), 400
         return jsonify(_serialize_user(new_user)), 201
     except (ValueError, TypeError) as e:
         return jsonify({'error': str(e)}), 400
@@ -206,15 +294,12 @@ def create_forum():
     if not course_name or not isinstance(course_name, str):
         return jsonify({'error': 'A valid course name is required'}), 400
 
-    # Check for existing forum
-    existing_forum = Forum.load_by_course_name(course_name)
-    if existing_forum is not None:
-        return jsonify({'error': 'Forum already exists'}), 400
-
     # Attempt to create a new forum
     try:
-        new_forum = Forum(course_name)
-        
+        new_forum, created = Forum.get_or_create(course_name)
+        if not created:
+            return jsonify({'error': 'Forum already exists'}), 400
+
         # If creator_email is provided, add them as a member
         if creator_email:
             creator = User.load_by_email(creator_email)
@@ -233,8 +318,26 @@ def list_forums():
     if request.method == 'OPTIONS':
         return ('', 204)
 
+    if request.args.get('view') == 'summary':
+        # Directory view: names and counts from one aggregate query, paginated
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            cursor = request.args.get('cursor')
+            after_id = decode_cursor(cursor, 1, (int,))[0] if cursor else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        summaries, next_cursor = ForumSerializer.serialize_summary_page(limit, after_id)
+        return jsonify({'forums': summaries, 'next_cursor': next_cursor}), 200
+
+    try:
+        sel = _field_selection()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     forums = Forum.load_all_forums()
-    serialized_forums = [_serialize_forum(forum) for forum in forums]
+    # member lists for every forum in one query, and only the ones being serialized
+    member_keys = {'users': 'users', 'authorized': 'authorized_users', 'restricted': 'restricted_users'}
+    ForumMembershipService.load_members(forums, [kind for kind, key in member_keys.items() if sel.expands(key)])
+    serialized_forums = [_serialize_forum(forum, sel) for forum in forums]
     return jsonify({'forums': serialized_forums}), 200
 
 
@@ -269,11 +372,16 @@ def get_user_profile_by_name(username):
     if request.method == 'OPTIONS':
         return ('', 204)
 
+    try:
+        sel = _field_selection()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     user = User.load_by_username(username)
     if user is None:
         return jsonify({'error': 'User not found'}), 404
 
-    return jsonify(_serialize_user(user)), 200
+    return jsonify(_serialize_user(user, sel)), 200
 
 
 
@@ -340,18 +448,24 @@ def get_forum_profile(forum_id):
     if request.method == 'OPTIONS':
         return ('', 204)
 
-    forum = Forum.load_by_id(forum_id)
-    if forum is None:
+    try:
+        sel = _field_selection()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Bulk loader avoids building wrappers for every post/comment/reaction
+    serialized_forum = ForumSerializer.serialize_forum(forum_id, sel)
+    if serialized_forum is None:
         return jsonify({'error': 'Forum not found'}), 404
 
-    return jsonify(_serialize_forum(forum)), 200
+    return jsonify(serialized_forum), 200
 
 
 
 def _require_admin(admin_email: str):
     if not admin_email:
         return None, jsonify({'error': 'admin_email is required'}), 400
-    admin_user = User.load_by_email(admin_email)
+    admin_user = PermissionService.resolve_actor(admin_email)
     if admin_user is None:
         return None, jsonify({'error': 'Admin user not found'}), 404
     if not getattr(admin_user, 'is_admin', False):
@@ -363,15 +477,11 @@ def _require_admin(admin_email: str):
 def _require_admin_or_authorized(actor_email: str, forum: Forum):
     if not actor_email:
         return None, jsonify({'error': 'actor_email is required'}), 400
-    actor = User.load_by_email(actor_email)
+    actor = PermissionService.resolve_actor(actor_email)
     if actor is None:
         return None, jsonify({'error': 'Actor user not found'}), 404
-    if getattr(actor, 'is_admin', False):
-        return actor, None, None
-    # Check authorized status in forum (ensure freshest data)
-    forum_users = forum.getUsers()
-    authorized_ids = [u.db_id for u in getattr(forum, 'authorized', [])]
-    if actor.db_id in authorized_ids:
+    # Admin, or authorized in this forum (cached per user and forum)
+    if PermissionService.can_moderate(actor, forum):
         return actor, None, None
     return None, jsonify({'error': 'User lacks permission (admin or authorized required)'}), 403
 
@@ -521,10 +631,10 @@ def delete_forum(forum_id):
     # Perform cascading deletion using direct DB operations
     try:
         from .db import SessionLocal
-        from .models import ForumModel, PostModel, ReactionModel, forum_users, forum_authorized, forum_restricted
+        from .models import ForumModel, ForumStatsModel, PostModel, ReactionModel, forum_users, forum_authorized, forum_restricted
     except Exception:
         from backend.db import SessionLocal
-        from backend.models import ForumModel, PostModel, ReactionModel, forum_users, forum_authorized, forum_restricted
+        from backend.models import ForumModel, ForumStatsModel, PostModel, ReactionModel, forum_users, forum_authorized, forum_restricted
 
     session = SessionLocal()
     try:
@@ -532,37 +642,25 @@ def delete_forum(forum_id):
         if forum_model is None:
             return jsonify({'error': 'Forum not found'}), 404
 
-        # Collect all post ids belonging to the forum (top-level posts)
-        top_posts = session.query(PostModel).filter(PostModel.forum_id == forum_model.id).all()
-        to_delete_ids = set(p.id for p in top_posts)
-
-        # Iteratively collect all descendant comment ids
-        # We traverse by repeatedly finding posts whose parent_id is in to_delete_ids
-        changed = True
-        while changed:
-            changed = False
-            child_posts = session.query(PostModel).filter(PostModel.parent_id.in_(to_delete_ids)).all() if to_delete_ids else []
-            new_ids = [cp.id for cp in child_posts if cp.id not in to_delete_ids]
-            if new_ids:
-                to_delete_ids.update(new_ids)
-                changed = True
+        # Every post and comment in the forum, walked by one recursive CTE
+        thread_ids = ThreadRepository.forum_ids(forum_model.id)
 
         # Delete reactions tied to any of these posts/comments
-        if to_delete_ids:
-            session.query(ReactionModel).filter(ReactionModel.parent_id.in_(to_delete_ids)).delete(synchronize_session=False)
+        session.query(ReactionModel).filter(ReactionModel.parent_id.in_(thread_ids)).delete(synchronize_session=False)
 
         # Delete posts/comments themselves
-        if to_delete_ids:
-            session.query(PostModel).filter(PostModel.id.in_(to_delete_ids)).delete(synchronize_session=False)
+        session.query(PostModel).filter(PostModel.id.in_(thread_ids)).delete(synchronize_session=False)
 
         # Detach all user associations (members, authorized, restricted)
         session.execute(forum_users.delete().where(forum_users.c.forum_id == forum_model.id))
         session.execute(forum_authorized.delete().where(forum_authorized.c.forum_id == forum_model.id))
         session.execute(forum_restricted.delete().where(forum_restricted.c.forum_id == forum_model.id))
 
-        # Finally delete the forum itself
+        # Finally delete the forum itself and its stats row
+        session.query(ForumStatsModel).filter(ForumStatsModel.forum_id == forum_model.id).delete(synchronize_session=False)
         session.delete(forum_model)
         session.commit()
+        PermissionService.invalidate(forum_id=forum_id)
 
         return jsonify({'message': 'Forum deleted successfully'}), 200
     except Exception as e:
@@ -607,21 +705,19 @@ def delete_post(post_id):
         if err_resp:
             return err_resp, status
     
-    # Soft delete: set is_deleted flag
+    # Soft delete: set is_deleted flag (a reply also leaves its thread's counts)
     post.is_deleted = True
     try:
         from .db import SessionLocal
-        from .models import PostModel
     except Exception:
         from backend.db import SessionLocal
-        from backend.models import PostModel
     session = SessionLocal()
-    post_model = session.get(PostModel, getattr(post, 'db_id', None))
-    if post_model is not None:
-        post_model.is_deleted = True
-        session.add(post_model)
+    try:
+        stats = PostRepository.soft_delete(session, getattr(post, 'db_id', None))
         session.commit()
-    session.close()
+    finally:
+        session.close()
+    PostRepository.apply_thread_stats(stats)
     return jsonify({'message': 'Post deleted', 'post': _serialize_post(post)}), 200
 
 
@@ -672,20 +768,17 @@ def delete_comment(comment_id):
     
     try:
         from .db import SessionLocal
-        from .models import PostModel
     except Exception:
         from backend.db import SessionLocal
-        from backend.models import PostModel
     
+    # One transaction flags the row and decrements every ancestor's reply counts
     session = SessionLocal()
-    comment_model = session.get(PostModel, getattr(comment, 'db_id', None))
-    if comment_model is not None:
-        comment_model.is_deleted = True
-        comment_model.message = '[deleted]'
-        comment_model.title = '[deleted]'
-        session.add(comment_model)
+    try:
+        stats = PostRepository.soft_delete(session, getattr(comment, 'db_id', None), blank='[deleted]')
         session.commit()
-    session.close()
+    finally:
+        session.close()
+    PostRepository.apply_thread_stats(stats)
     
     return jsonify({'message': 'Comment deleted successfully'}), 200
 
@@ -708,14 +801,10 @@ def forum_user_status(forum_id):
     user = User.load_by_email(user_email)
     if user is None:
         return jsonify({'error': 'User not found'}), 404
-    # Ensure latest membership lists
-    members = forum.getUsers()
-    member_ids = [m.db_id for m in members]
-    is_member = user.db_id in member_ids
-    authorized_ids = [u.db_id for u in getattr(forum, 'authorized', [])]
-    restricted_ids = [u.db_id for u in getattr(forum, 'restricted', [])]
-    is_authorized = is_member and user.db_id in authorized_ids
-    is_restricted = is_member and user.db_id in restricted_ids
+    # Id lookups in the forum's member sets
+    is_member = forum.is_member(user.db_id)
+    is_authorized = is_member and user.db_id in forum.authorized
+    is_restricted = is_member and user.db_id in forum.restricted
     return jsonify({
         'forum_id': forum.db_id,
         'user_id': user.db_id,
@@ -727,33 +816,87 @@ def forum_user_status(forum_id):
 
 
 
+@app.route('/api/forums/<int:forum_id>/stats', methods=['GET', 'OPTIONS'])
+def forum_stats(forum_id):
+    if request.method == 'OPTIONS':
+        return ('', 204)
+    # One primary key read of forums joined to forum_stats; no posts are counted
+    stats = ForumStatsRepository.get(forum_id)
+    if stats is None:
+        return jsonify({'error': 'Forum not found'}), 404
+    last_post_at = stats['last_post_at']
+    stats['last_post_at'] = (last_post_at.isoformat() + 'Z') if last_post_at else None
+    return jsonify(stats), 200
+
+
+
 @app.route('/api/posts/<int:post_id>', methods=['GET', 'OPTIONS'])
 def get_post_profile(post_id, user_id=None, forum_id=None):
     if request.method == 'OPTIONS':
         return ('', 204)
 
-    post = Post.load_by_id(post_id)
-    if post is None:
+    try:
+        sel = _field_selection()
+        tree_args = _comment_tree_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if tree_args is not None:
+        # Truncated tree: first max_depth levels, max_children replies per node
+        serialized_post = CommentTreeSerializer.serialize_tree(post_id, *tree_args, sel=sel)
+        if serialized_post is None:
+            return jsonify({'error': 'Post not found'}), 404
+        return jsonify(serialized_post), 200
+
+    # Bulk serializer: relationships left out of sel are never queried
+    serialized_post = ForumSerializer.serialize_post(post_id, sel)
+    if serialized_post is None:
         return jsonify({'error': 'Post not found'}), 404
-    if user_id is not None and (getattr(post, 'user_id', None) != user_id):
+    if user_id is not None and (serialized_post.get('user_id') != user_id):
         return jsonify({'error': 'Post does not belong to the specified user'}), 404
-    if forum_id is not None and (getattr(post, 'forum_id', None) != forum_id):
+    if forum_id is not None and (serialized_post.get('forum_id') != forum_id):
         return jsonify({'error': 'Post does not belong to the specified forum'}), 404
-    return jsonify(_serialize_post(post)), 200
+    return jsonify(serialized_post), 200
     
 @app.route('/api/forums/<int:forum_id>/posts', methods=['GET', 'POST', 'OPTIONS'])
 def forum_posts(forum_id):
     if request.method == 'OPTIONS':
         return ('', 204)
 
+    if request.method == 'GET':
+        try:
+            sel = _field_selection()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        # ?sort=created (oldest first), activity (latest reply first) or comments (most replies first)
+        sort = request.args.get('sort') or 'created'
+        if sort not in PostRepository.LISTING_SORTS:
+            return jsonify({'error': f"sort must be one of: {', '.join(PostRepository.LISTING_SORTS)}"}), 400
+        limit_arg = request.args.get('limit')
+        cursor = request.args.get('cursor')
+        if limit_arg is None and not cursor:
+            # No paging requested: whole forum, bulk loaded
+            serialized_posts = ForumSerializer.serialize_posts(forum_id, sel=sel, sort=sort)
+            if serialized_posts is None:
+                return jsonify({'error': 'Forum not found'}), 404
+            return jsonify({'posts': serialized_posts, 'next_cursor': None}), 200
+
+        # Keyset pagination ordered by (sort key, id)
+        try:
+            limit = parse_limit(limit_arg)
+            key_type = type(PostRepository.LISTING_SORTS[sort][2])
+            after = decode_cursor(cursor, 2, (key_type, int)) if cursor else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        page = ForumSerializer.serialize_posts_page(forum_id, limit, after, sel, sort)
+        if page is None:
+            return jsonify({'error': 'Forum not found'}), 404
+        serialized_posts, next_cursor = page
+        return jsonify({'posts': serialized_posts, 'next_cursor': next_cursor}), 200
+
     forum = Forum.load_by_id(forum_id)
     if forum is None:
         return jsonify({'error': 'Forum not found'}), 404
-
-    if request.method == 'GET':
-        posts = forum.getPosts()
-        serialized_posts = [_serialize_post(post) for post in posts]
-        return jsonify({'posts': serialized_posts}), 200
     
     # POST - Create new post
     data = request.get_json(silent=True) or {}
@@ -761,42 +904,38 @@ def forum_posts(forum_id):
     message = data.get('message')
     user_email = data.get('user_email')
 
-    # Debug logging
-    print(f"[DEBUG] POST request data: {data}")
-    print(f"[DEBUG] title={title}, message={message}, user_email={user_email}")
+    app.logger.debug("POST request data: %s", data)
 
     if not title or not isinstance(title, str):
-        print(f"[DEBUG] Title validation failed: title={title}, type={type(title)}")
+        app.logger.debug("Title validation failed: %r", title)
         return jsonify({'error': 'A valid title is required'}), 400
     if not message or not isinstance(message, str):
-        print(f"[DEBUG] Message validation failed: message={message}, type={type(message)}")
+        app.logger.debug("Message validation failed: %r", message)
         return jsonify({'error': 'A valid message is required'}), 400
     if not user_email or not isinstance(user_email, str):
-        print(f"[DEBUG] Email validation failed: user_email={user_email}, type={type(user_email)}")
+        app.logger.debug("Email validation failed: %r", user_email)
         return jsonify({'error': 'User email is required'}), 400
 
     user = User.load_by_email(user_email)
     if user is None:
-        print(f"[DEBUG] User not found: {user_email}")
+        app.logger.debug("User not found: %s", user_email)
         return jsonify({'error': 'User not found'}), 404
 
-    # Check if user is member of forum (compare by db_id, not object identity)
-    user_forums = user.getforums()
-    user_forum_ids = [f.db_id for f in user_forums]
-    print(f"[DEBUG] User {user.username} forums: {user_forum_ids}, checking forum {forum.db_id}")
-    if forum.db_id not in user_forum_ids:
-        print(f"[DEBUG] Membership check failed")
+    # Membership and restriction in one indexed query, not the user's whole forum list
+    is_member, is_restricted = forum.posting_status(user.db_id)
+    if not is_member:
+        app.logger.debug("Membership check failed")
         return jsonify({'error': 'User is not a member of this forum'}), 403
+    if is_restricted:
+        return jsonify({'error': 'restricted users cannot add posts'}), 400
 
     try:
         new_post = Post(poster=user, message=message, title=title)
         user.addPost(forum, new_post)
-        print(f"[DEBUG] Post created successfully: {new_post.title}")
+        app.logger.debug("Post created successfully: %s", new_post.title)
         return jsonify({'message': 'Post created successfully', 'post': _serialize_post(new_post)}), 201
     except (ValueError, TypeError) as e:
-        print(f"[DEBUG] Exception creating post: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.debug("Exception creating post: %s", e, exc_info=True)
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/posts/<int:post_id>/comments', methods=['GET', 'POST', 'OPTIONS'])
@@ -804,15 +943,27 @@ def post_comments(post_id):
     if request.method == 'OPTIONS':
         return ('', 204)
 
+    if request.method == 'GET':
+        try:
+            tree_args = _comment_tree_args()
+            sel = _field_selection()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if tree_args is not None:
+            # Truncated tree: first max_depth levels, max_children replies per node
+            serialized_post = CommentTreeSerializer.serialize_tree(post_id, *tree_args, sel=sel)
+            if serialized_post is None:
+                return jsonify({'error': 'Post not found'}), 404
+            return jsonify({'comments': serialized_post['comments'], 'reply_count': serialized_post['reply_count']}), 200
+        serialized_comments = ForumSerializer.serialize_replies(post_id, sel)
+        if serialized_comments is None:
+            return jsonify({'error': 'Post not found'}), 404
+        return jsonify({'comments': serialized_comments}), 200
+
     post = Post.load_by_id(post_id)
     if post is None:
         return jsonify({'error': 'Post not found'}), 404
 
-    if request.method == 'GET':
-        comments = post.getcomments()
-        serialized_comments = [_serialize_post(comment) for comment in comments]
-        return jsonify({'comments': serialized_comments}), 200
-    
     # POST - Create new comment
     data = request.get_json(silent=True) or {}
     message = data.get('message')
@@ -843,6 +994,15 @@ def post_comments(post_id):
         else:
             # Top-level comment - parent is the post
             parent = post
+
+        # Replies in a forum thread need the same membership as posts (one indexed query)
+        status = ForumMembershipService.thread_posting_status(parent.db_id, user.db_id)
+        if status is not None:
+            is_member, is_restricted = status
+            if not is_member:
+                return jsonify({'error': 'User is not a member of this forum'}), 403
+            if is_restricted:
+                return jsonify({'error': 'restricted users cannot add comments'}), 400
         
         # Create the comment with the parent
         new_comment = Comment(poster=user, message=message, title="Comment", parent=parent)
@@ -851,6 +1011,44 @@ def post_comments(post_id):
     except (ValueError, TypeError) as e:
         return jsonify({'error': str(e)}), 400
     
+@app.route('/api/comments/<int:comment_id>/replies', methods=['GET', 'OPTIONS'])
+def comment_replies(comment_id):
+    # Expand one truncated branch of a comment tree (see the stubs from max_depth/max_children)
+    if request.method == 'OPTIONS':
+        return ('', 204)
+    try:
+        sel = _field_selection()
+        max_depth, max_children = _comment_tree_args() or (CommentTreeSerializer.DEFAULT_DEPTH, CommentTreeSerializer.DEFAULT_CHILDREN)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    after = request.args.get('after')
+    try:
+        after_id = int(after) if after not in (None, '') else None
+    except ValueError:
+        return jsonify({'error': 'after must be an integer'}), 400
+    serialized = CommentTreeSerializer.serialize_tree(comment_id, max_depth, max_children, after_id, sel)
+    if serialized is None:
+        return jsonify({'error': 'Comment not found'}), 404
+    return jsonify({'parent_id': comment_id, 'comments': serialized['comments'], 'reply_count': serialized['reply_count']}), 200
+
+@app.route('/api/posts/<int:post_id>/thread', methods=['GET', 'OPTIONS'])
+def post_thread(post_id):
+    # Every reply under a post or comment as a flat list in display order, one page at a time
+    if request.method == 'OPTIONS':
+        return ('', 204)
+    try:
+        sel = _field_selection()
+        limit = parse_limit(request.args.get('limit'))
+        cursor = request.args.get('cursor')
+        after_path = decode_cursor(cursor, 1, (str,))[0] if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    page = ThreadPageSerializer.serialize_page(post_id, limit, after_path, sel)
+    if page is None:
+        return jsonify({'error': 'Post not found'}), 404
+    comments, total, next_cursor = page
+    return jsonify({'comments': comments, 'reply_count': total, 'next_cursor': next_cursor}), 200
+
 @app.route('/api/posts/react/<int:post_id>/<int:reaction_id>/<int:user_id>', methods=['GET', 'OPTIONS'])
 def add_reaction(post_id, reaction_id, user_id):
     if request.method == 'OPTIONS':
@@ -864,7 +1062,6 @@ def add_reaction(post_id, reaction_id, user_id):
         return jsonify({'error': 'Invalid commenting user'}), 404
     
     try:
-        from backend.Messages import Reaction
         reaction_name = ""
         if reaction_id == 1:
             reaction_name = "like"
@@ -877,18 +1074,40 @@ def add_reaction(post_id, reaction_id, user_id):
         else:
             raise ValueError()
         
-        new_reaction = Reaction(reaction_name, user)
-        added = post.togglereaction(new_reaction)
+        if ReactionBuffer.enabled:
+            # Write-behind: recorded in memory, written with the next batch
+            added, counts = ReactionBuffer.toggle(post.db_id, user.db_id, reaction_name)
+        else:
+            # One toggle keyed on (post, user, type); counts come from the same transaction
+            added, counts = post.react(user, reaction_name)
 
         if added:
-            return jsonify({'message': 'Reaction added successfully', 'added': True}), 201
+            return jsonify({'message': 'Reaction added successfully', 'added': True, 'counts': counts}), 201
         else:
-            return jsonify({'message': 'Reaction removed successfully', 'added': False}), 200
+            return jsonify({'message': 'Reaction removed successfully', 'added': False, 'counts': counts}), 200
         
     except (ValueError, TypeError) as e:
         return jsonify({'error': str(e)}), 400
-    
-    
+
+
+@app.route('/api/metrics', methods=['GET', 'OPTIONS'])
+def metrics():
+    # Operational counters: database profile, lock waits/retries, wrapper and permission caches, reaction buffer
+    if request.method == 'OPTIONS':
+        return ('', 204)
+    return jsonify({
+        'database': {
+            'profile': ENGINE_PROFILE['name'],
+            'pragmas': ENGINE_PROFILE['pragmas'],
+            'locks': LOCK_METRICS.snapshot(),
+        },
+        'registry': registry_stats(),
+        'coherence': coherence_stats(),
+        'permissions': PermissionService.stats(),
+        'reaction_buffer': ReactionBuffer.stats(),
+    }), 200
+
 
 if __name__ == '__main__':
+    ensure_db()
     app.run(debug=True)
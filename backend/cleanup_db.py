@@ -1,5 +1,8 @@
 from backend.db import SessionLocal, engine, Base
-from backend.object_registry import _REGISTRY
+from backend.object_registry import clear as registry_clear
+from backend.forum_services import ForumMembershipService
+from backend.permission_services import PermissionService
+from backend.reaction_buffer import ReactionBuffer
 # Ensure models are imported so metadata knows about all tables/columns
 import backend.models  # noqa: F401
 
@@ -15,7 +18,12 @@ def cleanup_db():
         SessionLocal.remove()
     except Exception:
         pass
-    _REGISTRY.clear()
+    # dropping the tables also dropped any row change triggers on pooled connections
+    engine.dispose()
+    registry_clear()
+    ForumMembershipService.reset_deleted_user()
+    PermissionService.clear()
+    ReactionBuffer.discard()
 
 if __name__ == "__main__":
     cleanup_db()
@@ -0,0 +1,240 @@
+'''
+Cross-process coherence for the wrapper registry.
+
+Each worker process caches wrappers in object_registry and updates them in
+place when it changes rows itself, but it cannot see writes made by another
+worker. When SCU_FORUMS_REGISTRY_COHERENCE=1, every pooled connection gets
+TEMP triggers that append (kind, row id, thread path, origin) to the shared
+row_changes table whenever a user, forum, post, reaction or membership row
+changes. The origin is this process's token, so a worker can skip its own
+writes.
+
+Before each request a worker runs sync_registry(): one PRAGMA data_version on
+a private connection tells it whether any other connection committed since the
+last check. Only then does it read the new row_changes entries and drop the
+matching wrappers (and, for posts, every ancestor whose cached comment tree
+contains them), so the next load rebuilds them from the database. No broker
+is involved; the database file is the channel.
+
+The log is pruned to the newest SCU_FORUMS_REGISTRY_COHERENCE_RETAIN entries.
+A worker that falls further behind than that clears its whole registry.
+'''
+import os
+import sqlite3
+import threading
+import uuid
+from typing import List, Optional, Tuple
+from .object_registry import unregister, clear as registry_clear
+
+ORIGIN = f'{os.getpid()}-{uuid.uuid4().hex[:12]}'
+RETAIN = int(os.environ.get('SCU_FORUMS_REGISTRY_COHERENCE_RETAIN', 10000))
+
+# table -> (events, [(kind, id expression, path expression)]); {r} is NEW or OLD
+TRACKED_TABLES = {
+    'users': (('UPDATE', 'DELETE'), [('User', '{r}.id', 'NULL')]),
+    'forums': (('UPDATE', 'DELETE'), [('Forum', '{r}.id', 'NULL')]),
+    'posts': (('INSERT', 'UPDATE', 'DELETE'), [
+        ('Post', '{r}.id', '{r}.path'),
+        ('Forum', '{r}.forum_id', 'NULL'),
+    ]),
+    'reactions': (('INSERT', 'UPDATE', 'DELETE'), [
+        ('Reaction', '{r}.id', 'NULL'),
+        ('Post', '{r}.parent_id', '(SELECT path FROM posts WHERE id = {r}.parent_id)'),
+    ]),
+}
+for _membership in ('forum_users', 'forum_authorized', 'forum_restricted'):
+    TRACKED_TABLES[_membership] = (('INSERT', 'DELETE'), [
+        ('Forum', '{r}.forum_id', 'NULL'),
+        ('User', '{r}.user_id', 'NULL'),
+    ])
+
+
+def trigger_statements(origin: str = ORIGIN) -> List[str]:
+    # CREATE TEMP TRIGGER statements logging changes on one connection under origin
+    quoted = "'" + origin.replace("'", "''") + "'"
+    statements = []
+    for table, (events, entries) in TRACKED_TABLES.items():
+        for event_name in events:
+            row = 'OLD' if event_name == 'DELETE' else 'NEW'
+            body = ''.join(
+                f"INSERT INTO row_changes (kind, row_id, path, origin) "
+                f"SELECT '{kind}', {id_expr.format(r=row)}, {path_expr.format(r=row)}, {quoted} "
+                f"WHERE {id_expr.format(r=row)} IS NOT NULL; "
+                for kind, id_expr, path_expr in entries)
+            statements.append(f"CREATE TEMP TRIGGER IF NOT EXISTS row_change_{table}_{event_name.lower()} "
+                              f"AFTER {event_name} ON main.{table} BEGIN {body}END")
+    return statements
+
+
+def install_triggers(dbapi_connection, origin: str = ORIGIN) -> bool:
+    # Add the logging triggers to one connection; False if the schema is not there yet
+    cursor = dbapi_connection.cursor()
+    try:
+        found = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'row_changes'").fetchone()
+        if found is None:
+            return False
+        for statement in trigger_statements(origin):
+            cursor.execute(statement)
+        return True
+    finally:
+        cursor.close()
+
+
+class ChangeWatcher:
+    # Follows row_changes for one process through a private read connection
+
+    def __init__(self, origin: str = ORIGIN, retain: int = RETAIN) -> None:
+        self.origin = origin
+        self.retain = retain
+        self.enabled = False
+        self.database: Optional[str] = None
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data_version = None
+        self.last_seen = 0
+        self.reset_counters()
+
+    def reset_counters(self) -> None:
+        self.polls = 0          # sync_registry calls while enabled
+        self.skipped = 0        # of those, answered by data_version alone
+        self.changes = 0        # row_changes entries from other processes applied
+        self.invalidated = 0    # wrapper keys dropped from the registry
+        self.resets = 0         # whole-registry clears after falling behind the log
+
+    def enable(self, database: str) -> None:
+        if not database or database == ':memory:':
+            raise ValueError("Registry coherence needs a database file shared by the workers")
+        with self._lock:
+            self._close()
+            self.database = database
+            self.enabled = True
+            self._data_version = None
+            # wrappers cached before now may already be stale
+            registry_clear()
+            self.last_seen = self._bounds()[1]
+
+    def disable(self) -> None:
+        with self._lock:
+            self.enabled = False
+            self._close()
+
+    def poll(self) -> int:
+        # Drop wrappers changed by other processes; returns how many keys were dropped
+        if not self.enabled:
+            return 0
+        with self._lock:
+            self.polls += 1
+            version = self._connection().execute('PRAGMA data_version').fetchone()[0]
+            if version == self._data_version:
+                self.skipped += 1
+                return 0
+            self._data_version = version
+            return self._apply()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'origin': self.origin,
+                'last_seen': self.last_seen,
+                'polls': self.polls,
+                'skipped': self.skipped,
+                'changes': self.changes,
+                'invalidated': self.invalidated,
+                'resets': self.resets,
+            }
+
+    def _apply(self) -> int:
+        from .thread_services import ThreadRepository
+        from .permission_services import PermissionService
+        lowest, highest = self._bounds()
+        if highest < self.last_seen or (lowest and lowest > self.last_seen + 1):
+            # the log was recreated or pruned past us: we cannot tell what changed
+            registry_clear()
+            PermissionService.invalidate()
+            self.resets += 1
+            self.last_seen = highest
+            return 0
+        if highest == self.last_seen:
+            return 0
+        rows = self._connection().execute(
+            'SELECT id, kind, row_id, path, origin FROM row_changes WHERE id > ? ORDER BY id',
+            (self.last_seen,)).fetchall()
+        dropped = set()
+        for change_id, kind, row_id, path, origin in rows:
+            self.last_seen = change_id
+            if origin == self.origin:
+                continue
+            self.changes += 1
+            dropped.add((kind, row_id))
+            if kind == 'Post' and path:
+                # cached ancestors hold this post in their comment trees
+                dropped.update(('Post', ancestor) for ancestor in ThreadRepository.ancestor_ids(path))
+        for kind, row_id in dropped:
+            unregister(kind, row_id)
+            # authorizations live in the forum's membership rows; is_admin in the user's
+            if kind == 'Forum':
+                PermissionService.invalidate(forum_id=row_id)
+            elif kind == 'User':
+                PermissionService.invalidate(user_id=row_id)
+        self.invalidated += len(dropped)
+        if highest - lowest >= 2 * self.retain:
+            self._prune(highest)
+        return len(dropped)
+
+    def _bounds(self) -> Tuple[int, int]:
+        try:
+            lowest, highest = self._connection().execute('SELECT MIN(id), MAX(id) FROM row_changes').fetchone()
+        except sqlite3.OperationalError:
+            # no log table until init_db has run
+            return 0, 0
+        return lowest or 0, highest or 0
+
+    def _prune(self, highest: int) -> None:
+        # Best effort: another worker holding the write lock just means we prune later
+        try:
+            self._connection().execute('DELETE FROM row_changes WHERE id <= ?', (highest - self.retain,))
+        except sqlite3.OperationalError:
+            pass
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # autocommit, so it never pins an old snapshot between polls
+            self._conn = sqlite3.connect(self.database, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA busy_timeout = 1000')
+        return self._conn
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+_WATCHER = ChangeWatcher()
+
+def enabled() -> bool:
+    return _WATCHER.enabled
+
+def enable(database: Optional[str] = None) -> None:
+    # Start logging this process's writes and following other processes' writes.
+    # Connections already in the pool get their triggers on their next checkout.
+    if database is None:
+        from .db import engine
+        database = engine.url.database
+    _WATCHER.enable(database)
+
+def disable() -> None:
+    # Pooled connections are dropped too, taking their logging triggers with them
+    from .db import engine
+    _WATCHER.disable()
+    engine.dispose()
+
+def sync_registry() -> int:
+    return _WATCHER.poll()
+
+def stats() -> dict:
+    return _WATCHER.stats()
+
+
+if os.environ.get('SCU_FORUMS_REGISTRY_COHERENCE', '') == '1':
+    enable()
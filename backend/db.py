@@ -1,29 +1,302 @@
-from sqlalchemy import create_engine, inspect, text
-from sqlalchemy.orm import sessionmaker, declarative_base, scoped_session
+import os
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker, declarative_base, scoped_session
+from .object_registry import unregister
 
 # File-based SQLite so a local backend can be used by a React frontend.
-DATABASE_URL = "sqlite:///scu_forums.db"
+# SCU_FORUMS_DATABASE_URL points scripts/benchmarks at a scratch database.
+DATABASE_URL = os.environ.get("SCU_FORUMS_DATABASE_URL", "sqlite:///scu_forums.db")
+
+# Per-connection SQLite settings. SCU_FORUMS_DB_PROFILE picks a profile and
+# SCU_FORUMS_DB_<PRAGMA> (e.g. SCU_FORUMS_DB_SYNCHRONOUS=FULL) overrides one value.
+# "legacy" keeps SQLite's own defaults (rollback journal, synchronous=FULL).
+DB_PROFILES = {
+    'concurrent': {
+        'journal_mode': 'WAL',        # readers no longer block behind a writer
+        'synchronous': 'NORMAL',      # WAL stays consistent; fsync at checkpoints
+        'cache_size': -20000,         # negative = KiB, so about 20 MB of page cache
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,         # ms SQLite waits on a lock before "database is locked"
+    },
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+    },
+    'legacy': {},
+}
+DEFAULT_PROFILE = 'concurrent'
+
+PRAGMA_CHOICES = {
+    'journal_mode': ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'),
+    'synchronous': ('OFF', 'NORMAL', 'FULL', 'EXTRA'),
+    'temp_store': ('DEFAULT', 'FILE', 'MEMORY'),
+}
+INTEGER_PRAGMAS = ('cache_size', 'mmap_size', 'busy_timeout')
+
+
+def load_profile(environ=os.environ) -> dict:
+    # Resolve the pragma settings for this process from the environment
+    name = environ.get('SCU_FORUMS_DB_PROFILE', DEFAULT_PROFILE).lower()
+    if name not in DB_PROFILES:
+        raise ValueError(f"Unknown SCU_FORUMS_DB_PROFILE {name!r}; expected one of {sorted(DB_PROFILES)}")
+    pragmas = dict(DB_PROFILES[name])
+    for pragma in list(PRAGMA_CHOICES) + list(INTEGER_PRAGMAS):
+        value = environ.get(f'SCU_FORUMS_DB_{pragma.upper()}')
+        if value is None or value == '':
+            continue
+        if pragma in INTEGER_PRAGMAS:
+            try:
+                pragmas[pragma] = int(value)
+            except ValueError:
+                raise ValueError(f"SCU_FORUMS_DB_{pragma.upper()} must be an integer")
+        elif value.upper() in PRAGMA_CHOICES[pragma]:
+            pragmas[pragma] = value.upper()
+        else:
+            raise ValueError(f"SCU_FORUMS_DB_{pragma.upper()} must be one of {PRAGMA_CHOICES[pragma]}")
+    return {'name': name, 'pragmas': pragmas,
+            'lock_retries': int(environ.get('SCU_FORUMS_DB_LOCK_RETRIES', 3)),
+            'lock_backoff_ms': int(environ.get('SCU_FORUMS_DB_LOCK_BACKOFF_MS', 50))}
+
+
+ENGINE_PROFILE = load_profile()
+
+
+class LockMetrics:
+    # Counters for lock waits/retries; read through snapshot() (see /api/metrics)
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.write_begins = 0       # write transactions opened with BEGIN IMMEDIATE
+            self.lock_waits = 0         # of those, ones that had to wait for another writer
+            self.lock_wait_seconds = 0.0
+            self.retries = 0            # BEGIN IMMEDIATE attempts repeated after a busy error
+            self.gave_up = 0            # write transactions that never got the lock
+            self.lock_errors = 0        # "database is locked"/busy errors seen on any statement
+
+    def add(self, **counts) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'write_begins': self.write_begins,
+                'lock_waits': self.lock_waits,
+                'lock_wait_seconds': round(self.lock_wait_seconds, 6),
+                'retries': self.retries,
+                'gave_up': self.gave_up,
+                'lock_errors': self.lock_errors,
+            }
+
+
+LOCK_METRICS = LockMetrics()
+# A BEGIN IMMEDIATE slower than this counts as having waited on another writer
+LOCK_WAIT_THRESHOLD = 0.005
+
+
+class UnitOfWorkSession(Session):
+    # While a unit of work is open, commit() only flushes and close() keeps the
+    # session, so every repository call in a request shares one transaction.
+    # end_unit_of_work does the single real commit (or rollback).
+
+    def commit(self):
+        if self.info.get('unit_of_work'):
+            self.flush()
+            return
+        super().commit()
+
+    def close(self):
+        if self.info.get('unit_of_work'):
+            return
+        super().close()
+
 
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+SessionLocal = scoped_session(sessionmaker(class_=UnitOfWorkSession, autocommit=False, autoflush=False, bind=engine))
 Base = declarative_base()
 
 
-def init_db():
-    # create tables
-    Base.metadata.create_all(bind=engine)
-    # Ensure new columns exist if added after initial creation
-    inspector = inspect(engine)
-    def ensure_column(table: str, column: str, ddl: str):
-        cols = [c['name'] for c in inspector.get_columns(table)]
-        if column not in cols:
-            with engine.connect() as conn:
-                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
-                # Backfill existing rows
-                if column == 'created_at':
-                    conn.execute(text(f"UPDATE {table} SET {column}=CURRENT_TIMESTAMP WHERE {column} IS NULL"))
+@event.listens_for(engine, 'connect')
+def _apply_pragmas(dbapi_connection, connection_record):
+    # Pragmas are per connection, so every pooled connection gets the profile
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, value in ENGINE_PROFILE['pragmas'].items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+    finally:
+        cursor.close()
+
+
+@event.listens_for(engine, 'checkout')
+def _install_change_triggers(dbapi_connection, connection_record, connection_proxy):
+    # Row change log for registry coherence across worker processes (see coherence.py)
+    from . import coherence
+    if coherence.enabled() and not connection_record.info.get('row_change_triggers'):
+        connection_record.info['row_change_triggers'] = coherence.install_triggers(dbapi_connection)
+
+
+def _is_lock_error(exc) -> bool:
+    message = str(getattr(exc, 'orig', exc)).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+@event.listens_for(engine, 'handle_error')
+def _count_lock_errors(context):
+    if _is_lock_error(context.original_exception):
+        LOCK_METRICS.add(lock_errors=1)
+
+
+def begin_write(session) -> None:
+    # Open the session's transaction with BEGIN IMMEDIATE so the write lock is taken
+    # up front (waiting up to busy_timeout) instead of failing mid-request when a
+    # read transaction tries to upgrade. Busy errors are retried with backoff.
+    if session.connection().connection.dbapi_connection.in_transaction:
+        # already inside a transaction (and possibly holding the lock)
+        return
+    attempts = max(1, ENGINE_PROFILE['lock_retries'] + 1)
+    for attempt in range(attempts):
+        start = time.perf_counter()
+        try:
+            session.connection().exec_driver_sql('BEGIN IMMEDIATE')
+        except OperationalError as e:
+            session.rollback()
+            if not _is_lock_error(e):
+                raise
+            if attempt == attempts - 1:
+                LOCK_METRICS.add(gave_up=1)
+                raise
+            LOCK_METRICS.add(retries=1)
+            time.sleep(ENGINE_PROFILE['lock_backoff_ms'] / 1000.0 * (2 ** attempt))
+            continue
+        waited = time.perf_counter() - start
+        LOCK_METRICS.add(write_begins=1)
+        if waited >= LOCK_WAIT_THRESHOLD:
+            LOCK_METRICS.add(lock_waits=1, lock_wait_seconds=waited)
+        return
+
+
+def get_or_insert(session, model, key_columns, values: dict):
+    # Row matching values on key_columns (a unique index), inserting it if missing.
+    # Returns (row, created). A new row is one INSERT .. ON CONFLICT DO NOTHING RETURNING;
+    # when the row already exists RETURNING comes back empty and one SELECT reads it.
+    # The caller (or its unit of work) commits.
+    stmt = (sqlite_insert(model).values(**values)
+            .on_conflict_do_nothing(index_elements=list(key_columns))
+            .returning(model))
+    row = session.scalars(stmt).first()
+    if row is not None:
+        return row, True
+    lookup = [getattr(model, column) == values.get(column) for column in key_columns]
+    return session.query(model).filter(*lookup).first(), False
+
+
+@event.listens_for(UnitOfWorkSession, 'after_flush')
+def _track_unit_of_work_rows(session, flush_context):
+    # Remember which wrappers describe rows written in this unit of work so a
+    # rollback can drop them from the registry (SQLite reuses rolled back ids)
+    if not session.info.get('unit_of_work'):
+        return
+    touched = session.info.setdefault('unit_of_work_rows', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        kind = type(obj).__name__[:-len('Model')]
+        touched.add((kind, getattr(obj, 'id', None)))
+        # lists on the owning wrappers may hold the row as well
+        if getattr(obj, 'parent_id', None) is not None:
+            touched.add(('Post', obj.parent_id))
+        if getattr(obj, 'forum_id', None) is not None:
+            touched.add(('Forum', obj.forum_id))
+
+
+def track_unit_of_work_rows(session, *keys) -> None:
+    # Core statements never reach the flush hook above; record the (kind, id)
+    # wrappers they change so a rollback drops those too
+    if session.info.get('unit_of_work'):
+        session.info.setdefault('unit_of_work_rows', set()).update(keys)
+
+
+def begin_unit_of_work(write: bool = False):
+    # Start sharing one session/transaction on this thread (one per HTTP request);
+    # write=True takes the database write lock straight away (see begin_write)
+    session = SessionLocal()
+    session.info['unit_of_work'] = True
+    session.info['unit_of_work_rows'] = set()
+    if write:
+        try:
+            begin_write(session)
+        except Exception:
+            end_unit_of_work(commit=False)
+            raise
+    return session
+
+
+def in_unit_of_work() -> bool:
+    return bool(SessionLocal().info.get('unit_of_work'))
+
+
+def _forget_rolled_back(touched) -> None:
+    # Wrappers (and cached permission decisions) built on rows that were rolled back
+    from .permission_services import PermissionService
+    for kind, db_id in touched:
+        unregister(kind, db_id)
+        if kind == 'Forum':
+            PermissionService.invalidate(forum_id=db_id)
+        elif kind == 'User':
+            PermissionService.invalidate(user_id=db_id)
+
+
+def end_unit_of_work(commit: bool = True):
+    # Commit (or roll back) everything done since begin_unit_of_work, then release the session
+    session = SessionLocal()
+    session.info.pop('unit_of_work', None)
+    touched = session.info.pop('unit_of_work_rows', set())
     try:
-        ensure_column('forums', 'created_at', 'TIMESTAMP')
-        ensure_column('posts', 'created_at', 'TIMESTAMP')
+        if commit:
+            session.commit()
+        else:
+            session.rollback()
+            _forget_rolled_back(touched)
     except Exception:
-        pass
+        session.rollback()
+        _forget_rolled_back(touched)
+        raise
+    finally:
+        SessionLocal.remove()
+
+
+def init_db():
+    # create tables, then bring older databases up to the current schema version.
+    # A database already at the latest version is left alone: every schema change
+    # ships as a migration, so the version check stands in for the inspector pass.
+    from . import models  # noqa: F401  (table metadata for create_all)
+    from .migrations import migrate, current_version, latest_version
+    with engine.connect() as conn:
+        if current_version(conn) >= latest_version():
+            return
+    Base.metadata.create_all(bind=engine)
+    migrate(engine)
+
+
+_db_ready = False
+_db_ready_lock = threading.Lock()
+
+
+def ensure_db():
+    # init_db once per process, at app startup; later calls are a flag check
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_ready_lock:
+        if not _db_ready:
+            init_db()
+            _db_ready = True
@@ -40,8 +40,9 @@ def print_user_dashboard(email):
         print("\t(none)")
     else:
         for forum in forums:
-            posts_in_forum = forum.getPosts()
-            print(f"\t- {forum.course_name} - {len(posts_in_forum)} posts")
+            # counts come from forum_stats, so no posts are loaded here
+            stats = forum.stats()
+            print(f"\t- {forum.course_name} - {stats['post_count']} posts, {stats['member_count']} members")
     
     user_posts = user.getposts()
     print(f"\n   My Posts ({len(user_posts)}):")
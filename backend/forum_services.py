@@ -1,7 +1,13 @@
-from typing import TYPE_CHECKING, List, Optional
-from .db import SessionLocal
-from .models import ForumModel, UserModel, PostModel
-from .object_registry import register, get as registry_get
+import threading
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select, delete, func, literal, literal_column, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .db import SessionLocal, begin_write, get_or_insert, track_unit_of_work_rows
+from .models import ForumModel, ForumStatsModel, UserModel, PostModel, forum_users, forum_authorized, forum_restricted
+from .object_registry import register, get as registry_get, add_unique, discard
+from .wrapper_fields import MemberSet
+from .permission_services import PermissionService
 
 if TYPE_CHECKING:
     from backend.User import User
@@ -54,6 +60,27 @@ class ForumRepository:
         finally:
             session.close()
     
+    @staticmethod
+    def load_summaries(limit: int, after_id: Optional[int] = None) -> Tuple[List[dict], bool]:
+        # Forum directory rows with counts read from forum_stats, no wrappers
+        session = SessionLocal()
+        try:
+            query = select(
+                ForumModel.id,
+                ForumModel.course_name,
+                ForumModel.created_at,
+                func.coalesce(ForumStatsModel.member_count, 0).label('member_count'),
+                func.coalesce(ForumStatsModel.post_count, 0).label('post_count'),
+                func.coalesce(ForumStatsModel.last_post_at, ForumModel.created_at).label('last_activity'),
+            ).outerjoin(ForumStatsModel, ForumStatsModel.forum_id == ForumModel.id)
+            if after_id is not None:
+                query = query.where(ForumModel.id > after_id)
+            # One extra row tells whether another page follows
+            rows = session.execute(query.order_by(ForumModel.id).limit(limit + 1)).mappings().all()
+            return [dict(row) for row in rows[:limit]], len(rows) > limit
+        finally:
+            session.close()
+
     @staticmethod
     def save(forum: 'Forum') -> None:
         # update the DB with forum info
@@ -80,6 +107,24 @@ class ForumRepository:
         finally:
             session.close()
     
+    @staticmethod
+    def get_or_create(course_name: str, session=None) -> Tuple['ForumModel', bool]:
+        # Insert the forum or find it by course name; a new forum is one statement
+        close_session = False
+        if session is None:
+            session = SessionLocal()
+            close_session = True
+        try:
+            forum_model, created = get_or_insert(session, ForumModel, ['course_name'], {'course_name': course_name})
+            if created:
+                # detached first so the commit does not expire what RETURNING loaded
+                session.expunge(forum_model)
+                session.commit()
+            return forum_model, created
+        finally:
+            if close_session:
+                session.close()
+
     @staticmethod
     def find_by_course_name(course_name: str) -> Optional['ForumModel']:
         # Find a forum model by course name
@@ -94,11 +139,133 @@ class ForumRepository:
 
 
 
+# Keeps forum_stats in step with membership and post writes
+class ForumStatsRepository:
+
+    COUNTS = ('member_count', 'post_count', 'comment_count', 'reaction_count')
+
+    # Every forum's row recomputed from members, posts, replies and the reaction counters
+    REBUILD_SQL = '''
+        INSERT INTO forum_stats (forum_id, member_count, post_count, comment_count, reaction_count, last_post_at)
+        SELECT f.id,
+            (SELECT COUNT(*) FROM forum_users m WHERE m.forum_id = f.id),
+            (SELECT COUNT(*) FROM posts p WHERE p.forum_id = f.id AND p.is_deleted IS NOT 1),
+            (SELECT COUNT(*) FROM posts p JOIN posts d ON d.path > p.path AND d.path < p.path || '0'
+             WHERE p.forum_id = f.id AND d.is_deleted IS NOT 1),
+            (SELECT COALESCE(SUM(c.count), 0) FROM posts p JOIN posts d ON d.path >= p.path AND d.path < p.path || '0'
+             JOIN post_reaction_counts c ON c.post_id = d.id WHERE p.forum_id = f.id),
+            (SELECT MAX(p.created_at) FROM posts p WHERE p.forum_id = f.id)
+        FROM forums f
+    '''
+
+    @staticmethod
+    def bump(session, forum_id: Optional[int], members: int = 0, posts: int = 0, comments: int = 0,
+             reactions: int = 0, last_post_at: Optional[datetime] = None) -> None:
+        # Add deltas to a forum's row (created on first use) in the caller's transaction
+        if forum_id is None:
+            return
+        stmt = sqlite_insert(ForumStatsModel).values(
+            forum_id=forum_id, member_count=members, post_count=posts, comment_count=comments,
+            reaction_count=reactions, last_post_at=last_post_at)
+        current = ForumStatsModel.__table__.c
+        updates = {name: current[name] + stmt.excluded[name] for name in ForumStatsRepository.COUNTS}
+        updates['last_post_at'] = func.max(func.coalesce(current.last_post_at, stmt.excluded.last_post_at),
+                                           func.coalesce(stmt.excluded.last_post_at, current.last_post_at))
+        session.execute(stmt.on_conflict_do_update(index_elements=[current.forum_id], set_=updates))
+
+    @staticmethod
+    def thread_forum_id(session, post_id: int) -> Optional[int]:
+        # Forum of the thread post_id is in (that of its top-level post)
+        from .thread_services import ThreadRepository
+        return session.execute(select(ThreadRepository.thread_forum_id(post_id))).scalar()
+
+    @staticmethod
+    def move_thread(session, post_model: 'PostModel', from_forum_id: Optional[int], to_forum_id: Optional[int]) -> None:
+        # A top-level post changing forum takes its live replies and its thread's reactions along
+        from .models import PostReactionCountModel
+        from .thread_services import ThreadRepository
+        if from_forum_id == to_forum_id:
+            return
+        reactions = 0
+        if post_model.path is not None:
+            reactions = session.execute(
+                select(func.coalesce(func.sum(PostReactionCountModel.count), 0))
+                .select_from(PostReactionCountModel)
+                .join(PostModel, PostModel.id == PostReactionCountModel.post_id)
+                .where(ThreadRepository.in_subtree(post_model.path))).scalar()
+        live = 0 if post_model.is_deleted else 1
+        replies = post_model.descendant_count or 0
+        ForumStatsRepository.bump(session, from_forum_id, posts=-live, comments=-replies, reactions=-reactions)
+        ForumStatsRepository.bump(session, to_forum_id, posts=live, comments=replies, reactions=reactions,
+                                  last_post_at=post_model.created_at)
+
+    @staticmethod
+    def get(forum_id: int, session=None) -> Optional[dict]:
+        # The forum's stats, zeros if nothing was counted yet; None if there is no such forum.
+        # Reads forums and forum_stats only.
+        close_session = False
+        if session is None:
+            session = SessionLocal()
+            close_session = True
+        try:
+            row = session.execute(
+                select(ForumModel.id, *[func.coalesce(ForumStatsModel.__table__.c[name], 0).label(name)
+                                        for name in ForumStatsRepository.COUNTS],
+                       ForumStatsModel.last_post_at)
+                .select_from(ForumModel)
+                .outerjoin(ForumStatsModel, ForumStatsModel.forum_id == ForumModel.id)
+                .where(ForumModel.id == forum_id)).mappings().first()
+            if row is None:
+                return None
+            stats = dict(row)
+            stats['forum_id'] = stats.pop('id')
+            return stats
+        finally:
+            if close_session:
+                session.close()
+
+    @staticmethod
+    def rebuild(session=None) -> int:
+        # Recompute every forum's row; returns the number of rows written
+        close_session = False
+        if session is None:
+            session = SessionLocal()
+            close_session = True
+        try:
+            begin_write(session)
+            session.execute(delete(ForumStatsModel))
+            written = session.execute(text(ForumStatsRepository.REBUILD_SQL)).rowcount
+            session.commit()
+            return written
+        finally:
+            if close_session:
+                session.close()
+
+
 # Support class for managing User and Forum relations
 class ForumMembershipService:
+
+    # Forum wrapper list -> association table
+    MEMBER_TABLES = {'users': forum_users, 'authorized': forum_authorized, 'restricted': forum_restricted}
     
-    # Class-level deleted user instance for maintaining post history
-    DELETED_USER = None
+    # "[deleted]" user that takes over posts of removed members; created on first use
+    _deleted_user = None
+    _deleted_user_lock = threading.Lock()
+
+    @staticmethod
+    def deleted_user() -> 'User':
+        cls = ForumMembershipService
+        if cls._deleted_user is None:
+            with cls._deleted_user_lock:
+                if cls._deleted_user is None:
+                    from backend.User import User
+                    cls._deleted_user = User("[deleted]", "deleted@scu.edu", "N/A", 1, None, None, None)
+        return cls._deleted_user
+
+    @staticmethod
+    def reset_deleted_user() -> None:
+        # Forget the cached sentinel (the users table was recreated)
+        ForumMembershipService._deleted_user = None
     
     @staticmethod
     def add_user(forum: 'Forum', user: 'User') -> None:
@@ -106,25 +273,13 @@ class ForumMembershipService:
         from backend.User import User
         if not isinstance(user, User):
             raise TypeError("user must be a User instance")
-        if user not in forum.users:
-            forum.users.append(user)
-            # persist association
-            session = SessionLocal()
-            try:
-                forum_model = session.get(ForumModel, forum.db_id)
-                user_model = session.get(UserModel, getattr(user, 'db_id', None))
-                if user_model is None:
-                    return
-                if user_model not in forum_model.users:
-                    forum_model.users.append(user_model)
-                    session.add(forum_model)
-                    session.commit()
-            finally:
-                session.close()
+        # MemberSet.add checks and adds in one step, so concurrent joins add the user once
+        if forum.users.add(user):
+            ForumMembershipService._link('users', forum, user)
             # ensure user's forum list also reflects membership
             try:
-                if getattr(user, 'forum', None) is not None and forum not in user.forum:
-                    user.forum.append(forum)
+                if getattr(user, 'forum', None) is not None:
+                    add_unique(user, user.forum, forum)
             except Exception:
                 pass
     
@@ -135,22 +290,23 @@ class ForumMembershipService:
             return
             
         # Update all posts by this user to use the deleted user
+        deleted_user = ForumMembershipService.deleted_user()
         for post in forum.posts:
             if post.poster == user:
-                post.poster = ForumMembershipService.DELETED_USER
+                post.poster = deleted_user
                 # update DB poster id for that post
                 session = SessionLocal()
                 try:
                     post_model = session.get(PostModel, getattr(post, 'db_id', None))
                     if post_model is not None:
-                        post_model.poster_id = getattr(ForumMembershipService.DELETED_USER, 'db_id', None)
+                        post_model.poster_id = getattr(deleted_user, 'db_id', None)
                         session.add(post_model)
                         session.commit()
                 finally:
                     session.close()
         
-        # Remove user from users list
-        forum.users.remove(user)
+        # Remove user from members
+        forum.users.discard(user)
         
         # Clean up authorization lists
         if user in forum.authorized:
@@ -159,21 +315,12 @@ class ForumMembershipService:
             ForumMembershipService.unrestrict_user(forum, user)
         
         # remove association in DB
-        session = SessionLocal()
-        try:
-            forum_model = session.get(ForumModel, forum.db_id)
-            user_model = session.get(UserModel, getattr(user, 'db_id', None))
-            if user_model in forum_model.users:
-                forum_model.users.remove(user_model)
-                session.add(forum_model)
-                session.commit()
-        finally:
-            session.close()
+        ForumMembershipService._unlink('users', forum, user)
         
         # remove forum from user's in-memory forum list if present
         try:
-            if getattr(user, 'forum', None) is not None and forum in user.forum:
-                user.forum.remove(forum)
+            if getattr(user, 'forum', None) is not None:
+                discard(user, user.forum, forum)
         except Exception:
             pass
     
@@ -187,19 +334,11 @@ class ForumMembershipService:
             raise ValueError("User is not a member of this forum")
         if user not in forum.authorized:
             # update db relationships
-            session = SessionLocal()
-            try:
-                forum_model = session.get(ForumModel, forum.db_id)
-                user_model = session.get(UserModel, getattr(user, 'db_id', None))
-                if forum_model is not None and user_model is not None and user_model not in getattr(forum_model, 'authorized_users', []):
-                    forum_model.authorized_users.append(user_model)
-                    session.add(forum_model)
-                    session.commit()
-            finally:
-                session.close()
-            forum.authorized.append(user)
+            ForumMembershipService._link('authorized', forum, user)
+            forum.authorized.add(user)
             if user in forum.restricted:
                 ForumMembershipService.unrestrict_user(forum, user)
+            PermissionService.invalidate(user.db_id, forum.db_id)
     
     @staticmethod
     def deauthorize_user(forum: 'Forum', user: 'User') -> None:
@@ -207,17 +346,9 @@ class ForumMembershipService:
         if user not in forum.authorized:
             return
         # update db relationships
-        session = SessionLocal()
-        try:
-            forum_model = session.get(ForumModel, forum.db_id)
-            user_model = session.get(UserModel, getattr(user, 'db_id', None))
-            if forum_model is not None and user_model is not None and user_model in getattr(forum_model, 'authorized_users', []):
-                forum_model.authorized_users.remove(user_model)
-                session.add(forum_model)
-                session.commit()
-        finally:
-            session.close()
-        forum.authorized.remove(user)
+        ForumMembershipService._unlink('authorized', forum, user)
+        forum.authorized.discard(user)
+        PermissionService.invalidate(user.db_id, forum.db_id)
     
     @staticmethod
     def restrict_user(forum: 'Forum', user: 'User') -> None:
@@ -229,19 +360,11 @@ class ForumMembershipService:
             raise ValueError("User is not a member of this forum")
         if user not in forum.restricted:
             # update db relationships
-            session = SessionLocal()
-            try:
-                forum_model = session.get(ForumModel, forum.db_id)
-                user_model = session.get(UserModel, getattr(user, 'db_id', None))
-                if forum_model is not None and user_model is not None and user_model not in getattr(forum_model, 'restricted_users', []):
-                    forum_model.restricted_users.append(user_model)
-                    session.add(forum_model)
-                    session.commit()
-            finally:
-                session.close()
-            forum.restricted.append(user)
+            ForumMembershipService._link('restricted', forum, user)
+            forum.restricted.add(user)
             if user in forum.authorized:
                 ForumMembershipService.deauthorize_user(forum, user)
+            PermissionService.invalidate(user.db_id, forum.db_id)
     
     @staticmethod
     def unrestrict_user(forum: 'Forum', user: 'User') -> None:
@@ -249,18 +372,174 @@ class ForumMembershipService:
         if user not in forum.restricted:
             return
         # update db relationships
+        ForumMembershipService._unlink('restricted', forum, user)
+        forum.restricted.discard(user)
+        PermissionService.invalidate(user.db_id, forum.db_id)
+
+    @staticmethod
+    def _link(kind: str, forum: 'Forum', user: 'User') -> None:
+        # Add the (forum, user) row to kind's association table; a no-op if it is there
+        table = ForumMembershipService.MEMBER_TABLES[kind]
+        forum_id, user_id = getattr(forum, 'db_id', None), getattr(user, 'db_id', None)
         session = SessionLocal()
         try:
-            forum_model = session.get(ForumModel, forum.db_id)
-            user_model = session.get(UserModel, getattr(user, 'db_id', None))
-            if forum_model is not None and user_model is not None and user_model in getattr(forum_model, 'restricted_users', []):
-                forum_model.restricted_users.remove(user_model)
-                session.add(forum_model)
-                session.commit()
+            added = session.execute(sqlite_insert(table).values(forum_id=forum_id, user_id=user_id).on_conflict_do_nothing()).rowcount
+            if kind == 'users' and added:
+                ForumStatsRepository.bump(session, forum_id, members=1)
+            track_unit_of_work_rows(session, ('Forum', forum_id), ('User', user_id))
+            session.commit()
         finally:
             session.close()
-        forum.restricted.remove(user)
-    
+
+    @staticmethod
+    def _unlink(kind: str, forum: 'Forum', user: 'User') -> None:
+        # Delete the (forum, user) row from kind's association table
+        table = ForumMembershipService.MEMBER_TABLES[kind]
+        forum_id, user_id = getattr(forum, 'db_id', None), getattr(user, 'db_id', None)
+        session = SessionLocal()
+        try:
+            removed = session.execute(delete(table).where(table.c.forum_id == forum_id, table.c.user_id == user_id)).rowcount
+            if kind == 'users' and removed:
+                ForumStatsRepository.bump(session, forum_id, members=-1)
+            track_unit_of_work_rows(session, ('Forum', forum_id), ('User', user_id))
+            session.commit()
+        finally:
+            session.close()
+
+    @staticmethod
+    def members_of(forum: 'Forum', kind: str) -> List['User']:
+        # Loader behind forum.users / authorized / restricted: runs on first access
+        forum_id = getattr(forum, 'db_id', None)
+        if forum_id is None:
+            return []
+        session = SessionLocal()
+        try:
+            return MemberSet(ForumMembershipService._load_member_lists(session, [forum_id], (kind,)).get((forum_id, kind), []))
+        finally:
+            session.close()
+
+    @staticmethod
+    def load_members(forums: Iterable['Forum'], kinds: Iterable[str] = ('users', 'authorized', 'restricted'),
+                     session=None) -> None:
+        # Fill the requested membership lists of many forums at once: one query over the
+        # association tables and one for members not already cached. Lists already
+        # loaded are left as they are.
+        from backend.Forum import Forum
+        pending = {}
+        for forum in forums:
+            for kind in kinds:
+                if getattr(forum, 'db_id', None) is not None and not getattr(Forum, kind).is_loaded(forum):
+                    pending.setdefault(kind, []).append(forum)
+        if not pending:
+            return
+        close_session = False
+        if session is None:
+            session = SessionLocal()
+            close_session = True
+        try:
+            forum_ids = sorted({f.db_id for group in pending.values() for f in group})
+            lists = ForumMembershipService._load_member_lists(session, forum_ids, tuple(pending))
+            for kind, group in pending.items():
+                for forum in group:
+                    getattr(Forum, kind).publish(forum, MemberSet(lists.get((forum.db_id, kind), [])))
+        finally:
+            if close_session:
+                session.close()
+
+    @staticmethod
+    def _load_member_lists(session, forum_ids: List[int], kinds: Tuple[str, ...]) -> Dict[Tuple[int, str], List['User']]:
+        # (forum id, kind) -> member wrappers, in the order the members were added
+        from backend.User import User
+        tables = ForumMembershipService.MEMBER_TABLES
+        selects = [
+            select(literal(kind).label('kind'), tables[kind].c.forum_id, tables[kind].c.user_id,
+                   literal_column('rowid').label('seq'))
+            .where(tables[kind].c.forum_id.in_(forum_ids))
+            for kind in kinds
+        ]
+        membership = selects[0].union_all(*selects[1:]) if len(selects) > 1 else selects[0]
+        rows = session.execute(membership.order_by('seq')).all()
+        users = {}
+        missing = set()
+        for _, _, user_id, _ in rows:
+            cached = registry_get('User', user_id)
+            if cached is not None:
+                users[user_id] = cached
+            else:
+                missing.add(user_id)
+        if missing:
+            for user_model in session.query(UserModel).filter(UserModel.id.in_(missing)).all():
+                users[user_model.id] = User.from_model(user_model)
+        lists = {}
+        for kind, forum_id, user_id, _ in rows:
+            if user_id in users:
+                lists.setdefault((forum_id, kind), []).append(users[user_id])
+        return lists
+
+    @staticmethod
+    def member_count(forum: 'Forum') -> int:
+        # Number of members without building the member list
+        from backend.Forum import Forum
+        if Forum.users.is_loaded(forum):
+            return len(forum.users)
+        session = SessionLocal()
+        try:
+            return session.execute(select(func.count()).select_from(forum_users)
+                                   .where(forum_users.c.forum_id == getattr(forum, 'db_id', None))).scalar_one()
+        finally:
+            session.close()
+
+    @staticmethod
+    def is_member(forum: 'Forum', user_id: int) -> bool:
+        # Membership test by user id: a primary key lookup unless the list is already loaded
+        from backend.Forum import Forum
+        if Forum.users.is_loaded(forum):
+            return user_id in forum.users
+        session = SessionLocal()
+        try:
+            found = session.execute(select(forum_users.c.user_id).where(
+                forum_users.c.forum_id == getattr(forum, 'db_id', None),
+                forum_users.c.user_id == user_id)).first()
+            return found is not None
+        finally:
+            session.close()
+
+    @staticmethod
+    def posting_status(forum: 'Forum', user_id: int) -> Tuple[bool, bool]:
+        # (is member, is restricted) for a user about to post: answered from the
+        # member sets when both are loaded, otherwise by one primary key query
+        from backend.Forum import Forum
+        if Forum.users.is_loaded(forum) and Forum.restricted.is_loaded(forum):
+            return user_id in forum.users, user_id in forum.restricted
+        status = ForumMembershipService._posting_status(literal(getattr(forum, 'db_id', None)), user_id)
+        return status[1], status[2]
+
+    @staticmethod
+    def thread_posting_status(post_id: int, user_id: int) -> Optional[Tuple[bool, bool]]:
+        # posting_status for replying anywhere in the thread holding post_id, in the
+        # same single query; None when the thread is not in a forum
+        from .thread_services import ThreadRepository
+        status = ForumMembershipService._posting_status(ThreadRepository.thread_forum_id(post_id), user_id)
+        if status[0] is None:
+            return None
+        return status[1], status[2]
+
+    @staticmethod
+    def _posting_status(forum_id, user_id: int) -> Tuple[Optional[int], bool, bool]:
+        # forum_id is a SQL expression; returns (forum id, is member, is restricted)
+        target = select(forum_id.label('forum_id')).cte('target')
+
+        def _probe(table):
+            return (select(literal(1)).where(table.c.forum_id == target.c.forum_id,
+                                             table.c.user_id == user_id)).exists()
+
+        session = SessionLocal()
+        try:
+            row = session.execute(select(target.c.forum_id, _probe(forum_users), _probe(forum_restricted))).one()
+            return row[0], bool(row[1]), bool(row[2])
+        finally:
+            session.close()
+
     @staticmethod
     def is_authorized(forum: 'Forum', user: 'User') -> bool:
         # Check privilege
@@ -295,24 +574,21 @@ class ForumPostService:
         if not isinstance(post, Post):
             raise TypeError("post must be a Post instance")
         
-        # Check membership by db_id instead of object identity
-        user_ids = [u.db_id for u in forum.users]
-        if post.poster.db_id not in user_ids:
+        # One indexed query instead of loading the forum's member lists
+        is_member, is_restricted = ForumMembershipService.posting_status(forum, getattr(post.poster, 'db_id', None))
+        if not is_member:
             raise ValueError("post author must be a member of the forum")
-        
-        # Check if user is restricted
-        restricted_ids = [u.db_id for u in forum.restricted]
-        if post.poster.db_id in restricted_ids:
+        if is_restricted:
             raise ValueError("restricted users cannot add posts")
         
-        if post not in forum.posts:
-            forum.posts.append(post)
+        if add_unique(forum, forum.posts, post):
             # persist forum relation on post
             session = SessionLocal()
             try:
                 post_model = session.get(PostModel, getattr(post, 'db_id', None))
                 forum_model = session.get(ForumModel, forum.db_id)
                 if post_model is not None and forum_model is not None:
+                    ForumStatsRepository.move_thread(session, post_model, post_model.forum_id, forum_model.id)
                     post_model.forum_id = forum_model.id
                     session.add(post_model)
                     session.commit()
@@ -330,7 +606,27 @@ class ForumPostService:
         from backend.Messages import Post
         session = SessionLocal()
         try:
-            db_posts = session.query(PostModel).filter(PostModel.forum_id == getattr(forum, 'db_id', None)).all()
-            return [Post.from_model(db_post, session=session) for db_post in db_posts]
+            # listing order; left unordered, SQLite returns whichever forum_id index it picked
+            db_posts = (session.query(PostModel)
+                        .filter(PostModel.forum_id == getattr(forum, 'db_id', None))
+                        .order_by(PostModel.created_at, PostModel.id)
+                        .all())
+            return Post.from_models(db_posts, session=session)
+        finally:
+            session.close()
+
+    @staticmethod
+    def get_posts_page(forum: 'Forum', limit: int, cursor: Optional[str] = None) -> Tuple[List['Post'], Optional[str]]:
+        # Get one page of posts ordered by (created_at, id) plus the cursor for the next page
+        from backend.Messages import Post
+        from .messages_services import PostRepository
+        from .pagination import encode_cursor, decode_cursor
+        after = decode_cursor(cursor, 2, (datetime, int)) if cursor else None
+        session = SessionLocal()
+        try:
+            db_posts, has_more = PostRepository.load_forum_page(getattr(forum, 'db_id', None), limit, after, session=session)
+            posts = Post.from_models(db_posts, session=session)
         finally:
             session.close()
+        next_cursor = encode_cursor(db_posts[-1].created_at, db_posts[-1].id) if has_more else None
+        return posts, next_cursor
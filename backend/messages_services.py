@@ -1,7 +1,11 @@
-from typing import TYPE_CHECKING, Optional
-from .db import SessionLocal
-from .models import PostModel, ReactionModel
-from .object_registry import register, get as registry_get
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from datetime import datetime
+from sqlalchemy import and_, or_, case, delete, update, select, func, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .db import SessionLocal, begin_write, get_or_insert, track_unit_of_work_rows
+from .models import PostModel, ReactionModel, PostReactionCountModel
+from .object_registry import register, get as registry_get, add_unique
+from .reaction_buffer import ReactionBuffer
 
 if TYPE_CHECKING:
     from backend.Messages import Post, Comment, Reaction
@@ -9,7 +13,27 @@ if TYPE_CHECKING:
 
 # Manage Post DB methods
 class PostRepository:
-    
+
+    # Forum listing orders: ?sort= name -> (key column, largest first, key for a missing value).
+    # Each has a (forum_id, key, id) index, and cursors hold (key, id).
+    LISTING_SORTS = {
+        'created': (PostModel.created_at, False, datetime.min),
+        'activity': (PostModel.last_activity_at, True, datetime.min),
+        'comments': (PostModel.descendant_count, True, 0),
+    }
+
+    # Thread stats recomputed from the rows below each post (subtrees by path range);
+    # what record_reply and soft_delete maintain incrementally
+    REBUILD_THREAD_STATS_SQL = '''
+        UPDATE posts SET
+            comment_count = (SELECT COUNT(*) FROM posts c
+                             WHERE c.parent_id = posts.id AND c.is_deleted IS NOT 1),
+            descendant_count = (SELECT COUNT(*) FROM posts d
+                                WHERE d.path > posts.path AND d.path < posts.path || '0' AND d.is_deleted IS NOT 1),
+            last_activity_at = COALESCE((SELECT MAX(d.created_at) FROM posts d
+                                         WHERE d.path >= posts.path AND d.path < posts.path || '0'), created_at)
+    '''
+
     @staticmethod
     def load_by_id(post_id: int) -> Optional['Post']:
         # Load wrapper from id
@@ -38,12 +62,144 @@ class PostRepository:
                 parent_id=parent_id
             )
             session.add(post_model)
+            session.flush()
+            # path needs the new id, so it is filled in before the commit
+            PostRepository.set_parent(session, post_model, parent_id)
             session.commit()
             session.refresh(post_model)
             return post_model
         finally:
             session.close()
+
+    @staticmethod
+    def set_parent(session, post_model: 'PostModel', parent_id: Optional[int]) -> None:
+        # Attach a childless row under parent_id (or make it top-level) and keep path/depth in step
+        from .thread_services import ThreadRepository
+        parent_model = session.get(PostModel, parent_id) if parent_id is not None else None
+        post_model.parent_id = parent_id
+        if parent_model is not None and parent_model.path is not None:
+            post_model.path = ThreadRepository.child_path(parent_model.path, post_model.id)
+            post_model.depth = parent_model.depth + 1
+        else:
+            post_model.path = ThreadRepository.child_path(None, post_model.id)
+            post_model.depth = 0
     
+    @staticmethod
+    def record_reply(session, post_model: 'PostModel') -> list:
+        # Count a reply just attached by set_parent on its parent and every ancestor and
+        # move their last activity up to it; returns the updated stats for apply_thread_stats
+        from .thread_services import ThreadRepository
+        from .forum_services import ForumStatsRepository
+        if post_model.parent_id is None or post_model.path is None:
+            return []
+        live = 0 if post_model.is_deleted else 1
+        if live:
+            ForumStatsRepository.bump(session, ForumStatsRepository.thread_forum_id(session, post_model.id), comments=1)
+        return PostRepository._bump_thread(session, ThreadRepository.ancestor_ids(post_model.path),
+                                           post_model.parent_id, live, post_model.created_at)
+
+    @staticmethod
+    def soft_delete(session, post_id: int, blank: Optional[str] = None) -> list:
+        # Flag a row deleted (and overwrite title and message with blank) and take it out of
+        # its ancestors' reply counts and its forum's stats; the flag is only set once, so
+        # repeated deletes count once
+        from .thread_services import ThreadRepository
+        from .forum_services import ForumStatsRepository
+        flagged = session.execute(
+            update(PostModel)
+            .where(PostModel.id == post_id, PostModel.is_deleted.is_not(True))
+            .values(is_deleted=True)
+            .returning(PostModel.parent_id, PostModel.path, PostModel.forum_id)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if blank is not None:
+            session.execute(update(PostModel).where(PostModel.id == post_id)
+                            .values(title=blank, message=blank).execution_options(synchronize_session=False))
+        if flagged is None:
+            return []
+        if flagged.parent_id is None:
+            ForumStatsRepository.bump(session, flagged.forum_id, posts=-1)
+            return []
+        ForumStatsRepository.bump(session, ForumStatsRepository.thread_forum_id(session, post_id), comments=-1)
+        if flagged.path is None:
+            return []
+        return PostRepository._bump_thread(session, ThreadRepository.ancestor_ids(flagged.path), flagged.parent_id, -1)
+
+    @staticmethod
+    def _bump_thread(session, ancestor_ids: List[int], parent_id: int, delta: int, activity: Optional[datetime] = None) -> list:
+        # One UPDATE over the ancestors; RETURNING gives the new values for cached wrappers
+        values = {
+            'comment_count': PostModel.comment_count + case((PostModel.id == parent_id, delta), else_=0),
+            'descendant_count': PostModel.descendant_count + delta,
+        }
+        if activity is not None:
+            values['last_activity_at'] = func.max(func.coalesce(PostModel.last_activity_at, PostModel.created_at), activity)
+        return session.execute(
+            update(PostModel)
+            .where(PostModel.id.in_(ancestor_ids))
+            .values(**values)
+            .returning(PostModel.id, PostModel.comment_count, PostModel.descendant_count, PostModel.last_activity_at)
+            .execution_options(synchronize_session=False)
+        ).all()
+
+    @staticmethod
+    def apply_thread_stats(rows) -> None:
+        # Copy committed (id, comment_count, descendant_count, last_activity_at) rows onto cached wrappers
+        for post_id, comment_count, descendant_count, last_activity_at in rows:
+            post = registry_get('Post', post_id)
+            if post is not None:
+                post.comment_count = comment_count
+                post.descendant_count = descendant_count
+                post.last_activity_at = last_activity_at
+
+    @staticmethod
+    def rebuild_thread_stats(session=None) -> int:
+        # Recompute every post's thread stats from its subtree; returns the rows updated
+        close_session = False
+        if session is None:
+            session = SessionLocal()
+            close_session = True
+        try:
+            begin_write(session)
+            updated = session.execute(text(PostRepository.REBUILD_THREAD_STATS_SQL)).rowcount
+            session.commit()
+            return updated
+        finally:
+            if close_session:
+                session.close()
+
+    @staticmethod
+    def load_forum_page(forum_id: int, limit: int, after: Optional[tuple] = None, session=None,
+                        sort: str = 'created') -> Tuple[List['PostModel'], bool]:
+        # Keyset page of a forum's posts ordered by (sort key, id), see LISTING_SORTS;
+        # after is the (key, id) of the last row seen.
+        # Only the page rows are loaded; an EXISTS probe tells if more follow.
+        column, descending, _ = PostRepository.LISTING_SORTS[sort]
+
+        def past(value, post_id):
+            if descending:
+                return or_(column < value, and_(column == value, PostModel.id < post_id))
+            return or_(column > value, and_(column == value, PostModel.id > post_id))
+
+        close_session = False
+        if session is None:
+            session = SessionLocal()
+            close_session = True
+        try:
+            query = session.query(PostModel).filter(PostModel.forum_id == forum_id)
+            if after is not None:
+                query = query.filter(past(*after))
+            order = (column.desc(), PostModel.id.desc()) if descending else (column, PostModel.id)
+            page = query.order_by(*order).limit(limit).all()
+            has_more = False
+            if len(page) == limit:
+                last = page[-1]
+                has_more = session.query(query.filter(past(getattr(last, column.key), last.id)).exists()).scalar()
+            return page, bool(has_more)
+        finally:
+            if close_session:
+                session.close()
+
     @staticmethod
     def get_comments(post: 'Post') -> list:
         # Load comments from DB
@@ -54,21 +210,14 @@ class PostRepository:
                 return post.comments
             db_comments = session.query(PostModel).filter(PostModel.parent_id == getattr(post, 'db_id', None)).all()
             # reuse in-memory comment wrappers when possible
-            comments = []
-            for db_comment in db_comments:
-                found = None
-                for c in post.comments:
-                    if getattr(c, 'db_id', None) == getattr(db_comment, 'id', None):
-                        found = c
-                        break
-                if found is not None:
-                    comments.append(found)
-                else:
-                    c = Post.from_model(db_comment, session=session)
-                    c.parent = post
-                    post.comments.append(c)
-                    comments.append(c)
-            return comments
+            known = {getattr(c, 'db_id', None): c for c in post.comments}
+            # build every missing comment and its replies in one pass
+            missing = [db_comment for db_comment in db_comments if db_comment.id not in known]
+            for c in Post.from_models(missing, session=session):
+                c.parent = post
+                add_unique(post, post.comments, c)
+                known[c.db_id] = c
+            return [known[db_comment.id] for db_comment in db_comments]
         finally:
             session.close()
     
@@ -81,14 +230,11 @@ class PostRepository:
             if getattr(post, 'db_id', None) is None:
                 return post.reactions
             db_reactions = session.query(ReactionModel).filter(ReactionModel.parent_id == getattr(post, 'db_id', None)).all()
+            known = {getattr(r, 'db_id', None): r for r in post.reactions}
             reactions = []
             for r_model in db_reactions:
                 # prefer existing reaction wrappers
-                found = None
-                for r in post.reactions:
-                    if getattr(r, 'db_id', None) == getattr(r_model, 'id', None):
-                        found = r
-                        break
+                found = known.get(r_model.id)
                 if found is not None:
                     found.parent = post
                     reactions.append(found)
@@ -96,7 +242,7 @@ class PostRepository:
                     r = Reaction.from_model(r_model, session=session)
                     r.parent = post
                     # add to list
-                    post.reactions.append(r)
+                    add_unique(post, post.reactions, r)
                     reactions.append(r)
             return reactions
         finally:
@@ -123,6 +269,14 @@ class PostRepository:
 
 # Manage Reaction DB methods
 class ReactionRepository:
+
+    # Recompute post_reaction_counts from the reactions table
+    REBUILD_COUNTS_SQL = '''
+        INSERT INTO post_reaction_counts (post_id, reaction_type, count)
+        SELECT parent_id, reaction_type, COUNT(*) FROM reactions
+        WHERE parent_id IS NOT NULL
+        GROUP BY parent_id, reaction_type
+    '''
     
     @staticmethod
     def find_by_type_user_parent(reaction_type: str, user_id: int, parent_id: Optional[int]) -> Optional['ReactionModel']:
@@ -137,6 +291,148 @@ class ReactionRepository:
         finally:
             session.close()
     
+    @staticmethod
+    def get_or_create(reaction_type: str, user_id: int, parent_id: Optional[int] = None) -> Tuple['ReactionModel', bool]:
+        # Insert the reaction or find it; a new reaction is one statement. Rows without a
+        # parent never conflict (NULLs are distinct in the unique index), like create()
+        session = SessionLocal()
+        try:
+            reaction_model, created = get_or_insert(
+                session, ReactionModel, ['reaction_type', 'user_id', 'parent_id'],
+                dict(reaction_type=reaction_type, user_id=user_id, parent_id=parent_id))
+            if created:
+                # detached first so the commit does not expire what RETURNING loaded
+                session.expunge(reaction_model)
+                session.commit()
+            return reaction_model, created
+        finally:
+            session.close()
+
+    @staticmethod
+    def toggle(session, reaction_type: str, user_id: int, parent_id: int,
+               reuse_id: Optional[int] = None) -> Tuple[bool, int]:
+        # Flip (parent, user, type) on or off; returns (added, reaction id). The caller holds
+        # the write lock (begin_write), so the delete-or-insert pair sees no other writer
+        # in between. reuse_id names a parentless row to attach instead of inserting one.
+        key = (ReactionModel.parent_id == parent_id, ReactionModel.user_id == user_id,
+               ReactionModel.reaction_type == reaction_type)
+        reaction_id = session.execute(delete(ReactionModel).where(*key).returning(ReactionModel.id)).scalar()
+        added = reaction_id is None
+        if added and reuse_id is not None:
+            reaction_id = session.execute(
+                update(ReactionModel)
+                .where(ReactionModel.id == reuse_id, ReactionModel.parent_id.is_(None),
+                       ReactionModel.user_id == user_id, ReactionModel.reaction_type == reaction_type)
+                .values(parent_id=parent_id)
+                .returning(ReactionModel.id)).scalar()
+        if added and reaction_id is None:
+            reaction_id = session.execute(
+                sqlite_insert(ReactionModel)
+                .values(reaction_type=reaction_type, user_id=user_id, parent_id=parent_id)
+                .on_conflict_do_nothing(index_elements=['reaction_type', 'user_id', 'parent_id'])
+                .returning(ReactionModel.id)).scalar()
+            if reaction_id is None:
+                # only reachable without the write lock: someone else added it first
+                reaction_id = session.execute(select(ReactionModel.id).where(*key)).scalar()
+        track_unit_of_work_rows(session, ('Reaction', reaction_id), ('Post', parent_id))
+        return added, reaction_id
+
+    @staticmethod
+    def count_by_type(parent_id: int, session=None) -> Dict[str, int]:
+        # Reactions on one post per type, every valid type present (0 when unused)
+        return ReactionRepository.counts_for([parent_id], session=session).get(parent_id) or ReactionRepository.zero_counts()
+
+    @staticmethod
+    def zero_counts() -> Dict[str, int]:
+        # Every valid reaction type at 0
+        from backend.Messages import Reaction
+        return dict.fromkeys(Reaction.VALID_REACTION_TYPES, 0)
+
+    @staticmethod
+    def counts_for(post_ids, session=None) -> Dict[int, Dict[str, int]]:
+        # Per-type counts for many posts from the counter table (posts without
+        # reactions are left out); post_ids is a list or a select of ids.
+        # Toggles still waiting in the write-behind buffer are included.
+        close_session = False
+        if session is None:
+            session = SessionLocal()
+            close_session = True
+
+        def _read() -> Dict[int, Dict[str, int]]:
+            counts: Dict[int, Dict[str, int]] = {}
+            rows = session.execute(select(PostReactionCountModel.post_id, PostReactionCountModel.reaction_type,
+                                          PostReactionCountModel.count)
+                                   .where(PostReactionCountModel.post_id.in_(post_ids)))
+            for post_id, reaction_type, count in rows:
+                counts.setdefault(post_id, ReactionRepository.zero_counts())[reaction_type] = count
+            return counts
+
+        try:
+            if not ReactionBuffer.has_entries():
+                return _read()
+            return ReactionBuffer.read_merged(
+                _read, lambda: ReactionRepository._buffered_among(session, post_ids),
+                lambda counts, layers: ReactionBuffer.overlay_counts(counts, layers, ReactionRepository.zero_counts))
+        finally:
+            if close_session:
+                session.close()
+
+    @staticmethod
+    def types_by_user(post_ids, user_id: int, session=None) -> Dict[int, List[str]]:
+        # Reaction types user_id has left on each of the posts, buffered toggles included
+        close_session = False
+        if session is None:
+            session = SessionLocal()
+            close_session = True
+
+        def _read() -> Dict[int, List[str]]:
+            reacted: Dict[int, List[str]] = {}
+            rows = session.execute(select(ReactionModel.parent_id, ReactionModel.reaction_type)
+                                   .where(ReactionModel.user_id == user_id, ReactionModel.parent_id.in_(post_ids))
+                                   .order_by(ReactionModel.id))
+            for post_id, reaction_type in rows:
+                reacted.setdefault(post_id, []).append(reaction_type)
+            return reacted
+
+        try:
+            if not ReactionBuffer.has_entries():
+                return _read()
+            return ReactionBuffer.read_merged(
+                _read, lambda: ReactionRepository._buffered_among(session, post_ids),
+                lambda reacted, layers: ReactionBuffer.overlay_types(reacted, layers, user_id))
+        finally:
+            if close_session:
+                session.close()
+
+    @staticmethod
+    def _buffered_among(session, post_ids) -> List[int]:
+        # Posts in post_ids (a list or a select) with toggles in the write-behind buffer
+        buffered = ReactionBuffer.buffered_post_ids()
+        if not buffered:
+            return []
+        if isinstance(post_ids, (list, tuple, set, frozenset)):
+            wanted = set(post_ids)
+            return [post_id for post_id in buffered if post_id in wanted]
+        return list(session.execute(select(PostModel.id).where(PostModel.id.in_(buffered),
+                                                               PostModel.id.in_(post_ids))).scalars())
+
+    @staticmethod
+    def rebuild_counts(session=None) -> int:
+        # Recompute every counter row from reactions; returns the number of rows written
+        close_session = False
+        if session is None:
+            session = SessionLocal()
+            close_session = True
+        try:
+            begin_write(session)
+            session.execute(delete(PostReactionCountModel))
+            written = session.execute(text(ReactionRepository.REBUILD_COUNTS_SQL)).rowcount
+            session.commit()
+            return written
+        finally:
+            if close_session:
+                session.close()
+
     @staticmethod
     def create(reaction_type: str, user_id: int, parent_id: Optional[int] = None) -> 'ReactionModel':
         # Add reaction to DB
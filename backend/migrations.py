@@ -0,0 +1,241 @@
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy import inspect
+
+'''
+Versioned schema migrations for the SQLite database.
+
+The schema version is kept in PRAGMA user_version. init_db creates any
+missing tables from the models and then runs every migration newer than the
+stored version, in order. Each migration runs in its own transaction together
+with the version bump, so a failed step leaves the database at the previous
+version and is retried on the next start.
+
+Migrations are frozen once released: later schema changes get a new version
+rather than editing an old step.
+'''
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+
+def migration(version: int, description: str):
+    # Register a migration step; versions must be added in increasing order
+    def decorator(fn):
+        if MIGRATIONS and MIGRATIONS[-1][0] >= version:
+            raise ValueError(f"Migration {version} is out of order")
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return decorator
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(conn) -> int:
+    return conn.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def _add_column(conn, table: str, column: str, ddl: str) -> bool:
+    cols = [c['name'] for c in inspect(conn).get_columns(table)]
+    if column in cols:
+        return False
+    conn.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}')
+    return True
+
+
+def _merge_duplicates(conn, table: str, key: str, references: List[Tuple[str, str]], memberships: List[str], member_column: str) -> None:
+    # Fold rows sharing `key` into the lowest id: repoint foreign keys, move
+    # association rows (skipping ones the kept row already has), then delete the rest
+    conn.exec_driver_sql(f'''
+        CREATE TEMP TABLE merge_map AS
+        SELECT t.id AS old_id, k.keep_id AS new_id
+        FROM {table} t
+        JOIN (SELECT {key}, MIN(id) AS keep_id FROM {table} GROUP BY {key} HAVING COUNT(*) > 1) k
+          ON t.{key} = k.{key}
+        WHERE t.id <> k.keep_id
+    ''')
+    try:
+        if not conn.exec_driver_sql('SELECT COUNT(*) FROM merge_map').scalar():
+            return
+        for ref_table, ref_column in references:
+            conn.exec_driver_sql(f'''
+                UPDATE {ref_table}
+                SET {ref_column} = (SELECT new_id FROM merge_map WHERE old_id = {ref_table}.{ref_column})
+                WHERE {ref_column} IN (SELECT old_id FROM merge_map)
+            ''')
+        other = 'forum_id' if member_column == 'user_id' else 'user_id'
+        for assoc in memberships:
+            conn.exec_driver_sql(f'''
+                INSERT OR IGNORE INTO {assoc} ({other}, {member_column})
+                SELECT a.{other}, m.new_id FROM {assoc} a JOIN merge_map m ON a.{member_column} = m.old_id
+            ''')
+            conn.exec_driver_sql(f'DELETE FROM {assoc} WHERE {member_column} IN (SELECT old_id FROM merge_map)')
+        conn.exec_driver_sql(f'DELETE FROM {table} WHERE id IN (SELECT old_id FROM merge_map)')
+    finally:
+        conn.exec_driver_sql('DROP TABLE merge_map')
+
+
+@migration(1, 'add created_at, path and depth columns')
+def _add_thread_columns(conn):
+    # Columns that used to be patched in by init_db's ensure_column
+    for table in ('forums', 'posts'):
+        if _add_column(conn, table, 'created_at', 'TIMESTAMP'):
+            conn.exec_driver_sql(f'UPDATE {table} SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL')
+    _add_column(conn, 'posts', 'path', 'VARCHAR')
+    _add_column(conn, 'posts', 'depth', 'INTEGER NOT NULL DEFAULT 0')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_posts_path ON posts (path)')
+
+
+@migration(2, 'backfill thread paths')
+def _backfill_paths(conn):
+    # Path and depth for every row missing one, in one recursive statement; rows
+    # whose parent is gone count as top-level. Ids are zero-padded to 10 digits.
+    conn.exec_driver_sql('''
+        WITH RECURSIVE paths (id, path, depth) AS (
+            SELECT id, printf('%010d', id), 0 FROM posts
+            WHERE parent_id IS NULL OR parent_id NOT IN (SELECT id FROM posts)
+            UNION ALL
+            SELECT child.id, paths.path || '/' || printf('%010d', child.id), paths.depth + 1
+            FROM posts child JOIN paths ON child.parent_id = paths.id
+        )
+        UPDATE posts
+        SET path = (SELECT path FROM paths WHERE paths.id = posts.id),
+            depth = (SELECT depth FROM paths WHERE paths.id = posts.id)
+        WHERE path IS NULL
+    ''')
+
+
+@migration(3, 'merge duplicate users, forums and reactions')
+def _merge_duplicate_rows(conn):
+    # The unique indexes in the next step would fail on old duplicates
+    memberships = ['forum_users', 'forum_authorized', 'forum_restricted']
+    _merge_duplicates(conn, 'users', 'email', [('posts', 'poster_id'), ('reactions', 'user_id')], memberships, 'user_id')
+    _merge_duplicates(conn, 'forums', 'course_name', [('posts', 'forum_id')], memberships, 'forum_id')
+    conn.exec_driver_sql('''
+        DELETE FROM reactions WHERE id NOT IN (
+            SELECT MIN(id) FROM reactions GROUP BY reaction_type, user_id, parent_id
+        )
+    ''')
+
+
+@migration(4, 'index foreign keys and lookup columns')
+def _add_lookup_indexes(conn):
+    # Names match the index declarations in models.py so fresh databases agree
+    for statement in (
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email)',
+        'CREATE INDEX IF NOT EXISTS ix_users_username ON users (username)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_forums_course_name ON forums (course_name)',
+        'CREATE INDEX IF NOT EXISTS ix_posts_forum_created ON posts (forum_id, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_posts_parent_id ON posts (parent_id)',
+        'CREATE INDEX IF NOT EXISTS ix_posts_poster_id ON posts (poster_id)',
+        'CREATE INDEX IF NOT EXISTS ix_reactions_parent_id ON reactions (parent_id)',
+        'CREATE INDEX IF NOT EXISTS ix_reactions_user_id ON reactions (user_id)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_reactions_type_user_parent ON reactions (reaction_type, user_id, parent_id)',
+        'CREATE INDEX IF NOT EXISTS ix_forum_users_user_id ON forum_users (user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_forum_authorized_user_id ON forum_authorized (user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_forum_restricted_user_id ON forum_restricted (user_id)',
+    ):
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql('ANALYZE')
+
+
+@migration(5, 'add the row change log')
+def _add_row_changes(conn):
+    # Read by other worker processes to drop stale cached wrappers (coherence.py)
+    conn.exec_driver_sql('''
+        CREATE TABLE IF NOT EXISTS row_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind VARCHAR NOT NULL,
+            row_id INTEGER NOT NULL,
+            path VARCHAR,
+            origin VARCHAR NOT NULL
+        )
+    ''')
+
+
+@migration(6, 'add per-post reaction counters')
+def _add_reaction_counts(conn):
+    # Same table and triggers as models.py declares for fresh databases
+    from .models import REACTION_COUNT_TRIGGERS
+    conn.exec_driver_sql('''
+        CREATE TABLE IF NOT EXISTS post_reaction_counts (
+            post_id INTEGER NOT NULL REFERENCES posts (id),
+            reaction_type VARCHAR NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (post_id, reaction_type)
+        )
+    ''')
+    for statement in REACTION_COUNT_TRIGGERS:
+        conn.exec_driver_sql(statement)
+    # create_all may already have made the table (with triggers) on a new database
+    from .messages_services import ReactionRepository
+    conn.exec_driver_sql('DELETE FROM post_reaction_counts')
+    conn.exec_driver_sql(ReactionRepository.REBUILD_COUNTS_SQL)
+
+
+@migration(7, 'add per-post thread stats')
+def _add_thread_stats(conn):
+    # Same columns and indexes as models.py declares for fresh databases
+    _add_column(conn, 'posts', 'comment_count', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(conn, 'posts', 'descendant_count', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(conn, 'posts', 'last_activity_at', 'DATETIME')
+    from .messages_services import PostRepository
+    conn.exec_driver_sql(PostRepository.REBUILD_THREAD_STATS_SQL)
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_posts_forum_activity ON posts (forum_id, last_activity_at, id)')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_posts_forum_replies ON posts (forum_id, descendant_count, id)')
+    conn.exec_driver_sql('ANALYZE')
+
+
+@migration(8, 'add per-forum stats')
+def _add_forum_stats(conn):
+    # Same table and triggers as models.py declares for fresh databases
+    from .models import FORUM_STATS_TRIGGERS
+    conn.exec_driver_sql('''
+        CREATE TABLE IF NOT EXISTS forum_stats (
+            forum_id INTEGER NOT NULL REFERENCES forums (id),
+            member_count INTEGER NOT NULL,
+            post_count INTEGER NOT NULL,
+            comment_count INTEGER NOT NULL,
+            reaction_count INTEGER NOT NULL,
+            last_post_at DATETIME,
+            PRIMARY KEY (forum_id)
+        )
+    ''')
+    for statement in FORUM_STATS_TRIGGERS:
+        conn.exec_driver_sql(statement)
+    from .forum_services import ForumStatsRepository
+    conn.exec_driver_sql('DELETE FROM forum_stats')
+    conn.exec_driver_sql(ForumStatsRepository.REBUILD_SQL)
+
+
+def migrate(bind=None, target: Optional[int] = None) -> List[int]:
+    # Bring the database up to target (default: latest) and return the versions applied
+    if bind is None:
+        from .db import engine
+        bind = engine
+    target = latest_version() if target is None else target
+    applied = []
+    for version, description, fn in MIGRATIONS:
+        if version > target:
+            break
+        with bind.connect() as conn:
+            if current_version(conn) >= version:
+                continue
+            # pysqlite does not open transactions for DDL on its own; BEGIN IMMEDIATE
+            # also takes the write lock so two processes cannot run the same step
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            try:
+                if current_version(conn) < version:
+                    fn(conn)
+                    conn.exec_driver_sql(f'PRAGMA user_version = {int(version)}')
+                    applied.append(version)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    return applied
+
+
+if __name__ == "__main__":
+    done = migrate()
+    print(f"Applied migrations: {done}" if done else f"Already at version {latest_version()}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, Table, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, Table, DateTime, Index, DDL, event
 from datetime import datetime
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.hybrid import hybrid_property
@@ -10,6 +10,7 @@ forum_users = Table(
     Base.metadata,
     Column("forum_id", Integer, ForeignKey("forums.id"), primary_key=True),
     Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Index("ix_forum_users_user_id", "user_id"),
 )
 
 # table for authorized Users
@@ -18,6 +19,7 @@ forum_authorized = Table(
     Base.metadata,
     Column("forum_id", Integer, ForeignKey("forums.id"), primary_key=True),
     Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Index("ix_forum_authorized_user_id", "user_id"),
 )
 
 # table for restricted Users
@@ -26,14 +28,17 @@ forum_restricted = Table(
     Base.metadata,
     Column("forum_id", Integer, ForeignKey("forums.id"), primary_key=True),
     Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Index("ix_forum_restricted_user_id", "user_id"),
 )
 
+# Index names below are mirrored by backend/migrations.py for existing databases
+
 
 class UserModel(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, nullable=False)
-    email = Column(String, nullable=False)
+    username = Column(String, nullable=False, index=True)
+    email = Column(String, nullable=False, unique=True, index=True)
     major = Column(String, nullable=False)
     year = Column(Integer, nullable=False)
     is_deleted = Column(Boolean, default=False)
@@ -48,7 +53,7 @@ class UserModel(Base):
 class ForumModel(Base):
     __tablename__ = "forums"
     id = Column(Integer, primary_key=True, index=True)
-    course_name = Column(String, nullable=False)
+    course_name = Column(String, nullable=False, unique=True, index=True)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
 
     posts = relationship("PostModel", back_populates="forum")
@@ -57,16 +62,37 @@ class ForumModel(Base):
     restricted_users = relationship("UserModel", secondary=forum_restricted, backref="restricted_forums")
 
 
+def _activity_default(context):
+    # a new row's last activity is its own creation
+    return context.get_current_parameters().get("created_at") or datetime.utcnow()
+
+
 class PostModel(Base):
     __tablename__ = "posts"
+    # forum listings filter on forum_id and page by (sort key, id), see PostRepository.LISTING_SORTS
+    __table_args__ = (
+        Index("ix_posts_forum_created", "forum_id", "created_at", "id"),
+        Index("ix_posts_forum_activity", "forum_id", "last_activity_at", "id"),
+        Index("ix_posts_forum_replies", "forum_id", "descendant_count", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
-    poster_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    poster_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
     forum_id = Column(Integer, ForeignKey("forums.id"), nullable=True)
     title = Column(String, nullable=False)
     message = Column(Text, nullable=False)
     is_deleted = Column(Boolean, default=False)
-    parent_id = Column(Integer, ForeignKey("posts.id"), nullable=True)
+    parent_id = Column(Integer, ForeignKey("posts.id"), nullable=True, index=True)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # Materialized path: zero-padded ids from the top-level post down, joined by '/'.
+    # Sorting by path gives thread display order and a subtree is one range scan.
+    path = Column(String, nullable=True, index=True)
+    depth = Column(Integer, nullable=False, default=0)
+    # Thread stats kept by PostRepository.record_reply / soft_delete so listings need
+    # not load the comment tree: live direct replies, live replies at any depth, and
+    # the newest created_at in the thread below (deleting a reply is not activity)
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
+    descendant_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_activity_at = Column(DateTime, nullable=True, default=_activity_default)
 
     poster = relationship("UserModel", back_populates="posts")
     forum = relationship("ForumModel", back_populates="posts")
@@ -80,10 +106,89 @@ class PostModel(Base):
 
 class ReactionModel(Base):
     __tablename__ = "reactions"
+    # one reaction of each type per user and post
+    __table_args__ = (Index("ux_reactions_type_user_parent", "reaction_type", "user_id", "parent_id", unique=True),)
     id = Column(Integer, primary_key=True, index=True)
     reaction_type = Column(String, nullable=False)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    parent_id = Column(Integer, ForeignKey("posts.id"), nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    parent_id = Column(Integer, ForeignKey("posts.id"), nullable=True, index=True)
 
     user = relationship("UserModel", back_populates="reactions")
     parent = relationship("PostModel", back_populates="reactions")
+
+
+class PostReactionCountModel(Base):
+    # Reactions per post and type, kept by the triggers below so feeds can show
+    # counts without reading every reaction row. Rebuilt by backend/rebuild_counters.py.
+    __tablename__ = "post_reaction_counts"
+    post_id = Column(Integer, ForeignKey("posts.id"), primary_key=True)
+    reaction_type = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+# Triggers on reactions that keep post_reaction_counts in step, inside the
+# writing statement's transaction. Mirrored by backend/migrations.py.
+_COUNT_UP = ("INSERT INTO post_reaction_counts (post_id, reaction_type, count) "
+             "SELECT NEW.parent_id, NEW.reaction_type, 1 WHERE NEW.parent_id IS NOT NULL "
+             "ON CONFLICT (post_id, reaction_type) DO UPDATE SET count = count + 1;")
+_COUNT_DOWN = ("UPDATE post_reaction_counts SET count = count - 1 "
+               "WHERE post_id = OLD.parent_id AND reaction_type = OLD.reaction_type; "
+               "DELETE FROM post_reaction_counts "
+               "WHERE post_id = OLD.parent_id AND reaction_type = OLD.reaction_type AND count <= 0;")
+REACTION_COUNT_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS reaction_counts_insert AFTER INSERT ON reactions BEGIN {_COUNT_UP} END",
+    f"CREATE TRIGGER IF NOT EXISTS reaction_counts_delete AFTER DELETE ON reactions BEGIN {_COUNT_DOWN} END",
+    f"CREATE TRIGGER IF NOT EXISTS reaction_counts_update AFTER UPDATE OF parent_id, reaction_type ON reactions "
+    f"BEGIN {_COUNT_DOWN} {_COUNT_UP} END",
+]
+for _statement in REACTION_COUNT_TRIGGERS:
+    event.listen(ReactionModel.__table__, "after_create", DDL(_statement))
+
+
+class ForumStatsModel(Base):
+    # Per-forum totals so forum pages and the stats endpoint never count posts.
+    # Members, posts and replies are kept by ForumStatsRepository from the
+    # membership and post services; reactions by the triggers below. Counts
+    # leave out soft-deleted posts and replies. Rebuilt by backend/rebuild_counters.py.
+    __tablename__ = "forum_stats"
+    forum_id = Column(Integer, ForeignKey("forums.id"), primary_key=True)
+    member_count = Column(Integer, nullable=False, default=0)
+    post_count = Column(Integer, nullable=False, default=0)
+    comment_count = Column(Integer, nullable=False, default=0)
+    reaction_count = Column(Integer, nullable=False, default=0)
+    last_post_at = Column(DateTime, nullable=True)
+
+
+# Triggers on reactions that move forum_stats.reaction_count with every reaction
+# write; the forum is the one of the thread's top-level post (first path segment,
+# 10 = thread_services.PATH_WIDTH digits).
+# Mirrored by backend/migrations.py.
+def _forum_reaction_delta(row: str, sign: str) -> str:
+    return (f"UPDATE forum_stats SET reaction_count = reaction_count {sign} 1 WHERE forum_id = "
+            f"(SELECT root.forum_id FROM posts p JOIN posts root ON root.id = CAST(substr(p.path, 1, 10) AS INTEGER) "
+            f"WHERE p.id = {row}.parent_id);")
+
+
+FORUM_STATS_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS forum_stats_reaction_insert AFTER INSERT ON reactions "
+    f"BEGIN {_forum_reaction_delta('NEW', '+')} END",
+    f"CREATE TRIGGER IF NOT EXISTS forum_stats_reaction_delete AFTER DELETE ON reactions "
+    f"BEGIN {_forum_reaction_delta('OLD', '-')} END",
+    f"CREATE TRIGGER IF NOT EXISTS forum_stats_reaction_update AFTER UPDATE OF parent_id ON reactions "
+    f"BEGIN {_forum_reaction_delta('OLD', '-')} {_forum_reaction_delta('NEW', '+')} END",
+]
+for _statement in FORUM_STATS_TRIGGERS:
+    event.listen(ReactionModel.__table__, "after_create", DDL(_statement))
+
+
+class RowChangeModel(Base):
+    # Change log read by other worker processes to drop stale wrappers (see coherence.py).
+    # Rows are written by per-connection triggers, never through the ORM.
+    __tablename__ = "row_changes"
+    # AUTOINCREMENT so ids are never reused after old entries are pruned
+    __table_args__ = {"sqlite_autoincrement": True}
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    path = Column(String, nullable=True)
+    origin = Column(String, nullable=False)
@@ -1,23 +1,317 @@
-'''Simple in-memory registry to preserve wrapper identity by db id.
+'''Identity registry for wrappers, keyed by kind ('User', 'Post', ...) and db id.
 
 This helps the test suite which expects the same Python wrapper objects
 to be returned after DB-backed loading.
+
+The registry is bounded so a long-running server does not keep every wrapper
+it ever loaded. Each kind holds its most recently used wrappers strongly (LRU,
+SCU_FORUMS_REGISTRY_CAPACITY, or SCU_FORUMS_REGISTRY_CAPACITY_<KIND> per kind)
+and tracks every wrapper weakly, so a wrapper pushed out of the LRU keeps its
+identity for as long as anything else still references it. With
+SCU_FORUMS_REGISTRY_POLICY=weak nothing is held strongly at all.
+
+Each kind is split into SCU_FORUMS_REGISTRY_STRIPES shards by db id, each with
+its own lock, so concurrent requests only contend when they touch ids in the
+same shard. get_or_register makes check-then-register atomic.
+Wrapper list mutations go through add_unique / discard, which lock a stripe
+picked by the owning wrapper.
 '''
-_REGISTRY = {}
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, Optional
+
+DEFAULT_CAPACITY = int(os.environ.get('SCU_FORUMS_REGISTRY_CAPACITY', 5000))
+DEFAULT_POLICY = os.environ.get('SCU_FORUMS_REGISTRY_POLICY', 'lru').lower()
+POLICIES = ('lru', 'weak')
+STRIPES = int(os.environ.get('SCU_FORUMS_REGISTRY_STRIPES', 16))
+# small registries use fewer stripes so the LRU bound stays meaningful per shard
+MIN_STRIPE_CAPACITY = 64
+
+
+class IdentityCache:
+    # Wrappers of one kind: an LRU of strong references over a map of weak ones
+
+    def __init__(self, kind: str, capacity: int = DEFAULT_CAPACITY, policy: str = DEFAULT_POLICY) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown registry policy {policy!r}; expected one of {POLICIES}")
+        if capacity < 0:
+            raise ValueError("Registry capacity cannot be negative")
+        self.kind = kind
+        self.capacity = capacity
+        self.policy = policy
+        self.lock = threading.RLock()
+        self._strong: 'OrderedDict[int, object]' = OrderedDict()
+        self._weak: Dict[int, weakref.ref] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0   # dropped from the LRU (may still be alive elsewhere)
+        self.collected = 0   # garbage collected after nothing referenced them
+
+    def get(self, db_id: int):
+        with self.lock:
+            obj = self._strong.get(db_id)
+            if obj is not None:
+                self._strong.move_to_end(db_id)
+                self.hits += 1
+                return obj
+            ref = self._weak.get(db_id)
+            obj = ref() if ref is not None else None
+            if obj is None:
+                self.misses += 1
+                return None
+            # still alive outside the cache: same wrapper, back to the front of the LRU
+            self.hits += 1
+            self._hold(db_id, obj)
+            return obj
+
+    def put(self, db_id: int, obj) -> None:
+        with self.lock:
+            self._weak[db_id] = weakref.ref(obj, self._on_collect(db_id))
+            self._hold(db_id, obj)
+
+    def get_or_register(self, db_id: int, obj):
+        # Register obj unless a live wrapper already exists; returns the one that won
+        with self.lock:
+            existing = self.get(db_id)
+            if existing is not None:
+                return existing
+            self.put(db_id, obj)
+            return obj
+
+    def discard(self, db_id: int) -> None:
+        with self.lock:
+            self._strong.pop(db_id, None)
+            self._weak.pop(db_id, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self._strong.clear()
+            self._weak.clear()
+
+    def resize(self, capacity: int) -> None:
+        if capacity < 0:
+            raise ValueError("Registry capacity cannot be negative")
+        with self.lock:
+            self.capacity = capacity
+            self._trim()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'policy': self.policy,
+                'capacity': self.capacity,
+                'strong': len(self._strong),
+                'tracked': len(self._weak),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'collected': self.collected,
+            }
+
+    def _hold(self, db_id: int, obj) -> None:
+        if self.policy == 'weak':
+            return
+        self._strong[db_id] = obj
+        self._strong.move_to_end(db_id)
+        self._trim()
+
+    def _trim(self) -> None:
+        while len(self._strong) > self.capacity:
+            self._strong.popitem(last=False)
+            self.evictions += 1
+
+    def _on_collect(self, db_id: int):
+        # weakref callback; ignore refs that were already replaced or discarded
+        owner = weakref.ref(self)
+
+        def callback(ref):
+            cache = owner()
+            if cache is None:
+                return
+            with cache.lock:
+                if cache._weak.get(db_id) is ref:
+                    del cache._weak[db_id]
+                    cache.collected += 1
+        return callback
+
+
+class StripedCache:
+    # One kind split into independently locked IdentityCache shards by db id
+
+    COUNTERS = ('strong', 'tracked', 'hits', 'misses', 'evictions', 'collected')
+    RETIRED = ('hits', 'misses', 'evictions', 'collected')
+
+    def __init__(self, kind: str, capacity: int = DEFAULT_CAPACITY, policy: str = DEFAULT_POLICY, stripes: int = STRIPES) -> None:
+        if stripes < 1:
+            raise ValueError("Registry needs at least one stripe")
+        if capacity < 0:
+            raise ValueError("Registry capacity cannot be negative")
+        self.kind = kind
+        self.policy = policy
+        self.capacity = capacity
+        self.max_stripes = stripes
+        self.shards = self._build(capacity)
+        # counters from shards replaced by resize()
+        self._retired = {name: 0 for name in self.RETIRED}
+
+    def _build(self, capacity: int):
+        count = max(1, min(self.max_stripes, capacity // MIN_STRIPE_CAPACITY))
+        # spread capacity exactly so the shards together never hold more than capacity
+        return [IdentityCache(self.kind, capacity // count + (1 if i < capacity % count else 0), self.policy)
+                for i in range(count)]
+
+    def shard(self, db_id: int) -> IdentityCache:
+        return self.shards[db_id % len(self.shards)]
+
+    def get(self, db_id: int):
+        return self.shard(db_id).get(db_id)
+
+    def put(self, db_id: int, obj) -> None:
+        self.shard(db_id).put(db_id, obj)
+
+    def get_or_register(self, db_id: int, obj):
+        return self.shard(db_id).get_or_register(db_id, obj)
+
+    def discard(self, db_id: int) -> None:
+        self.shard(db_id).discard(db_id)
+
+    def clear(self) -> None:
+        for shard in self.shards:
+            shard.clear()
+
+    def resize(self, capacity: int) -> None:
+        # Re-shard and carry over live wrappers, most recently used last so they stay held.
+        # Meant for configuration time; lookups racing a resize may miss and reload.
+        if capacity < 0:
+            raise ValueError("Registry capacity cannot be negative")
+        old_shards = self.shards
+        live, recent = [], []
+        for shard in old_shards:
+            with shard.lock:
+                live.extend((db_id, ref()) for db_id, ref in shard._weak.items())
+                recent.extend(shard._strong.items())
+        shards = self._build(capacity)
+        for db_id, obj in live + recent:
+            if obj is not None:
+                shards[db_id % len(shards)].put(db_id, obj)
+        for name in self.RETIRED:
+            self._retired[name] += sum(getattr(shard, name) for shard in old_shards)
+        self.capacity = capacity
+        self.shards = shards
+
+    def stats(self) -> dict:
+        totals = {name: self._retired.get(name, 0) for name in self.COUNTERS}
+        for shard in self.shards:
+            shard_stats = shard.stats()
+            for name in self.COUNTERS:
+                totals[name] += shard_stats[name]
+        return dict(policy=self.policy, capacity=self.capacity, stripes=len(self.shards), **totals)
+
+
+class Registry:
+    # One IdentityCache per kind, created on first use with the configured size
+
+    def __init__(self) -> None:
+        self._caches: Dict[str, StripedCache] = {}
+        self._settings: Dict[str, dict] = {}
+        # only guards creating/replacing a kind's cache, never lookups
+        self._lock = threading.Lock()
+
+    def cache(self, kind: str) -> StripedCache:
+        cache = self._caches.get(kind)
+        if cache is None:
+            with self._lock:
+                cache = self._caches.get(kind)
+                if cache is None:
+                    cache = self._new_cache(kind)
+        return cache
+
+    def _new_cache(self, kind: str) -> StripedCache:
+        settings = self._settings.get(kind, {})
+        env_capacity = os.environ.get(f'SCU_FORUMS_REGISTRY_CAPACITY_{kind.upper()}')
+        capacity = settings.get('capacity', int(env_capacity) if env_capacity else DEFAULT_CAPACITY)
+        cache = StripedCache(kind, capacity, settings.get('policy', DEFAULT_POLICY))
+        self._caches[kind] = cache
+        return cache
+
+    def configure(self, kind: str, capacity: Optional[int] = None, policy: Optional[str] = None) -> None:
+        # Change one kind's limits; a policy change starts that kind's cache afresh
+        with self._lock:
+            settings = self._settings.setdefault(kind, {})
+            if capacity is not None:
+                settings['capacity'] = capacity
+            if policy is not None:
+                settings['policy'] = policy
+            cache = self._caches.get(kind)
+            if cache is None:
+                return
+            if policy is not None and policy != cache.policy:
+                self._new_cache(kind)
+            elif capacity is not None:
+                cache.resize(capacity)
+
+    def clear(self) -> None:
+        for cache in list(self._caches.values()):
+            cache.clear()
+
+    def stats(self) -> Dict[str, dict]:
+        return {kind: cache.stats() for kind, cache in list(self._caches.items())}
+
+
+_REGISTRY = Registry()
 
 def register(kind: str, db_id: int, obj):
     if db_id is None:
         return
-    _REGISTRY.setdefault(kind, {})[int(db_id)] = obj
+    _REGISTRY.cache(kind).put(int(db_id), obj)
 
 def get(kind: str, db_id: int):
     if db_id is None:
         return None
-    return _REGISTRY.get(kind, {}).get(int(db_id))
+    return _REGISTRY.cache(kind).get(int(db_id))
+
+def get_or_register(kind: str, db_id: int, obj):
+    # Register obj unless another thread got there first; use the returned wrapper
+    if db_id is None:
+        return obj
+    return _REGISTRY.cache(kind).get_or_register(int(db_id), obj)
 
 def unregister(kind: str, db_id: int):
     if db_id is None:
         return
-    kind_map = _REGISTRY.get(kind)
-    if kind_map and int(db_id) in kind_map:
-        del kind_map[int(db_id)]
+    _REGISTRY.cache(kind).discard(int(db_id))
+
+def clear():
+    _REGISTRY.clear()
+
+def configure(kind: str, capacity: Optional[int] = None, policy: Optional[str] = None):
+    _REGISTRY.configure(kind, capacity, policy)
+
+def stats() -> Dict[str, dict]:
+    return _REGISTRY.stats()
+
+
+# Striped locks for wrapper lists (forum.users, post.comments, ...), picked by owner
+_LIST_LOCKS = [threading.RLock() for _ in range(STRIPES)]
+
+def mutation_lock(owner) -> threading.RLock:
+    # Hold for a compound check-then-change on one wrapper's lists; never nest two
+    return _LIST_LOCKS[hash(id(owner)) % len(_LIST_LOCKS)]
+
+def add_unique(owner, items: list, item) -> bool:
+    # Append item to one of owner's lists unless present; True if it was added
+    with mutation_lock(owner):
+        if item in items:
+            return False
+        items.append(item)
+        return True
+
+def discard(owner, items: list, item) -> bool:
+    # Remove item from one of owner's lists if present; True if it was removed
+    with mutation_lock(owner):
+        if item not in items:
+            return False
+        items.remove(item)
+        return True
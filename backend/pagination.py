@@ -0,0 +1,58 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+'''
+Helpers for keyset (cursor) pagination.
+
+A cursor is the sort key of the last row on a page, JSON encoded and made
+url safe. Datetimes are tagged so they round-trip back to datetime objects.
+'''
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(*values) -> str:
+    # Encode a sort key tuple as an opaque url-safe string
+    parts = [{'dt': v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(parts, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int, types: Optional[tuple] = None) -> tuple:
+    # Decode a cursor back into a sort key tuple of the given size (and types, if given)
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        parts = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(parts, list) or len(parts) != size:
+        raise ValueError("Invalid cursor")
+    values = []
+    for part in parts:
+        if isinstance(part, dict) and 'dt' in part:
+            try:
+                part = datetime.fromisoformat(part['dt'])
+            except (TypeError, ValueError):
+                raise ValueError("Invalid cursor")
+        values.append(part)
+    if types is not None:
+        for value, expected in zip(values, types):
+            if not isinstance(value, expected) or isinstance(value, bool):
+                raise ValueError("Invalid cursor")
+    return tuple(values)
+
+
+def parse_limit(value: Optional[str], default: int = DEFAULT_PAGE_SIZE, maximum: int = MAX_PAGE_SIZE, name: str = 'limit') -> int:
+    # Validate a positive integer query value such as ?limit= and clamp it to maximum
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer")
+    if limit < 1:
+        raise ValueError(f"{name} must be positive")
+    return min(limit, maximum)
@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Optional, Tuple
+from .object_registry import get as registry_get
+
+if TYPE_CHECKING:
+    from backend.User import User
+    from backend.Forum import Forum
+
+'''
+Permission resolution for the moderation endpoints.
+
+"Can user X moderate forum Y" is answered from two short-lived caches: actor
+emails to user ids (so a repeat request finds the wrapper in the registry
+instead of querying users by email) and (user id, forum id) to the decision.
+Entries expire after SCU_FORUMS_PERMISSION_TTL seconds (0 turns caching off).
+authorize/deauthorize/restrict/unrestrict drop the affected decision right
+away; changes made by other worker processes reach this one through the
+registry coherence log, or at the latest when the entry expires.
+'''
+
+PERMISSION_TTL = float(os.environ.get('SCU_FORUMS_PERMISSION_TTL', 30))
+PERMISSION_CACHE_SIZE = int(os.environ.get('SCU_FORUMS_PERMISSION_CACHE_SIZE', 10000))
+
+
+class TTLCache:
+    # Thread-safe map whose entries expire ttl seconds after they were stored;
+    # the oldest entries are dropped beyond capacity
+
+    _MISSING = object()
+
+    def __init__(self, ttl: float = PERMISSION_TTL, capacity: int = PERMISSION_CACHE_SIZE,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.ttl = ttl
+        self.capacity = capacity
+        self.clock = clock
+        self.lock = threading.Lock()
+        self._entries: 'OrderedDict[object, Tuple[float, object]]' = OrderedDict()
+        # bumped by every invalidation; a value computed across one is not stored
+        self.generation = 0
+        self.reset_counters()
+
+    def reset_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0        # misses caused by an entry outliving the TTL
+        self.invalidated = 0    # entries dropped because the state behind them changed
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self._entries.get(key, self._MISSING)
+            if entry is not self._MISSING:
+                expires, value = entry
+                if expires > self.clock():
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expired += 1
+            self.misses += 1
+            return default
+
+    def put(self, key, value, generation: Optional[int] = None) -> None:
+        if self.ttl <= 0 or self.capacity <= 0:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def pop_where(self, predicate) -> int:
+        # Drop every entry whose key matches; returns how many went
+        with self.lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            self.generation += 1
+            self.invalidated += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self.lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'invalidated': self.invalidated,
+            }
+
+
+class PermissionService:
+
+    # actor email -> user db id
+    _actors = TTLCache()
+    # (user db id, forum db id) -> may moderate
+    _grants = TTLCache()
+
+    @staticmethod
+    def resolve_actor(email: str) -> Optional['User']:
+        # User wrapper for an actor email, or None if there is no such user
+        from backend.User import User
+        cls = PermissionService
+        user_id = cls._actors.get(email)
+        if user_id is not None:
+            user = registry_get('User', user_id) or User.load_by_db_id(user_id)
+            if user is not None:
+                return user
+        user = User.load_by_email(email)
+        if user is not None:
+            cls._actors.put(email, user.db_id)
+        return user
+
+    @staticmethod
+    def can_moderate(user: 'User', forum: 'Forum') -> bool:
+        # Admins moderate every forum; other users the forums that authorized them
+        if getattr(user, 'is_admin', False):
+            return True
+        grants = PermissionService._grants
+        key = (getattr(user, 'db_id', None), getattr(forum, 'db_id', None))
+        generation = grants.generation
+        allowed = grants.get(key)
+        if allowed is None:
+            allowed = key[0] in forum.authorized
+            grants.put(key, allowed, generation)
+        return allowed
+
+    @staticmethod
+    def invalidate(user_id: Optional[int] = None, forum_id: Optional[int] = None) -> None:
+        # Drop cached decisions for one user and/or forum (both None: everything)
+        PermissionService._grants.pop_where(
+            lambda key: (user_id is None or key[0] == user_id) and (forum_id is None or key[1] == forum_id))
+
+    @staticmethod
+    def clear() -> None:
+        # Forget everything (the database was recreated)
+        PermissionService._actors.clear()
+        PermissionService._grants.clear()
+
+    @staticmethod
+    def stats() -> dict:
+        return {
+            'ttl': PermissionService._grants.ttl,
+            'actors': PermissionService._actors.stats(),
+            'grants': PermissionService._grants.stats(),
+        }
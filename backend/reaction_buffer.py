@@ -0,0 +1,361 @@
+import atexit
+import logging
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+from sqlalchemy import select, delete, text, tuple_
+from .db import SessionLocal, begin_write
+from .models import ReactionModel
+from .object_registry import get as registry_get, unregister, mutation_lock
+
+'''
+Write-behind buffer for reaction toggles.
+
+With SCU_FORUMS_REACTION_BUFFER=1 the react endpoint does not write to the
+database itself. Toggles are recorded in memory per (post, user, type), where
+two toggles of the same key cancel out, and a background thread writes what is
+left to `reactions` in one transaction every SCU_FORUMS_REACTION_FLUSH_MS
+milliseconds, or as soon as SCU_FORUMS_REACTION_FLUSH_SIZE keys are waiting.
+Reaction spikes then cost one write transaction per flush instead of one per
+click, leaving the write lock to posts and comments.
+
+Reads of reaction counts (ReactionRepository.counts_for / types_by_user, so
+the react response and ?reactions=counts feeds) add the buffered toggles on
+top of the table, so a user sees their own reaction straight away. Full
+reaction lists show it after the next flush. Whatever is buffered is written
+when the process exits normally.
+'''
+
+logger = logging.getLogger(__name__)
+
+BUFFER_ENABLED = os.environ.get('SCU_FORUMS_REACTION_BUFFER', '0') == '1'
+FLUSH_INTERVAL = float(os.environ.get('SCU_FORUMS_REACTION_FLUSH_MS', 250)) / 1000.0
+FLUSH_SIZE = int(os.environ.get('SCU_FORUMS_REACTION_FLUSH_SIZE', 500))
+
+# Skips posts deleted (with their forum) since the toggle was buffered
+ADD_REACTION_SQL = '''
+    INSERT INTO reactions (reaction_type, user_id, parent_id)
+    SELECT :reaction_type, :user_id, :parent_id WHERE EXISTS (SELECT 1 FROM posts WHERE id = :parent_id)
+    ON CONFLICT (reaction_type, user_id, parent_id) DO NOTHING
+'''
+
+# post id -> (user id, reaction type) -> (exists in the table, should exist)
+Entries = Dict[int, Dict[Tuple[int, str], Tuple[bool, bool]]]
+# copies of the in-flight and pending entries of some posts, in that order
+Layers = Tuple[Entries, Entries]
+T = TypeVar('T')
+
+# Table reads retried because a flush committed under them before falling back
+# to reading with the lock held
+MERGE_ATTEMPTS = 3
+
+
+class ReactionBuffer:
+
+    enabled = BUFFER_ENABLED
+    interval = FLUSH_INTERVAL
+    size_limit = FLUSH_SIZE
+
+    # Guards the maps and the generation below; never held across a table read
+    # except by a reader that keeps losing to flushes (see read_merged). A flush
+    # commits while holding it, so the commit and emptying _inflight are one step.
+    _lock = threading.RLock()
+    _pending: Entries = {}
+    # taken out of _pending by the flush that is writing them
+    _inflight: Entries = {}
+    _size = 0
+    # bumped by every committed flush
+    _generation = 0
+    # one flush at a time
+    _flush_lock = threading.Lock()
+    _worker_lock = threading.Lock()
+    _wake = threading.Event()
+    _stop = threading.Event()
+    _worker: Optional[threading.Thread] = None
+    _counters = {'toggles': 0, 'coalesced': 0, 'flushes': 0, 'rows_written': 0, 'failed_flushes': 0}
+
+    @staticmethod
+    def configure(enabled: Optional[bool] = None, interval: Optional[float] = None,
+                  size_limit: Optional[int] = None) -> None:
+        # Change settings at runtime (tests, scripts); turning the buffer off flushes it
+        cls = ReactionBuffer
+        if enabled is False and cls.enabled:
+            cls.flush()
+        if enabled is not None:
+            cls.enabled = enabled
+        if interval is not None:
+            cls.interval = interval
+        if size_limit is not None:
+            cls.size_limit = size_limit
+
+    @staticmethod
+    def toggle(post_id: int, user_id: int, reaction_type: str) -> Tuple[bool, Dict[str, int]]:
+        # Record a toggle; returns (now reacted, counts per type including buffered toggles)
+        from .messages_services import ReactionRepository
+        cls = ReactionBuffer
+        key = (user_id, reaction_type)
+        generation = in_table = None
+        while True:
+            with cls._lock:
+                entry = cls._pending.get(post_id, {}).get(key)
+                inflight = cls._inflight.get(post_id, {}).get(key)
+                if entry is not None:
+                    stored, current = entry
+                elif inflight is not None:
+                    # the table will hold what the running flush writes
+                    stored = current = inflight[1]
+                elif generation == cls._generation:
+                    # read below with no flush committed since
+                    stored = current = in_table
+                else:
+                    generation = cls._generation
+                    stored = None
+                if stored is not None:
+                    wanted = not current
+                    entries = cls._pending.setdefault(post_id, {})
+                    if wanted == stored:
+                        # toggled back before it was written: nothing to do
+                        del entries[key]
+                        if not entries:
+                            del cls._pending[post_id]
+                        cls._size -= 1
+                        cls._counters['coalesced'] += 1
+                    else:
+                        entries[key] = (stored, wanted)
+                        cls._size += 1
+                    cls._counters['toggles'] += 1
+                    full = cls._size >= cls.size_limit
+                    break
+            # not buffered: look in the table without holding the lock, then check again
+            in_table = ReactionBuffer._exists(post_id, key)
+        counts = ReactionRepository.count_by_type(post_id)
+        cls._ensure_worker()
+        if full:
+            cls._wake.set()
+        return wanted, counts
+
+    @staticmethod
+    def _exists(post_id: int, key: Tuple[int, str]) -> bool:
+        session = SessionLocal()
+        try:
+            return session.execute(select(ReactionModel.id).where(
+                ReactionModel.parent_id == post_id, ReactionModel.user_id == key[0],
+                ReactionModel.reaction_type == key[1])).first() is not None
+        finally:
+            session.close()
+
+    @staticmethod
+    def read_merged(read: Callable[[], T], post_ids: Callable[[], Iterable[int]],
+                    overlay: Callable[[T, Layers], None]) -> T:
+        # read() from the table and overlay(result, layers) the toggles buffered on
+        # post_ids(). The buffer is copied under the lock and the table read without
+        # it, so toggles never wait on a read; a flush that committed in between may
+        # already be in what was read, so then it is read again.
+        cls = ReactionBuffer
+        for _ in range(MERGE_ATTEMPTS):
+            ids = list(post_ids())
+            with cls._lock:
+                generation = cls._generation
+                layers = cls._copy_layers(ids)
+            result = read()
+            with cls._lock:
+                if cls._generation == generation:
+                    overlay(result, layers)
+                    return result
+        # flushes keep landing: hold the lock so none commits during the read
+        with cls._lock:
+            result = read()
+            overlay(result, cls._copy_layers(list(post_ids())))
+            return result
+
+    @staticmethod
+    def _copy_layers(post_ids: List[int]) -> Layers:
+        # The in-flight and pending entries of post_ids (caller holds _lock)
+        cls = ReactionBuffer
+        return tuple({post_id: dict(entries[post_id]) for post_id in post_ids if post_id in entries}
+                     for entries in (cls._inflight, cls._pending))
+
+    @staticmethod
+    def has_entries() -> bool:
+        return bool(ReactionBuffer._pending or ReactionBuffer._inflight)
+
+    @staticmethod
+    def buffered_post_ids() -> List[int]:
+        cls = ReactionBuffer
+        with cls._lock:
+            return list(set(cls._pending) | set(cls._inflight))
+
+    @staticmethod
+    def overlay_counts(counts: Dict[int, Dict[str, int]], layers: Layers, zero) -> None:
+        # Add the buffered toggles in layers to counts (post -> type -> n), in place
+        for entries in layers:
+            for post_id, keys in entries.items():
+                for (_, reaction_type), (stored, wanted) in keys.items():
+                    if stored != wanted:
+                        per_post = counts.setdefault(post_id, zero())
+                        per_post[reaction_type] = per_post.get(reaction_type, 0) + (1 if wanted else -1)
+
+    @staticmethod
+    def overlay_types(reacted: Dict[int, List[str]], layers: Layers, user_id: int) -> None:
+        # Apply user_id's buffered toggles in layers to reacted (post -> types), in place
+        for entries in layers:
+            for post_id, keys in entries.items():
+                for (entry_user, reaction_type), (_, wanted) in keys.items():
+                    if entry_user != user_id:
+                        continue
+                    types = reacted.setdefault(post_id, [])
+                    if wanted and reaction_type not in types:
+                        types.append(reaction_type)
+                    elif not wanted and reaction_type in types:
+                        types.remove(reaction_type)
+                if post_id in reacted and not reacted[post_id]:
+                    del reacted[post_id]
+
+    @staticmethod
+    def flush() -> int:
+        # Write every buffered toggle in one transaction; returns the keys written
+        cls = ReactionBuffer
+        with cls._flush_lock:
+            with cls._lock:
+                batch, cls._pending, cls._size = cls._pending, {}, 0
+                cls._inflight = batch
+            if not batch:
+                return 0
+            adds = [dict(parent_id=post_id, user_id=user_id, reaction_type=reaction_type)
+                    for post_id, entries in batch.items()
+                    for (user_id, reaction_type), (_, wanted) in entries.items() if wanted]
+            removes = [(post_id, user_id, reaction_type)
+                       for post_id, entries in batch.items()
+                       for (user_id, reaction_type), (_, wanted) in entries.items() if not wanted]
+            # a session of its own: flushes also run inside requests and at exit
+            session = SessionLocal.session_factory()
+            try:
+                begin_write(session)
+                removed_ids = []
+                if removes:
+                    removed_ids = list(session.execute(select(ReactionModel.id).where(
+                        tuple_(ReactionModel.parent_id, ReactionModel.user_id, ReactionModel.reaction_type).in_(removes))).scalars())
+                    if removed_ids:
+                        session.execute(delete(ReactionModel).where(ReactionModel.id.in_(removed_ids)))
+                if adds:
+                    session.execute(text(ADD_REACTION_SQL), adds)
+                with cls._lock:
+                    session.commit()
+                    cls._inflight = {}
+                    cls._generation += 1
+            except Exception:
+                session.rollback()
+                with cls._lock:
+                    cls._requeue(batch)
+                    cls._inflight = {}
+                    cls._counters['failed_flushes'] += 1
+                raise
+            finally:
+                session.close()
+            cls._counters['flushes'] += 1
+            cls._counters['rows_written'] += len(adds) + len(removes)
+        for reaction_id in removed_ids:
+            unregister('Reaction', reaction_id)
+        ReactionBuffer._refresh_wrappers(list(batch))
+        return len(adds) + len(removes)
+
+    @staticmethod
+    def _requeue(batch: Entries) -> None:
+        # Put a failed batch back under toggles made since (caller holds _lock)
+        cls = ReactionBuffer
+        for post_id, entries in batch.items():
+            for key, (stored, wanted) in entries.items():
+                newer = cls._pending.get(post_id, {}).get(key)
+                if newer is not None:
+                    # the newer entry was based on this one being written
+                    wanted = newer[1]
+                    del cls._pending[post_id][key]
+                    cls._size -= 1
+                if wanted != stored:
+                    cls._pending.setdefault(post_id, {})[key] = (stored, wanted)
+                    cls._size += 1
+            if post_id in cls._pending and not cls._pending[post_id]:
+                del cls._pending[post_id]
+
+    @staticmethod
+    def _refresh_wrappers(post_ids: List[int]) -> None:
+        # Reload the reaction lists of cached posts the flush changed
+        from backend.Messages import Post, Reaction
+        posts = [p for p in (registry_get('Post', pid) for pid in post_ids)
+                 if p is not None and Post.reactions.is_loaded(p)]
+        if not posts:
+            return
+        session = SessionLocal.session_factory()
+        try:
+            rows = (session.query(ReactionModel)
+                    .filter(ReactionModel.parent_id.in_([p.db_id for p in posts]))
+                    .order_by(ReactionModel.id).all())
+            by_post: Dict[int, list] = {}
+            for r_model in rows:
+                by_post.setdefault(r_model.parent_id, []).append(Reaction.from_model(r_model, session=session))
+            for post in posts:
+                with mutation_lock(post):
+                    reactions = by_post.get(post.db_id, [])
+                    for reaction in reactions:
+                        reaction.parent = post
+                    post.reactions[:] = reactions
+        finally:
+            session.close()
+
+    @staticmethod
+    def _ensure_worker() -> None:
+        cls = ReactionBuffer
+        if cls._worker is not None and cls._worker.is_alive():
+            return
+        with cls._worker_lock:
+            if cls._worker is not None and cls._worker.is_alive():
+                return
+            cls._stop.clear()
+            cls._worker = threading.Thread(target=cls._run, name='reaction-flush', daemon=True)
+            cls._worker.start()
+
+    @staticmethod
+    def _run() -> None:
+        cls = ReactionBuffer
+        while not cls._stop.is_set():
+            cls._wake.wait(cls.interval)
+            cls._wake.clear()
+            if cls._stop.is_set():
+                break
+            try:
+                cls.flush()
+            except Exception:
+                # the batch was put back; try again on the next tick
+                logger.exception("reaction buffer flush failed")
+
+    @staticmethod
+    def shutdown() -> None:
+        # Stop the flush thread and write what is left (registered with atexit)
+        cls = ReactionBuffer
+        cls._stop.set()
+        cls._wake.set()
+        worker = cls._worker
+        if worker is not None and worker is not threading.current_thread():
+            worker.join(timeout=max(1.0, cls.interval * 4))
+        cls._worker = None
+        # a later worker should wait a full interval, not wake on this signal
+        cls._wake.clear()
+        cls.flush()
+
+    @staticmethod
+    def discard() -> None:
+        # Drop buffered toggles without writing them (the database was recreated)
+        cls = ReactionBuffer
+        with cls._lock:
+            cls._pending, cls._inflight, cls._size = {}, {}, 0
+            cls._generation += 1
+
+    @staticmethod
+    def stats() -> dict:
+        cls = ReactionBuffer
+        with cls._lock:
+            return dict(cls._counters, enabled=cls.enabled, buffered=cls._size,
+                        interval_ms=int(cls.interval * 1000), size_limit=cls.size_limit)
+
+
+atexit.register(ReactionBuffer.shutdown)
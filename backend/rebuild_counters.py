@@ -0,0 +1,26 @@
+from backend.db import ensure_db
+from backend.messages_services import PostRepository, ReactionRepository
+from backend.forum_services import ForumStatsRepository
+
+'''
+Recompute the denormalized counters from the rows they summarize.
+
+Triggers keep the reaction counters current on every write, and the
+membership and post services update the posts' thread stats and forum_stats
+in the same transaction as the change, so this is only needed after editing
+the database by hand or to repair drift.
+'''
+
+def rebuild_counters() -> dict:
+    # Rows written per counter table (posts: thread stats columns)
+    ensure_db()
+    return {
+        'post_reaction_counts': ReactionRepository.rebuild_counts(),
+        'posts': PostRepository.rebuild_thread_stats(),
+        # last, as it sums the reaction counters and thread stats rebuilt above
+        'forum_stats': ForumStatsRepository.rebuild(),
+    }
+
+if __name__ == "__main__":
+    for table, rows in rebuild_counters().items():
+        print(f"{table}: {rows} rows")
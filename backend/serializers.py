@@ -0,0 +1,545 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select, literal, func
+from .db import SessionLocal
+from .models import ForumModel, PostModel, ReactionModel, UserModel, forum_users, forum_authorized, forum_restricted
+from .messages_services import PostRepository, ReactionRepository
+from .forum_services import ForumRepository
+from .pagination import encode_cursor
+from .thread_services import ThreadRepository
+
+'''
+Bulk serializers for forum pages.
+
+The wrapper based serializers in app.py walk posts, comments and reactions
+one query at a time. These load a whole forum (or a set of threads) in a
+fixed number of queries and build the JSON from in-memory maps instead.
+'''
+
+
+def isoformat(value) -> Optional[str]:
+    # Same timestamp format as the wrapper serializers
+    return (value.isoformat() + 'Z') if value else None
+
+
+# Which keys to emit and how many relationship levels to follow
+class FieldSelection:
+    # `fields` limits the keys of user, forum and post objects at every level
+    # ('id' is always kept); leaf entries such as reactions and member lists
+    # are emitted whole. `depth` counts relationship levels, None = unlimited.
+
+    # `reactions=counts` swaps the reaction list for per-type counts (plus the
+    # types `viewer_id` reacted with), read from the counter table
+    REACTION_MODES = ('list', 'counts')
+
+    def __init__(self, fields: Optional[Iterable[str]] = None, depth: Optional[int] = None,
+                 reactions: str = 'list', viewer_id: Optional[int] = None) -> None:
+        self.fields = frozenset(fields) if fields is not None else None
+        self.depth = depth
+        self.reactions = reactions
+        self.viewer_id = viewer_id
+
+    @classmethod
+    def from_args(cls, args) -> 'FieldSelection':
+        # Parse ?fields=a,b,c&depth=N from a request's args
+        fields = None
+        raw_fields = args.get('fields')
+        if raw_fields:
+            fields = [f.strip() for f in raw_fields.split(',') if f.strip()]
+        depth = None
+        raw_depth = args.get('depth')
+        if raw_depth not in (None, ''):
+            try:
+                depth = int(raw_depth)
+            except (TypeError, ValueError):
+                raise ValueError("depth must be an integer")
+            if depth < 0:
+                raise ValueError("depth must not be negative")
+        reactions = args.get('reactions') or 'list'
+        if reactions not in cls.REACTION_MODES:
+            raise ValueError(f"reactions must be one of: {', '.join(cls.REACTION_MODES)}")
+        viewer_id = None
+        raw_viewer = args.get('viewer_id')
+        if raw_viewer not in (None, ''):
+            try:
+                viewer_id = int(raw_viewer)
+            except (TypeError, ValueError):
+                raise ValueError("viewer_id must be an integer")
+        return cls(fields, depth, reactions, viewer_id)
+
+    def wants(self, name: str) -> bool:
+        return self.fields is None or name == 'id' or name in self.fields
+
+    def expands(self, name: str) -> bool:
+        # Relationship is both requested and within the depth budget
+        return self.wants(name) and (self.depth is None or self.depth > 0)
+
+    def child(self) -> 'FieldSelection':
+        return self.with_depth(None if self.depth is None else self.depth - 1)
+
+    def with_depth(self, depth: Optional[int], fields: Optional[Iterable[str]] = None) -> 'FieldSelection':
+        return FieldSelection(self.fields if fields is None else fields, depth, self.reactions, self.viewer_id)
+
+    @property
+    def reaction_counts(self) -> bool:
+        return self.reactions == 'counts'
+
+    def levels(self, name: str) -> Optional[int]:
+        # How many levels of a self-nesting relationship (comments) to load, None = all
+        return self.depth if self.expands(name) else 0
+
+    def pick(self, data: dict) -> dict:
+        if self.fields is None:
+            return data
+        return {key: value for key, value in data.items() if self.wants(key)}
+
+
+ALL_FIELDS = FieldSelection()
+
+
+# Everything needed to render a set of threads, keyed by db id
+class ThreadSnapshot:
+
+    def __init__(self, roots: List[PostModel], posts: List[PostModel], reactions: List[ReactionModel],
+                 users: Dict[int, UserModel]) -> None:
+        self.roots = roots
+        self.users = users
+        self.children: Dict[int, List[PostModel]] = {}
+        for post_model in posts:
+            if post_model.parent_id is not None:
+                self.children.setdefault(post_model.parent_id, []).append(post_model)
+        self.reactions: Dict[int, List[ReactionModel]] = {}
+        for r_model in reactions:
+            self.reactions.setdefault(r_model.parent_id, []).append(r_model)
+        # counts mode (see FieldSelection.reactions), filled by ForumSerializer.load_reactions
+        self.reaction_counts: Dict[int, Dict[str, int]] = {}
+        self.viewer_reactions: Dict[int, List[str]] = {}
+
+    def username(self, user_id: Optional[int]) -> Optional[str]:
+        user_model = self.users.get(user_id)
+        return user_model.username if user_model is not None else None
+
+    def serialize_post(self, post_model: PostModel, forum_name: Optional[str] = None, sel: FieldSelection = ALL_FIELDS) -> dict:
+        data = sel.pick({
+            'id': post_model.id,
+            'forum_id': post_model.forum_id,
+            'forum_name': forum_name if post_model.forum_id is not None else None,
+            'title': post_model.title,
+            'message': post_model.message,
+            'poster': self.username(post_model.poster_id),
+            'is_deleted': bool(post_model.is_deleted),
+            'created_at': isoformat(post_model.created_at),
+            'comment_count': post_model.comment_count or 0,
+            'descendant_count': post_model.descendant_count or 0,
+            'last_activity_at': isoformat(post_model.last_activity_at or post_model.created_at),
+        })
+        if sel.expands('reactions') and sel.reaction_counts:
+            data['reaction_counts'] = self.reaction_counts.get(post_model.id) or ReactionRepository.zero_counts()
+            if sel.viewer_id is not None:
+                data['viewer_reactions'] = self.viewer_reactions.get(post_model.id, [])
+        elif sel.expands('reactions'):
+            data['reactions'] = [
+                {
+                    'id': r_model.id,
+                    'reaction_type': r_model.reaction_type,
+                    'user': self.username(r_model.user_id)
+                }
+                for r_model in self.reactions.get(post_model.id, [])
+            ]
+        if sel.expands('comments'):
+            data['comments'] = self.serialize_comments(post_model, sel.child())
+        return data
+
+    def serialize_comments(self, post_model: PostModel, sel: FieldSelection) -> list:
+        return [self.serialize_post(child, sel=sel) for child in self.children.get(post_model.id, [])]
+
+    def serialize_roots(self, forum_name: Optional[str] = None, sel: FieldSelection = ALL_FIELDS) -> list:
+        return [self.serialize_post(root, forum_name, sel) for root in self.roots]
+
+
+# Loads forums and threads with bulk queries for serialization
+class ForumSerializer:
+
+    @staticmethod
+    def load_threads(session, roots_query, extra_user_ids=(), sel: FieldSelection = ALL_FIELDS,
+                     sort: str = 'created') -> ThreadSnapshot:
+        # roots_query selects the ids of the top-level posts to render; sel is the
+        # post-level selection and decides which of the bulk queries are needed;
+        # roots come out in the forum listing order named by sort
+        max_level = sel.levels('comments')
+        if max_level == 0:
+            thread_ids = roots_query
+        else:
+            thread_ids = ThreadRepository.subtree_ids(roots_query, max_level)
+        posts = session.query(PostModel).filter(PostModel.id.in_(thread_ids)).order_by(PostModel.id).all()
+        reactions = ForumSerializer.load_reactions(session, thread_ids, sel) if sel.expands('reactions') else None
+        user_ids = set(extra_user_ids)
+        if sel.wants('poster'):
+            user_ids.update(p.poster_id for p in posts if p.poster_id is not None)
+        user_ids.update(ForumSerializer.reacting_user_ids(reactions))
+        users = ForumSerializer._load_users(session, user_ids)
+        # Every descendant's parent was loaded too, so the roots are the rest
+        loaded_ids = {p.id for p in posts}
+        roots = [p for p in posts if p.parent_id not in loaded_ids]
+        # Same order as the forum listing / pagination key
+        column, descending, missing = PostRepository.LISTING_SORTS[sort]
+        roots.sort(key=lambda p: (getattr(p, column.key) or missing, p.id), reverse=descending)
+        return ForumSerializer.attach_reactions(ThreadSnapshot(roots, posts, [], users), reactions)
+
+    @staticmethod
+    def load_reactions(session, post_ids, sel: FieldSelection):
+        # Reaction rows to list, or in counts mode (counts per post, viewer's types per post);
+        # post_ids is a list or a select of ids
+        if sel.reaction_counts:
+            counts = ReactionRepository.counts_for(post_ids, session=session)
+            reacted = {}
+            if sel.viewer_id is not None:
+                reacted = ReactionRepository.types_by_user(post_ids, sel.viewer_id, session=session)
+            return counts, reacted
+        return session.query(ReactionModel).filter(ReactionModel.parent_id.in_(post_ids)).order_by(ReactionModel.id).all()
+
+    @staticmethod
+    def reacting_user_ids(reactions) -> set:
+        # Users to load for listed reactions (none in counts mode)
+        if not isinstance(reactions, list):
+            return set()
+        return {r.user_id for r in reactions if r.user_id is not None}
+
+    @staticmethod
+    def attach_reactions(snapshot: ThreadSnapshot, reactions) -> ThreadSnapshot:
+        # Put what load_reactions returned into the snapshot
+        if isinstance(reactions, list):
+            for r_model in reactions:
+                snapshot.reactions.setdefault(r_model.parent_id, []).append(r_model)
+        elif reactions is not None:
+            snapshot.reaction_counts, snapshot.viewer_reactions = reactions
+        return snapshot
+
+    @staticmethod
+    def _load_users(session, user_ids) -> Dict[int, UserModel]:
+        if not user_ids:
+            return {}
+        return {u.id: u for u in session.query(UserModel).filter(UserModel.id.in_(user_ids)).all()}
+
+    @staticmethod
+    def _load_members(session, forum_id: int, kinds=('users', 'authorized', 'restricted')) -> Dict[str, List[int]]:
+        # One query over the requested association tables, tagged by table
+        tables = {'users': forum_users, 'authorized': forum_authorized, 'restricted': forum_restricted}
+        members = {kind: [] for kind in kinds}
+        if not kinds:
+            return members
+        selects = [
+            select(literal(kind).label('kind'), tables[kind].c.user_id).where(tables[kind].c.forum_id == forum_id)
+            for kind in kinds
+        ]
+        membership = selects[0].union_all(*selects[1:]) if len(selects) > 1 else selects[0]
+        for kind, user_id in session.execute(membership).all():
+            members[kind].append(user_id)
+        return members
+
+    @staticmethod
+    def serialize_posts(forum_id: int, roots_query=None, sel: FieldSelection = ALL_FIELDS,
+                        sort: str = 'created') -> Optional[list]:
+        # Serialize a forum's posts (or the subset picked by roots_query), None if no forum
+        session = SessionLocal()
+        try:
+            forum_model = session.get(ForumModel, forum_id)
+            if forum_model is None:
+                return None
+            if roots_query is None:
+                roots_query = select(PostModel.id).where(PostModel.forum_id == forum_id)
+            snapshot = ForumSerializer.load_threads(session, roots_query, sel=sel, sort=sort)
+            return snapshot.serialize_roots(forum_model.course_name, sel)
+        finally:
+            session.close()
+
+    @staticmethod
+    def serialize_post(post_id: int, sel: FieldSelection = ALL_FIELDS) -> Optional[dict]:
+        # One post or comment, same shape as app._serialize_post, None if it does not exist.
+        # Relationships left out of sel are never queried: fields=id,title reads one row.
+        session = SessionLocal()
+        try:
+            roots_query = select(PostModel.id).where(PostModel.id == post_id)
+            snapshot = ForumSerializer.load_threads(session, roots_query, sel=sel)
+            if not snapshot.roots:
+                return None
+            root = snapshot.roots[0]
+            return snapshot.serialize_post(root, ForumSerializer._forum_name(session, root, sel), sel)
+        finally:
+            session.close()
+
+    @staticmethod
+    def serialize_replies(post_id: int, sel: FieldSelection = ALL_FIELDS) -> Optional[list]:
+        # Direct replies to a post or comment, each with its own replies as sel asks,
+        # None if the post does not exist
+        session = SessionLocal()
+        try:
+            if session.get(PostModel, post_id) is None:
+                return None
+            roots_query = select(PostModel.id).where(PostModel.parent_id == post_id)
+            snapshot = ForumSerializer.load_threads(session, roots_query, sel=sel)
+            return [snapshot.serialize_post(reply, ForumSerializer._forum_name(session, reply, sel), sel)
+                    for reply in snapshot.roots]
+        finally:
+            session.close()
+
+    @staticmethod
+    def _forum_name(session, post_model: PostModel, sel: FieldSelection) -> Optional[str]:
+        if post_model.forum_id is None or not sel.wants('forum_name'):
+            return None
+        forum_model = session.get(ForumModel, post_model.forum_id)
+        return forum_model.course_name if forum_model is not None else None
+
+    @staticmethod
+    def serialize_summary_page(limit: int, after_id: Optional[int] = None) -> Tuple[list, Optional[str]]:
+        # Forum directory entries (names and counts only) plus the next cursor
+        rows, has_more = ForumRepository.load_summaries(limit, after_id)
+        summaries = [
+            {
+                'id': row['id'],
+                'course_name': row['course_name'],
+                'created_at': isoformat(row['created_at']),
+                'member_count': row['member_count'],
+                'post_count': row['post_count'],
+                'last_activity': isoformat(row['last_activity'])
+            }
+            for row in rows
+        ]
+        next_cursor = encode_cursor(rows[-1]['id']) if has_more else None
+        return summaries, next_cursor
+
+    @staticmethod
+    def serialize_posts_page(forum_id: int, limit: int, after: Optional[tuple] = None,
+                             sel: FieldSelection = ALL_FIELDS, sort: str = 'created') -> Optional[Tuple[list, Optional[str]]]:
+        # One keyset page of a forum's posts plus the next cursor, None if no forum
+        session = SessionLocal()
+        try:
+            forum_model = session.get(ForumModel, forum_id)
+            if forum_model is None:
+                return None
+            page, has_more = PostRepository.load_forum_page(forum_id, limit, after, session=session, sort=sort)
+            key = PostRepository.LISTING_SORTS[sort][0].key
+            next_cursor = encode_cursor(getattr(page[-1], key), page[-1].id) if has_more else None
+            if not page:
+                return [], next_cursor
+            roots_query = select(PostModel.id).where(PostModel.id.in_([p.id for p in page]))
+            snapshot = ForumSerializer.load_threads(session, roots_query, sel=sel, sort=sort)
+            return snapshot.serialize_roots(forum_model.course_name, sel), next_cursor
+        finally:
+            session.close()
+
+    @staticmethod
+    def serialize_forum(forum_id: int, sel: FieldSelection = ALL_FIELDS) -> Optional[dict]:
+        # Full forum payload, same shape as app._serialize_forum.
+        # Relationships left out of sel are never queried.
+        session = SessionLocal()
+        try:
+            forum_model = session.get(ForumModel, forum_id)
+            if forum_model is None:
+                return None
+            data = sel.pick({
+                'id': forum_model.id,
+                'course_name': forum_model.course_name,
+                'created_at': isoformat(forum_model.created_at),
+            })
+            member_keys = {'users': 'users', 'authorized': 'authorized_users', 'restricted': 'restricted_users'}
+            kinds = tuple(kind for kind, key in member_keys.items() if sel.expands(key))
+            members = ForumSerializer._load_members(session, forum_id, kinds)
+            member_ids = {uid for ids in members.values() for uid in ids}
+            if sel.expands('posts'):
+                post_sel = sel.child()
+                roots_query = select(PostModel.id).where(PostModel.forum_id == forum_id)
+                snapshot = ForumSerializer.load_threads(session, roots_query, member_ids, post_sel)
+                users = snapshot.users
+                data['posts'] = snapshot.serialize_roots(forum_model.course_name, post_sel)
+            else:
+                users = ForumSerializer._load_users(session, member_ids)
+            if 'users' in members:
+                data['users'] = [
+                    {
+                        'id': uid,
+                        'username': users[uid].username,
+                        'email': users[uid].email,
+                        'is_admin': bool(users[uid].is_admin)
+                    }
+                    for uid in members['users'] if uid in users
+                ]
+            for kind in ('authorized', 'restricted'):
+                if kind in members:
+                    data[member_keys[kind]] = [
+                        {
+                            'id': uid,
+                            'username': users[uid].username,
+                            'email': users[uid].email
+                        }
+                        for uid in members[kind] if uid in users
+                    ]
+            return data
+        finally:
+            session.close()
+
+
+
+# Thread snapshot cut off at a depth / fan-out, with reply counts for stubs
+class CommentTreeSnapshot(ThreadSnapshot):
+
+    def __init__(self, roots: List[PostModel], posts: List[PostModel], reactions: List[ReactionModel],
+                 users: Dict[int, UserModel], reply_counts: Dict[int, int],
+                 reply_totals: Optional[Dict[int, int]] = None) -> None:
+        super().__init__(roots, posts, reactions, users)
+        # reply_counts: children from the cursor on (drives the stubs); reply_totals: all children
+        self.reply_counts = reply_counts
+        self.reply_totals = reply_totals or {}
+
+    def serialize_post(self, post_model: PostModel, forum_name: Optional[str] = None, sel: FieldSelection = ALL_FIELDS) -> dict:
+        data = super().serialize_post(post_model, forum_name, sel)
+        data['reply_count'] = self.reply_totals.get(post_model.id, self.reply_counts.get(post_model.id, 0))
+        return data
+
+    def serialize_comments(self, post_model: PostModel, sel: FieldSelection) -> list:
+        loaded = self.children.get(post_model.id, [])
+        comments = [self.serialize_post(child, sel=sel) for child in loaded]
+        remaining = self.reply_counts.get(post_model.id, 0) - len(loaded)
+        if remaining > 0:
+            # Stub for the truncated branch; expand via /api/comments/<parent_id>/replies?after=<after_id>
+            comments.append({
+                'stub': True,
+                'parent_id': post_model.id,
+                'remaining': remaining,
+                'after_id': loaded[-1].id if loaded else None
+            })
+        return comments
+
+
+# Loads the first N levels / K children per node of a comment tree
+class CommentTreeSerializer:
+
+    DEFAULT_DEPTH = 3
+    MAX_DEPTH = 10
+    DEFAULT_CHILDREN = 10
+
+    @staticmethod
+    def _children_page(session, parent_ids, max_children: int, after_id: Optional[int] = None):
+        # First max_children children of every parent in one query, with each
+        # parent's total child count from a window over the same partition
+        numbered = select(
+            PostModel.id.label('id'),
+            func.row_number().over(partition_by=PostModel.parent_id, order_by=PostModel.id).label('rn'),
+            func.count().over(partition_by=PostModel.parent_id).label('total'),
+        ).where(PostModel.parent_id.in_(parent_ids))
+        if after_id is not None:
+            numbered = numbered.where(PostModel.id > after_id)
+        numbered = numbered.subquery()
+        return (session.query(PostModel, numbered.c.total)
+                .join(numbered, PostModel.id == numbered.c.id)
+                .filter(numbered.c.rn <= max_children)
+                .order_by(PostModel.id)
+                .all())
+
+    @staticmethod
+    def load(session, root_id: int, max_depth: int, max_children: int, after_id: Optional[int] = None,
+             sel: FieldSelection = ALL_FIELDS) -> Optional[CommentTreeSnapshot]:
+        # One query per level; after_id skips the root's already-shown children
+        root = session.get(PostModel, root_id)
+        if root is None:
+            return None
+        posts = [root]
+        reply_counts = {root_id: 0}
+        frontier = [root_id]
+        for level in range(max_depth):
+            if not frontier:
+                break
+            rows = CommentTreeSerializer._children_page(session, frontier, max_children, after_id if level == 0 else None)
+            frontier = []
+            for post_model, total in rows:
+                reply_counts[post_model.parent_id] = total
+                reply_counts.setdefault(post_model.id, 0)
+                posts.append(post_model)
+                frontier.append(post_model.id)
+        if frontier:
+            # Nodes on the last level only need their child counts for the stubs
+            counts = session.query(PostModel.parent_id, func.count(PostModel.id)).filter(
+                PostModel.parent_id.in_(frontier)).group_by(PostModel.parent_id).all()
+            reply_counts.update(dict(counts))
+        reply_totals = None
+        if after_id is not None:
+            # the window above only sees the root's children past the cursor
+            reply_totals = {root_id: session.query(func.count(PostModel.id)).filter(
+                PostModel.parent_id == root_id).scalar()}
+        post_ids = [p.id for p in posts]
+        reactions = ForumSerializer.load_reactions(session, post_ids, sel) if sel.expands('reactions') else None
+        user_ids = ForumSerializer.reacting_user_ids(reactions)
+        if sel.wants('poster'):
+            user_ids.update(p.poster_id for p in posts if p.poster_id is not None)
+        users = ForumSerializer._load_users(session, user_ids)
+        snapshot = CommentTreeSnapshot([root], posts, [], users, reply_counts, reply_totals)
+        return ForumSerializer.attach_reactions(snapshot, reactions)
+
+    @staticmethod
+    def serialize_tree(root_id: int, max_depth: int, max_children: int, after_id: Optional[int] = None,
+                       sel: FieldSelection = ALL_FIELDS) -> Optional[dict]:
+        # The root post/comment with its truncated reply tree, None if it does not exist
+        session = SessionLocal()
+        try:
+            # max_depth bounds the tree, so the selection itself carries no depth limit
+            tree_sel = sel.with_depth(None, sel.fields if sel.fields is None else sel.fields | {'comments'})
+            snapshot = CommentTreeSerializer.load(session, root_id, max_depth, max_children, after_id, tree_sel)
+            if snapshot is None:
+                return None
+            root = snapshot.roots[0]
+            forum_name = None
+            if root.forum_id is not None:
+                forum_model = session.get(ForumModel, root.forum_id)
+                forum_name = forum_model.course_name if forum_model is not None else None
+            return snapshot.serialize_post(root, forum_name, tree_sel)
+        finally:
+            session.close()
+
+
+
+# Flat slice of a thread in display order; nesting is given by depth/parent_id
+class ThreadPageSnapshot(ThreadSnapshot):
+
+    def __init__(self, root: PostModel, posts: List[PostModel], reactions: List[ReactionModel],
+                 users: Dict[int, UserModel]) -> None:
+        # no children map: every row is emitted at the top level of the page
+        super().__init__([root], [], reactions, users)
+        self.root = root
+        self.posts = posts
+
+    def serialize_post(self, post_model: PostModel, forum_name: Optional[str] = None, sel: FieldSelection = ALL_FIELDS) -> dict:
+        data = super().serialize_post(post_model, forum_name, sel)
+        data.pop('comments', None)
+        data['parent_id'] = post_model.parent_id
+        data['depth'] = post_model.depth - self.root.depth
+        return data
+
+    def serialize_page(self, sel: FieldSelection = ALL_FIELDS) -> list:
+        return [self.serialize_post(post_model, sel=sel) for post_model in self.posts]
+
+
+# Pages through every reply under a post using the materialized path index
+class ThreadPageSerializer:
+
+    @staticmethod
+    def serialize_page(root_id: int, limit: int, after_path: Optional[str] = None,
+                       sel: FieldSelection = ALL_FIELDS) -> Optional[Tuple[list, int, Optional[str]]]:
+        # (replies, total replies, next cursor) for the thread under root_id, None if it does not exist
+        session = SessionLocal()
+        try:
+            root = session.get(PostModel, root_id)
+            if root is None:
+                return None
+            posts, has_more = ThreadRepository.load_thread_page(session, root.path, limit, after_path)
+            total = ThreadRepository.count_subtree(session, root.path)
+            reactions = None
+            if sel.expands('reactions') and posts:
+                reactions = ForumSerializer.load_reactions(session, [p.id for p in posts], sel)
+            user_ids = ForumSerializer.reacting_user_ids(reactions)
+            if sel.wants('poster'):
+                user_ids.update(p.poster_id for p in posts if p.poster_id is not None)
+            users = ForumSerializer._load_users(session, user_ids)
+            snapshot = ForumSerializer.attach_reactions(ThreadPageSnapshot(root, posts, [], users), reactions)
+            next_cursor = encode_cursor(posts[-1].path) if has_more else None
+            return snapshot.serialize_page(sel), total, next_cursor
+        finally:
+            session.close()
@@ -0,0 +1,166 @@
+from typing import TYPE_CHECKING, List, Optional, Tuple
+from sqlalchemy import select, literal, func, update, and_, or_, cast, Integer
+from sqlalchemy.orm import aliased
+from .db import SessionLocal
+from .models import PostModel
+
+if TYPE_CHECKING:
+    from sqlalchemy.sql import Select
+
+'''
+Thread traversal with a recursive CTE.
+
+Posts and comments share the posts table and only link through parent_id,
+so walking a thread used to take one query per node or per level. These
+helpers return a whole subtree (id, parent_id, depth) in one statement.
+
+Each row also stores a materialized path (see PostModel.path): the ids from
+the top-level post down to the row, zero-padded to PATH_WIDTH and joined by
+'/'. Ordering by path is thread display order (parents first, siblings by
+id), and the subtree under a path p is the range p <= path < p + '0'
+because '0' sorts right after '/'.
+'''
+
+PATH_WIDTH = 10
+PATH_FORMAT = '%0' + str(PATH_WIDTH) + 'd'
+
+
+# Support class for walking comment threads in the DB
+class ThreadRepository:
+
+    @staticmethod
+    def subtree_cte(root_ids, max_depth: Optional[int] = None):
+        # root_ids is a list of ids or a select of ids; roots have depth 0
+        tree = select(
+            PostModel.id.label('id'),
+            PostModel.parent_id.label('parent_id'),
+            literal(0).label('depth'),
+        ).where(PostModel.id.in_(root_ids)).cte('thread', recursive=True)
+        children = select(PostModel.id, PostModel.parent_id, tree.c.depth + 1).where(PostModel.parent_id == tree.c.id)
+        if max_depth is not None:
+            children = children.where(tree.c.depth < max_depth)
+        return tree.union_all(children)
+
+    @staticmethod
+    def subtree_ids(root_ids, max_depth: Optional[int] = None) -> 'Select':
+        # Select of every id in the subtrees, usable inside IN (...)
+        tree = ThreadRepository.subtree_cte(root_ids, max_depth)
+        return select(tree.c.id)
+
+    @staticmethod
+    def forum_ids(forum_id: int) -> 'Select':
+        # Select of every post and comment id in a forum
+        return ThreadRepository.subtree_ids(select(PostModel.id).where(PostModel.forum_id == forum_id))
+
+    @staticmethod
+    def subtree(root_ids, max_depth: Optional[int] = None, session=None) -> list:
+        # Rows of (id, parent_id, depth) ordered by depth, then id
+        close_session = False
+        if session is None:
+            session = SessionLocal()
+            close_session = True
+        try:
+            tree = ThreadRepository.subtree_cte(root_ids, max_depth)
+            return session.execute(select(tree).order_by(tree.c.depth, tree.c.id)).all()
+        finally:
+            if close_session:
+                session.close()
+
+    @staticmethod
+    def load_descendants(session, root_ids) -> List[PostModel]:
+        # Every descendant model below the roots (roots excluded), parents before children
+        tree = ThreadRepository.subtree_cte(root_ids)
+        return (session.query(PostModel)
+                .join(tree, PostModel.id == tree.c.id)
+                .filter(tree.c.depth > 0)
+                .order_by(tree.c.depth, PostModel.id)
+                .all())
+
+    @staticmethod
+    def thread_forum_id(post_id: int):
+        # Scalar subquery: forum of the top-level post above post_id (NULL outside forums).
+        # The root id is the first path segment, so this is two primary key lookups.
+        root = aliased(PostModel)
+        path = select(PostModel.path).where(PostModel.id == post_id).scalar_subquery()
+        root_id = cast(func.substr(path, 1, PATH_WIDTH), Integer)
+        return select(root.forum_id).where(root.id == root_id).scalar_subquery()
+
+    @staticmethod
+    def child_path(parent_path: Optional[str], post_id: int) -> str:
+        # Path for a row given its parent's path (None for a top-level post)
+        key = PATH_FORMAT % post_id
+        return key if parent_path is None else f"{parent_path}/{key}"
+
+    @staticmethod
+    def ancestor_ids(path: str) -> List[int]:
+        # Ids from the top-level post down to the row's parent, read off the path
+        return [int(key) for key in path.split('/')[:-1]]
+
+    @staticmethod
+    def in_subtree(path: str, include_root: bool = True):
+        # Range condition on PostModel.path matching the subtree under path
+        lower = PostModel.path >= path if include_root else PostModel.path > path
+        return and_(lower, PostModel.path < path + '0')
+
+    @staticmethod
+    def load_thread(session, path: str, include_root: bool = True) -> List[PostModel]:
+        # Every row under path in display order (one range scan on the path index)
+        return (session.query(PostModel)
+                .filter(ThreadRepository.in_subtree(path, include_root))
+                .order_by(PostModel.path)
+                .all())
+
+    @staticmethod
+    def count_subtree(session, path: str) -> int:
+        # Number of replies below path, not counting the row itself
+        return session.query(func.count(PostModel.id)).filter(ThreadRepository.in_subtree(path, False)).scalar()
+
+    @staticmethod
+    def load_thread_page(session, path: str, limit: int, after_path: Optional[str] = None) -> Tuple[List[PostModel], bool]:
+        # One page of the replies under path in display order, keyed on the last path seen
+        query = session.query(PostModel).filter(ThreadRepository.in_subtree(path, False))
+        if after_path is not None:
+            query = query.filter(PostModel.path > after_path)
+        rows = query.order_by(PostModel.path).limit(limit + 1).all()
+        return rows[:limit], len(rows) > limit
+
+    @staticmethod
+    def backfill_paths(session=None) -> int:
+        # Compute path and depth for every row in one recursive statement and
+        # return how many rows were missing a path (cheap no-op when none are)
+        close_session = False
+        if session is None:
+            session = SessionLocal()
+            close_session = True
+        try:
+            missing = session.query(func.count(PostModel.id)).filter(PostModel.path.is_(None)).scalar()
+            if not missing:
+                return 0
+            # rows whose parent is gone are treated as top-level so they still get a path
+            child = PostModel.__table__.alias('child')
+            tree = select(
+                PostModel.id.label('id'),
+                func.printf(PATH_FORMAT, PostModel.id).label('path'),
+                literal(0).label('depth'),
+            ).where(or_(
+                PostModel.parent_id.is_(None),
+                PostModel.parent_id.not_in(select(child.c.id)),
+            )).cte('paths', recursive=True)
+            tree = tree.union_all(select(
+                child.c.id,
+                tree.c.path + '/' + func.printf(PATH_FORMAT, child.c.id),
+                tree.c.depth + 1,
+            ).where(child.c.parent_id == tree.c.id))
+            session.execute(
+                update(PostModel)
+                .values(
+                    path=select(tree.c.path).where(tree.c.id == PostModel.id).scalar_subquery(),
+                    depth=select(tree.c.depth).where(tree.c.id == PostModel.id).scalar_subquery(),
+                )
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+            return missing
+        finally:
+            if close_session:
+                session.close()
@@ -1,6 +1,6 @@
-from typing import TYPE_CHECKING, Optional
-from .db import SessionLocal
-from .models import UserModel, PostModel, ReactionModel, ForumModel
+from typing import TYPE_CHECKING, Optional, Tuple
+from .db import SessionLocal, get_or_insert
+from .models import UserModel, PostModel, ReactionModel, ForumModel, forum_users
 from .object_registry import register, get as registry_get
 
 if TYPE_CHECKING:
@@ -87,6 +87,23 @@ class UserRepository:
         finally:
             session.close()
     
+    @staticmethod
+    def get_or_create(username: str, email: str, major: str, year: int, is_deleted: bool = False,
+                      is_admin: bool = False, first_name: str = '', last_name: str = '') -> Tuple['UserModel', bool]:
+        # Insert the user or find it by email; a new user is one statement
+        session = SessionLocal()
+        try:
+            user_model, created = get_or_insert(session, UserModel, ['email'], dict(
+                username=username, email=email, major=major, year=year, is_deleted=is_deleted,
+                is_admin=is_admin, first_name=first_name, last_name=last_name))
+            if created:
+                # detached first so the commit does not expire what RETURNING loaded
+                session.expunge(user_model)
+                session.commit()
+            return user_model, created
+        finally:
+            session.close()
+
     @staticmethod
     def get_posts(user: 'User') -> list:
         # Return posts for this user from the DB
@@ -94,7 +111,7 @@ class UserRepository:
         session = SessionLocal()
         try:
             db_posts = session.query(PostModel).filter(PostModel.poster_id == getattr(user, 'db_id', None)).all()
-            return [Post.from_model(db_post, session=session) for db_post in db_posts]
+            return Post.from_models(db_posts, session=session)
         finally:
             session.close()
     
@@ -104,7 +121,12 @@ class UserRepository:
         from backend.Forum import Forum
         session = SessionLocal()
         try:
-            db_forums = session.query(ForumModel).filter(ForumModel.users.any(id=getattr(user, 'db_id', None))).all()
+            # join from the membership table so the lookup uses its user_id index
+            db_forums = (session.query(ForumModel)
+                         .join(forum_users, forum_users.c.forum_id == ForumModel.id)
+                         .filter(forum_users.c.user_id == getattr(user, 'db_id', None))
+                         .order_by(ForumModel.id)
+                         .all())
             forum_wrappers = []
             for db_forum in db_forums:
                 found = None
@@ -0,0 +1,122 @@
+'''
+Slot helpers for the wrapper classes (User, Forum, Post, Reaction).
+
+Wrappers declare their fields in __slots__, so a cached wrapper carries no
+per-instance __dict__. Relationship lists (user.posts, post.comments,
+forum.posts, ...) are declared with lazy_list: the backing slot stays empty
+until the list is first read or assigned, so the many wrappers nobody walks
+never allocate them. Forum membership lists are MemberSets keyed by user id.
+'''
+import threading
+from typing import Callable, Optional
+
+# Leaf lock: held only to publish a freshly built list, never while calling out
+_MATERIALIZE_LOCK = threading.Lock()
+
+
+class lazy_list:
+    # Relationship list kept in the slot '_<name>', built on first access.
+    # factory(wrapper) returns the initial collection; the default is an empty list.
+
+    def __init__(self, factory: Optional[Callable[[object], list]] = None) -> None:
+        self.factory = factory
+
+    def __set_name__(self, owner, name: str) -> None:
+        self.name = name
+        self.slot = owner.__dict__['_' + name]
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        try:
+            return self.slot.__get__(obj, owner)
+        except AttributeError:
+            pass
+        return self.publish(obj, self.factory(obj) if self.factory is not None else [])
+
+    def publish(self, obj, items: list) -> list:
+        # Install items unless obj already has a list; returns the list obj ends up with
+        with _MATERIALIZE_LOCK:
+            # another thread may have built (and started filling) the list first
+            try:
+                return self.slot.__get__(obj, type(obj))
+            except AttributeError:
+                self.slot.__set__(obj, items)
+                return items
+
+    def __set__(self, obj, value: list) -> None:
+        self.slot.__set__(obj, value)
+
+    def __delete__(self, obj) -> None:
+        # forget the list; the next access builds it again
+        try:
+            self.slot.__delete__(obj)
+        except AttributeError:
+            pass
+
+    def is_loaded(self, obj) -> bool:
+        try:
+            self.slot.__get__(obj, type(obj))
+            return True
+        except AttributeError:
+            return False
+
+
+def slot_names(cls) -> list:
+    # Every instance slot declared along cls's MRO
+    names = []
+    for klass in cls.__mro__:
+        for name in klass.__dict__.get('__slots__', ()):
+            if name != '__weakref__' and name not in names:
+                names.append(name)
+    return names
+
+
+class MemberSet:
+    # Forum members keyed by user db id, in the order they joined. Lookups take a
+    # wrapper or an id and are O(1); add/discard are atomic, so callers need no lock.
+
+    __slots__ = ('_by_id', '_lock')
+
+    def __init__(self, users=()) -> None:
+        self._by_id = {}
+        self._lock = threading.Lock()
+        for user in users:
+            self.add(user)
+
+    @staticmethod
+    def _key(item) -> Optional[int]:
+        return item if isinstance(item, int) else getattr(item, 'db_id', None)
+
+    def __contains__(self, item) -> bool:
+        key = self._key(item)
+        return key is not None and key in self._by_id
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self):
+        # iterate a snapshot so concurrent joins and leaves cannot break the loop
+        return iter(list(self._by_id.values()))
+
+    def __repr__(self) -> str:
+        return f"MemberSet({list(self._by_id)!r})"
+
+    def get(self, user_id: int):
+        return self._by_id.get(user_id)
+
+    def add(self, user) -> bool:
+        # True if user was not a member yet
+        key = self._key(user)
+        if key is None:
+            raise ValueError("Only users stored in the database can be forum members")
+        with self._lock:
+            if key in self._by_id:
+                return False
+            self._by_id[key] = user
+            return True
+
+    def discard(self, user) -> bool:
+        # True if user was a member
+        key = self._key(user)
+        return self._by_id.pop(key, None) is not None
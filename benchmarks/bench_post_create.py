@@ -0,0 +1,100 @@
+import os
+import sys
+import tempfile
+import time
+
+'''
+Benchmark: creating a post as a user enrolled in many forums.
+
+The post endpoint used to check membership with user.getforums(), which loads
+every forum the user belongs to; it now asks one indexed EXISTS query. Times
+both membership checks on their own, then the full POST request, and counts
+the SQL statements each request issues.
+Runs against a scratch database so scu_forums.db is untouched.
+
+Usage: python -m benchmarks.bench_post_create [forums] [members_per_forum] [requests]
+'''
+
+_tmpdir = tempfile.mkdtemp()
+os.environ["SCU_FORUMS_DATABASE_URL"] = "sqlite:///" + os.path.join(_tmpdir, "bench.db")
+
+from backend.app import app  # noqa: E402
+from backend.cleanup_db import cleanup_db  # noqa: E402
+from backend.object_registry import clear as registry_clear  # noqa: E402
+from backend.User import User  # noqa: E402
+from backend.Forum import Forum  # noqa: E402
+from tests.helpers import capture_statements  # noqa: E402
+
+
+def seed(forums, members):
+    # One user enrolled in every forum; each forum has `members` other members
+    user = User("poster", "poster@scu.edu", "CSEN", 2, None, None, None)
+    others = [User(f"member{i}", f"member{i}@scu.edu", "CSEN", 2, None, None, None) for i in range(members)]
+    created = []
+    for f in range(forums):
+        forum = Forum(f"BENCH{f}")
+        forum.addUser(user)
+        for other in others:
+            forum.addUser(other)
+        created.append(forum)
+    return user, created
+
+
+def legacy_check(user, forum):
+    return forum.db_id in [f.db_id for f in user.getforums()]
+
+
+def indexed_check(user, forum):
+    is_member, is_restricted = forum.posting_status(user.db_id)
+    return is_member and not is_restricted
+
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def count_statements(fn):
+    with capture_statements() as statements:
+        fn()
+    return len(statements)
+
+
+def main(forums=20, members=20, requests=50):
+    cleanup_db()
+    user, created = seed(forums, members)
+    # start from a cold registry, as a fresh worker would: no member lists loaded
+    registry_clear()
+    user = User.load_by_db_id(user.db_id)
+    target = Forum.load_by_id(created[-1].db_id)
+    legacy = best_of(lambda: legacy_check(user, target), requests)
+    indexed = best_of(lambda: indexed_check(user, target), requests)
+
+    client = app.test_client()
+    url = f"/api/forums/{target.db_id}/posts"
+
+    def create(i=0):
+        resp = client.post(url, json={"title": "Bench", "message": f"Body {i}", "user_email": user.email})
+        if resp.status_code != 201:
+            raise SystemExit(f"post failed: {resp.status_code} {resp.get_json()}")
+
+    create()
+    statements = count_statements(create)
+    start = time.perf_counter()
+    for i in range(requests):
+        create(i)
+    per_request = (time.perf_counter() - start) / requests
+    print(f"user in {forums} forums of {members + 1} members")
+    print(f"  getforums() check : {legacy * 1000:8.3f} ms")
+    print(f"  EXISTS check      : {indexed * 1000:8.3f} ms  ({legacy / indexed:.1f}x)")
+    print(f"  POST request      : {per_request * 1000:8.3f} ms, {statements} statements")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:4]]
+    main(*args)
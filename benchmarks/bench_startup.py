@@ -0,0 +1,64 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+'''
+Benchmark: cold start, from a fresh interpreter to the first answered request.
+
+Each sample runs in its own Python process against a scratch database and
+reports the time to import backend.app and the time until GET /api/forums
+has been answered (which includes the one-time schema check). "new database"
+starts from an empty file, so the first request creates the schema;
+"existing database" reuses one that is already at the latest version.
+
+Usage: python -m benchmarks.bench_startup [samples]
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside each sample process
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from backend.app import app
+imported = time.perf_counter()
+resp = app.test_client().get('/api/forums')
+served = time.perf_counter()
+assert resp.status_code == 200, resp.status_code
+print(json.dumps({'import': imported - start, 'first_request': served - start,
+                  'google_loaded': 'google.auth' in sys.modules}))
+"""
+
+
+def sample(database):
+    env = dict(os.environ, SCU_FORUMS_DATABASE_URL="sqlite:///" + database)
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=env,
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def report(label, results):
+    imports = statistics.median(r['import'] for r in results) * 1000
+    first = statistics.median(r['first_request'] for r in results) * 1000
+    google = any(r['google_loaded'] for r in results)
+    print(f"  {label:<18}: import {imports:8.1f} ms   first request {first:8.1f} ms"
+          f"   google-auth loaded: {google}")
+
+
+def main(samples=5):
+    tmpdir = tempfile.mkdtemp()
+    fresh = []
+    for i in range(samples):
+        fresh.append(sample(os.path.join(tmpdir, f"new{i}.db")))
+    existing = os.path.join(tmpdir, "new0.db")
+    warm = [sample(existing) for _ in range(samples)]
+    print(f"Cold start, median of {samples} processes")
+    report("new database", fresh)
+    report("existing database", warm)
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:2]])
@@ -0,0 +1,116 @@
+import os
+import sys
+import tempfile
+import time
+
+'''
+Benchmark: collecting every post/comment id in a forum.
+
+Compares the old level-by-level `while changed` IN loop that delete_forum
+used against the single recursive CTE in ThreadRepository, on threads 50
+levels deep, plus per-thread range scans on the materialized path.
+Runs against a scratch database so scu_forums.db is untouched.
+
+Usage: python -m benchmarks.bench_thread_fetch [threads] [depth]
+'''
+
+_tmpdir = tempfile.mkdtemp()
+os.environ["SCU_FORUMS_DATABASE_URL"] = "sqlite:///" + os.path.join(_tmpdir, "bench.db")
+
+from backend.cleanup_db import cleanup_db  # noqa: E402
+from backend.db import SessionLocal  # noqa: E402
+from backend.models import ForumModel, PostModel  # noqa: E402
+from backend.object_registry import _REGISTRY  # noqa: E402
+from backend.thread_services import ThreadRepository  # noqa: E402
+from backend.Messages import Post  # noqa: E402
+
+
+def seed(threads, depth):
+    # One forum holding `threads` posts, each with a reply chain `depth` levels deep
+    session = SessionLocal()
+    try:
+        forum = ForumModel(course_name="BENCH")
+        session.add(forum)
+        session.flush()
+        for t in range(threads):
+            parent = PostModel(title=f"Thread {t}", message="Body", forum_id=forum.id)
+            session.add(parent)
+            session.flush()
+            for level in range(depth):
+                child = PostModel(title="Re", message=f"Reply {level}", parent_id=parent.id)
+                session.add(child)
+                session.flush()
+                parent = child
+        session.commit()
+        ThreadRepository.backfill_paths(session)
+        return forum.id
+    finally:
+        session.close()
+
+
+def legacy_ids(session, forum_id):
+    # The loop delete_forum used before: one IN query per tree level
+    to_collect = set(p.id for p in session.query(PostModel).filter(PostModel.forum_id == forum_id).all())
+    changed = True
+    while changed:
+        changed = False
+        child_posts = session.query(PostModel).filter(PostModel.parent_id.in_(to_collect)).all() if to_collect else []
+        new_ids = [cp.id for cp in child_posts if cp.id not in to_collect]
+        if new_ids:
+            to_collect.update(new_ids)
+            changed = True
+    return to_collect
+
+
+def cte_ids(session, forum_id):
+    return set(session.execute(ThreadRepository.forum_ids(forum_id)).scalars())
+
+
+def path_ids(session, forum_id):
+    # Same ids from one materialized path range scan per top-level post
+    ids = set()
+    for root in session.query(PostModel).filter(PostModel.forum_id == forum_id).all():
+        ids.update(m.id for m in ThreadRepository.load_thread(session, root.path))
+    return ids
+
+
+def load_posts(session, forum_id):
+    _REGISTRY.clear()
+    roots = session.query(PostModel).filter(PostModel.forum_id == forum_id).all()
+    return Post.from_models(roots, session=session)
+
+
+def timed(fn, forum_id, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        session = SessionLocal()
+        try:
+            start = time.perf_counter()
+            result = fn(session, forum_id)
+            elapsed = time.perf_counter() - start
+        finally:
+            session.close()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(threads=20, depth=50, repeat=5):
+    cleanup_db()
+    forum_id = seed(threads, depth)
+    legacy_time, legacy = timed(legacy_ids, forum_id, repeat)
+    cte_time, cte = timed(cte_ids, forum_id, repeat)
+    path_time, by_path = timed(path_ids, forum_id, repeat)
+    if not legacy == cte == by_path:
+        raise SystemExit("CTE, path scan and legacy loop disagree")
+    load_time, posts = timed(load_posts, forum_id, repeat)
+    print(f"{threads} threads x {depth} levels ({len(cte)} rows)")
+    print(f"  legacy IN loop : {legacy_time * 1000:8.2f} ms")
+    print(f"  recursive CTE  : {cte_time * 1000:8.2f} ms  ({legacy_time / cte_time:.1f}x)")
+    print(f"  path range scans: {path_time * 1000:8.2f} ms  ({legacy_time / path_time:.1f}x)")
+    print(f"  Post.from_models ({len(posts)} threads): {load_time * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
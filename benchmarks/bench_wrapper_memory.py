@@ -0,0 +1,148 @@
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+'''
+Benchmark: memory held per cached Post and Reaction wrapper.
+
+Seeds a forum whose threads each have a few comments and reactions, loads
+every thread through Post.from_models into the identity registry and reports:
+
+  own bytes  - the wrapper object itself plus its attribute storage
+               (__dict__ or slots) and any list objects it carries, but not
+               the row values (titles, messages) which any layout must keep;
+  retained   - tracemalloc growth per cached Post + Reaction after the load,
+               once sessions and ORM rows are gone (includes row values).
+
+Own bytes are also reported for a __dict__ copy of each wrapper with every
+relationship list allocated, the layout the wrappers had before slots, so
+one run compares both. Runs against a scratch database so scu_forums.db is
+untouched.
+
+Usage: python -m benchmarks.bench_wrapper_memory [threads] [comments] [reactions]
+'''
+
+_tmpdir = tempfile.mkdtemp()
+os.environ["SCU_FORUMS_DATABASE_URL"] = "sqlite:///" + os.path.join(_tmpdir, "bench.db")
+# keep every loaded wrapper cached so all of them are measured
+os.environ.setdefault("SCU_FORUMS_REGISTRY_CAPACITY", "1000000")
+
+from backend.cleanup_db import cleanup_db  # noqa: E402
+from backend.db import SessionLocal  # noqa: E402
+from backend.models import ForumModel, PostModel, ReactionModel, UserModel  # noqa: E402
+from backend.object_registry import _REGISTRY  # noqa: E402
+from backend.thread_services import ThreadRepository  # noqa: E402
+from backend.wrapper_fields import lazy_list, slot_names  # noqa: E402
+from backend.Messages import Post, Reaction  # noqa: E402
+
+REACTION_TYPES = ["like", "dislike", "heart", "flag"]
+
+
+def seed(threads, comments, reactions):
+    # `threads` posts, each with `comments` replies; every post and reply gets `reactions` reactions
+    session = SessionLocal()
+    try:
+        users = [UserModel(username=f"u{i}", email=f"u{i}@scu.edu", major="CSEN", year=2)
+                 for i in range(max(1, reactions))]
+        session.add_all(users)
+        forum = ForumModel(course_name="BENCH")
+        session.add(forum)
+        session.flush()
+        for t in range(threads):
+            root = PostModel(title=f"Thread {t}", message="Body", forum_id=forum.id, poster_id=users[0].id)
+            session.add(root)
+            session.flush()
+            rows = [root]
+            for c in range(comments):
+                reply = PostModel(title="Re", message=f"Reply {c}", parent_id=root.id, poster_id=users[0].id)
+                session.add(reply)
+                rows.append(reply)
+            session.flush()
+            for row in rows:
+                for r in range(reactions):
+                    session.add(ReactionModel(reaction_type=REACTION_TYPES[r % len(REACTION_TYPES)],
+                                              user_id=users[r].id, parent_id=row.id))
+        session.commit()
+        ThreadRepository.backfill_paths(session)
+        return forum.id
+    finally:
+        session.close()
+
+
+def own_size(obj):
+    # Wrapper plus its attribute storage and list containers, not the values in them
+    size = sys.getsizeof(obj)
+    values = []
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+        values.extend(vars(obj).values())
+    for klass in type(obj).__mro__:
+        for name in klass.__dict__.get('__slots__', ()):
+            if name != '__weakref__' and hasattr(obj, name):
+                values.append(getattr(obj, name))
+    return size + sum(sys.getsizeof(v) for v in values if isinstance(v, list))
+
+
+class DictWrapper:
+    # Baseline layout: attributes in a per-instance __dict__, lists allocated up front
+    pass
+
+
+def dict_copy(wrapper):
+    # The same wrapper state in the baseline layout
+    copy = DictWrapper()
+    for klass in type(wrapper).__mro__:
+        for name, field in vars(klass).items():
+            if isinstance(field, lazy_list):
+                setattr(copy, name, list(getattr(wrapper, name)) if field.is_loaded(wrapper) else [])
+    for name in slot_names(type(wrapper)):
+        if not name.startswith('_') and hasattr(wrapper, name):
+            setattr(copy, name, getattr(wrapper, name))
+    return copy
+
+
+def cached_wrappers():
+    # Every live Post and Reaction wrapper, found without reading (and so
+    # allocating) any relationship list
+    objects = gc.get_objects()
+    return ([o for o in objects if isinstance(o, Post)],
+            [o for o in objects if isinstance(o, Reaction)])
+
+
+def load(forum_id):
+    session = SessionLocal()
+    try:
+        roots = session.query(PostModel).filter(PostModel.forum_id == forum_id).all()
+        return Post.from_models(roots, session=session)
+    finally:
+        session.close()
+
+
+def main(threads=2000, comments=4, reactions=3):
+    cleanup_db()
+    forum_id = seed(threads, comments, reactions)
+    _REGISTRY.clear()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    roots = load(forum_id)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    posts, reacts = cached_wrappers()
+    post_bytes = sum(own_size(p) for p in posts) / len(posts)
+    reaction_bytes = sum(own_size(r) for r in reacts) / max(1, len(reacts))
+    dict_post_bytes = sum(own_size(dict_copy(p)) for p in posts) / len(posts)
+    dict_reaction_bytes = sum(own_size(dict_copy(r)) for r in reacts) / max(1, len(reacts))
+    print(f"{len(roots)} threads: {len(posts)} posts, {len(reacts)} reactions cached")
+    print("                           slots  __dict__")
+    print(f"  own bytes per Post     : {post_bytes:5.0f}  {dict_post_bytes:8.0f}")
+    print(f"  own bytes per Reaction : {reaction_bytes:5.0f}  {dict_reaction_bytes:8.0f}")
+    print(f"  retained per cached slots wrapper (incl. row values): {retained / (len(posts) + len(reacts)):8.0f}")
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:4]])
@@ -0,0 +1,18 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from backend.db import engine
+
+
+@contextmanager
+def capture_statements(parameters: bool = False):
+    # Collect the SQL sent to the engine inside the block, with its parameters if asked
+    statements = []
+
+    def _before(conn, cursor, statement, params, context, executemany):
+        statements.append((statement, params) if parameters else statement)
+
+    event.listen(engine, "before_cursor_execute", _before)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", _before)
@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import unittest
+from backend import coherence
+from backend.app import app
+from backend.cleanup_db import cleanup_db
+from backend.coherence import ChangeWatcher, install_triggers, sync_registry
+from backend.db import engine
+from backend.object_registry import get as registry_get
+from backend.User import User
+from backend.Forum import Forum
+from backend.Messages import Post, Comment
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a separate worker process with coherence on
+RESTRICT_SCRIPT = """
+import sys
+from backend.Forum import Forum
+from backend.User import User
+Forum.load_by_id(int(sys.argv[1])).restrictUser(User.load_by_db_id(int(sys.argv[2])))
+"""
+
+
+class TestCoherence(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+        coherence.enable()
+        coherence._WATCHER.reset_counters()
+        self.user = User("alice", "alice@scu.edu", "CSEN", 2, None, None, None)
+        self.other = User("bob", "bob@scu.edu", "CSEN", 3, None, None, None)
+        self.forum = Forum("CSEN174")
+        self.forum.addUser(self.user)
+        self.forum.addUser(self.other)
+        self.post = Post(poster=self.user, message="Body", title="Title")
+        self.forum.addPost(self.post)
+        self.comment = Comment(poster=self.other, message="Reply", title="Re", parent=self.post)
+        self.reply = Comment(poster=self.user, message="Reply 2", title="Re", parent=self.comment)
+        sync_registry()
+
+    def tearDown(self):
+        coherence.disable()
+
+    def _other_worker(self, *statements):
+        # A second process's connection: same triggers, different origin
+        conn = sqlite3.connect(engine.url.database, isolation_level=None)
+        try:
+            install_triggers(conn, origin='other-worker')
+            for statement, params in statements:
+                conn.execute(statement, params)
+        finally:
+            conn.close()
+
+    def test_own_writes_keep_wrappers(self):
+        Comment(poster=self.user, message="Local", title="Re", parent=self.post)
+        self.assertEqual(sync_registry(), 0)
+        self.assertIs(Post.load_by_id(self.post.db_id), self.post)
+        self.assertEqual(len(self.post.comments), 2)
+        self.assertEqual(coherence.stats()['changes'], 0)
+
+    def test_unchanged_database_skips_log(self):
+        sync_registry()
+        sync_registry()
+        stats = coherence.stats()
+        self.assertGreaterEqual(stats['skipped'], 1)
+
+    def test_edit_elsewhere_drops_post_and_ancestors(self):
+        self._other_worker(("UPDATE posts SET message = ? WHERE id = ?", ("Edited", self.reply.db_id)))
+        self.assertGreater(sync_registry(), 0)
+        for wrapper in (self.reply, self.comment, self.post):
+            self.assertIsNone(registry_get('Post', wrapper.db_id))
+        root = Post.load_by_id(self.post.db_id)
+        self.assertIsNot(root, self.post)
+        self.assertEqual(root.comments[0].comments[0].message, "Edited")
+        # other forums' and users' wrappers are untouched
+        self.assertIs(registry_get('User', self.other.db_id), self.other)
+
+    def test_reaction_elsewhere_drops_its_post(self):
+        self._other_worker(("INSERT INTO reactions (reaction_type, user_id, parent_id) VALUES ('like', ?, ?)",
+                            (self.other.db_id, self.comment.db_id)))
+        sync_registry()
+        self.assertIsNone(registry_get('Post', self.comment.db_id))
+        self.assertIsNone(registry_get('Post', self.post.db_id))
+        self.assertEqual(len(Post.load_by_id(self.comment.db_id).reactions), 1)
+
+    def test_restrict_in_other_process(self):
+        self.assertIs(Forum.load_by_id(self.forum.db_id), self.forum)
+        env = dict(os.environ, SCU_FORUMS_REGISTRY_COHERENCE='1')
+        subprocess.run([sys.executable, '-c', RESTRICT_SCRIPT, str(self.forum.db_id), str(self.other.db_id)],
+                       cwd=ROOT, env=env, check=True, capture_output=True)
+        # the next request notices before it loads anything
+        app.test_client().get("/api/metrics")
+        forum = Forum.load_by_id(self.forum.db_id)
+        self.assertIsNot(forum, self.forum)
+        self.assertEqual([u.db_id for u in forum.restricted], [self.other.db_id])
+        self.assertGreater(coherence.stats()['changes'], 0)
+
+    def test_falling_behind_pruned_log_clears_registry(self):
+        watcher = ChangeWatcher(origin='lagging', retain=2)
+        watcher.enable(engine.url.database)
+        try:
+            User.load_by_db_id(self.user.db_id)
+            for i in range(5):
+                self._other_worker(("UPDATE users SET major = ? WHERE id = ?", (f"M{i}", self.other.db_id)))
+            # some other worker prunes the log before this one catches up
+            self._other_worker(("DELETE FROM row_changes WHERE id < (SELECT MAX(id) FROM row_changes)", ()))
+            watcher.poll()
+            self.assertEqual(watcher.resets, 1)
+            self.assertIsNone(registry_get('User', self.user.db_id))
+        finally:
+            watcher.disable()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import threading
+import unittest
+from backend.app import app
+from backend.cleanup_db import cleanup_db
+from backend.db import SessionLocal
+from backend.models import PostModel, ReactionModel
+from backend.object_registry import _REGISTRY, get_or_register, add_unique
+from backend.User import User
+from backend.Forum import Forum
+from backend.Messages import Post, Comment, Reaction
+
+THREADS = 8
+ROUNDS = 5
+
+
+class Thing:
+    pass
+
+
+def run_threads(target, count=THREADS):
+    # Start all workers together and re-raise the first failure in the test thread
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def worker(index):
+        try:
+            barrier.wait()
+            target(index)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            SessionLocal.remove()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+
+
+class TestConcurrency(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+        self.forum = Forum("CSEN174")
+        self.users = [User(f"user{i}", f"user{i}@scu.edu", "CSEN", 2, None, None, None) for i in range(THREADS)]
+        for user in self.users:
+            self.forum.addUser(user)
+        self.root = Post(poster=self.users[0], message="Root", title="Root")
+        self.forum.addPost(self.root)
+
+    def _count(self, model, **filters):
+        session = SessionLocal()
+        try:
+            return session.query(model).filter_by(**filters).count()
+        finally:
+            session.close()
+
+    def assertNoDuplicates(self, items):
+        self.assertEqual(len({id(item) for item in items}), len(items))
+
+    def test_api_posts_comments_and_reactions(self):
+        statuses = []
+
+        def worker(index):
+            client = app.test_client()
+            email = self.users[index].email
+            for i in range(ROUNDS):
+                resp = client.post(f"/api/forums/{self.forum.db_id}/posts",
+                                   json={"title": f"T{index}", "message": f"Body {index}-{i}", "user_email": email})
+                statuses.append(resp.status_code)
+                resp = client.post(f"/api/posts/{self.root.db_id}/comments",
+                                   json={"message": f"Reply {index}-{i}", "user_email": email})
+                statuses.append(resp.status_code)
+            resp = client.get(f"/api/posts/react/{self.root.db_id}/1/{self.users[index].db_id}")
+            statuses.append(resp.status_code)
+
+        run_threads(worker)
+        self.assertEqual(set(statuses), {201})
+
+        root = Post.load_by_id(self.root.db_id)
+        self.assertIs(root, self.root)
+        self.assertEqual(self._count(PostModel, forum_id=self.forum.db_id), THREADS * ROUNDS + 1)
+        self.assertEqual(self._count(PostModel, parent_id=self.root.db_id), THREADS * ROUNDS)
+        self.assertEqual(len(self.forum.posts), THREADS * ROUNDS + 1)
+        self.assertNoDuplicates(self.forum.posts)
+        self.assertEqual(len(root.comments), THREADS * ROUNDS)
+        self.assertNoDuplicates(root.comments)
+        self.assertEqual(len(root.reactions), THREADS)
+        self.assertEqual(self._count(ReactionModel, parent_id=self.root.db_id), THREADS)
+
+    def test_wrapper_mutations(self):
+        # Same wrappers shared by every thread, no HTTP layer in between
+        def worker(index):
+            user = self.users[index]
+            for i in range(ROUNDS):
+                post = Post(poster=user, message=f"Body {index}-{i}", title="T")
+                user.addPost(self.forum, post)
+                Comment(poster=user, message=f"Reply {index}-{i}", title="Re", parent=self.root)
+            self.root.togglereaction(Reaction("heart", user))
+
+        run_threads(worker)
+        self.assertEqual(len(self.forum.posts), THREADS * ROUNDS + 1)
+        self.assertNoDuplicates(self.forum.posts)
+        self.assertEqual(len(self.root.comments), THREADS * ROUNDS)
+        self.assertNoDuplicates(self.root.comments)
+        self.assertEqual(len(self.root.reactions), THREADS)
+        self.assertEqual([c.db_id for c in self.root.getcomments()].count(self.root.comments[0].db_id), 1)
+
+    def test_concurrent_toggle_is_consistent(self):
+        # An even number of toggles by one user leaves no reaction behind
+        user = self.users[0]
+
+        def worker(index):
+            self.root.togglereaction(Reaction("like", user))
+
+        run_threads(worker)
+        self.assertEqual(len(self.root.reactions), 0)
+        self.assertEqual(self._count(ReactionModel, parent_id=self.root.db_id), 0)
+
+    def test_concurrent_loads_share_one_wrapper(self):
+        for i in range(3):
+            Comment(poster=self.users[i], message=f"Reply {i}", title="Re", parent=self.root)
+        post_id = self.root.db_id
+        _REGISTRY.clear()
+        loaded = [None] * THREADS
+
+        def worker(index):
+            loaded[index] = Post.load_by_id(post_id)
+
+        run_threads(worker)
+        self.assertTrue(all(post is loaded[0] for post in loaded))
+        self.assertEqual(len(loaded[0].comments), 3)
+        for comment in loaded[0].comments:
+            self.assertIs(Post.load_by_id(comment.db_id), comment)
+
+    def test_registry_primitives(self):
+        winners = [None] * THREADS
+        items = []
+
+        def worker(index):
+            winners[index] = get_or_register('Thing', 1, Thing())
+            add_unique(self, items, 'same')
+
+        run_threads(worker)
+        self.assertTrue(all(w is winners[0] for w in winners))
+        self.assertEqual(items, ['same'])
+
+
+if __name__ == '__main__':
+    unittest.main()
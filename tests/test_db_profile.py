@@ -0,0 +1,111 @@
+import sqlite3
+import threading
+import time
+import unittest
+from backend.app import app
+from backend.cleanup_db import cleanup_db
+from backend.db import engine, load_profile, SessionLocal, begin_write, ENGINE_PROFILE, LOCK_METRICS
+from backend.User import User
+from backend.Forum import Forum
+
+
+class TestDbProfile(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+        LOCK_METRICS.reset()
+        self.client = app.test_client()
+
+    def _pragma(self, name):
+        with engine.connect() as conn:
+            return conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+    def _hold_write_lock(self):
+        # Second, independent connection that owns the write lock until closed
+        holder = sqlite3.connect(engine.url.database, check_same_thread=False)
+        holder.isolation_level = None
+        holder.execute("BEGIN IMMEDIATE")
+        return holder
+
+    def test_profile_pragmas_applied(self):
+        self.assertEqual(self._pragma("journal_mode"), "wal")
+        self.assertEqual(self._pragma("synchronous"), 1)
+        self.assertEqual(self._pragma("busy_timeout"), ENGINE_PROFILE["pragmas"]["busy_timeout"])
+        self.assertEqual(self._pragma("temp_store"), 2)
+        self.assertEqual(self._pragma("cache_size"), ENGINE_PROFILE["pragmas"]["cache_size"])
+
+    def test_load_profile_from_environment(self):
+        profile = load_profile({})
+        self.assertEqual(profile["name"], "concurrent")
+        self.assertEqual(profile["pragmas"]["journal_mode"], "WAL")
+
+        profile = load_profile({"SCU_FORUMS_DB_PROFILE": "durable", "SCU_FORUMS_DB_BUSY_TIMEOUT": "250",
+                                "SCU_FORUMS_DB_TEMP_STORE": "memory"})
+        self.assertEqual(profile["pragmas"], {"journal_mode": "WAL", "synchronous": "FULL",
+                                              "busy_timeout": 250, "temp_store": "MEMORY"})
+        self.assertEqual(load_profile({"SCU_FORUMS_DB_PROFILE": "legacy"})["pragmas"], {})
+
+        with self.assertRaises(ValueError):
+            load_profile({"SCU_FORUMS_DB_PROFILE": "fastest"})
+        with self.assertRaises(ValueError):
+            load_profile({"SCU_FORUMS_DB_SYNCHRONOUS": "sometimes"})
+        with self.assertRaises(ValueError):
+            load_profile({"SCU_FORUMS_DB_MMAP_SIZE": "lots"})
+
+    def test_write_waits_for_lock(self):
+        # A writer blocked by another connection waits instead of failing
+        holder = self._hold_write_lock()
+        releaser = threading.Timer(0.2, holder.commit)
+        releaser.start()
+        try:
+            session = SessionLocal()
+            try:
+                begin_write(session)
+                session.rollback()
+            finally:
+                session.close()
+        finally:
+            releaser.join()
+            holder.close()
+        stats = LOCK_METRICS.snapshot()
+        self.assertEqual(stats["write_begins"], 1)
+        self.assertEqual(stats["lock_waits"], 1)
+        self.assertGreaterEqual(stats["lock_wait_seconds"], 0.1)
+        self.assertEqual(stats["gave_up"], 0)
+
+    def test_busy_write_request_retries_then_503(self):
+        user = User("alice", "alice@scu.edu", "CSEN", 2, None, None, None)
+        forum = Forum("CSEN174")
+        forum.addUser(user)
+        saved = dict(ENGINE_PROFILE)
+        ENGINE_PROFILE.update(lock_retries=2, lock_backoff_ms=1)
+        holder = self._hold_write_lock()
+        try:
+            # leave a single pooled connection, the one the request will get, and make it give up quickly
+            engine.dispose()
+            with engine.connect() as conn:
+                conn.exec_driver_sql("PRAGMA busy_timeout = 10")
+            start = time.perf_counter()
+            resp = self.client.post(f"/api/forums/{forum.db_id}/posts",
+                                    json={"title": "Busy", "message": "Body", "user_email": user.email})
+            self.assertLess(time.perf_counter() - start, 2)
+        finally:
+            holder.rollback()
+            holder.close()
+            ENGINE_PROFILE.clear()
+            ENGINE_PROFILE.update(saved)
+            # fresh connections get the profile's busy_timeout again
+            engine.dispose()
+        self.assertEqual(resp.status_code, 503)
+        stats = self.client.get("/api/metrics").get_json()["database"]["locks"]
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(stats["gave_up"], 1)
+        self.assertGreaterEqual(stats["lock_errors"], 3)
+
+        # once the lock is free the same request goes through
+        resp = self.client.post(f"/api/forums/{forum.db_id}/posts",
+                                json={"title": "Busy", "message": "Body", "user_email": user.email})
+        self.assertEqual(resp.status_code, 201)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -41,6 +41,21 @@ class TestForum(unittest.TestCase):
         self.assertEqual(retrieved_post.getcomments()[0].getmessage(), "Reply", "Comment message should match")
         self.assertEqual(retrieved_post.getcomments()[0].getparent(), post, "Comment should reference correct parent post")
 
+    def test_posts_page(self):
+        # Test keyset pages cover every post exactly once, in creation order
+        posts = []
+        for i in range(3):
+            post = Post(poster=self.user, message=f"Body {i}", title=f"Title {i}")
+            self.forum.addPost(post)
+            posts.append(post)
+
+        first, cursor = self.forum.getPostsPage(2)
+        self.assertEqual(first, posts[:2], "First page should hold the two oldest posts")
+        self.assertIsNotNone(cursor, "A cursor should be returned while posts remain")
+        second, cursor = self.forum.getPostsPage(2, cursor)
+        self.assertEqual(second, posts[2:], "Second page should hold the remaining post")
+        self.assertIsNone(cursor, "No cursor should be returned on the last page")
+
     def test_authorized_users(self):
         # Test getting users with admin permissions
         # Initially no authorized users
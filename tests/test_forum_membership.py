@@ -0,0 +1,195 @@
+import unittest
+from backend.app import app
+from backend.cleanup_db import cleanup_db
+from backend.db import SessionLocal, begin_unit_of_work, end_unit_of_work
+from backend.models import forum_users, forum_authorized, forum_restricted
+from backend.forum_services import ForumMembershipService
+from backend.object_registry import clear as registry_clear
+from backend.wrapper_fields import MemberSet
+from backend.User import User
+from backend.Forum import Forum
+from backend.Messages import Post, Comment
+from tests.helpers import capture_statements
+
+
+class TestForumMembership(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+        self.users = [User(f"user{i}", f"user{i}@scu.edu", "CSEN", 2, None, None, None) for i in range(4)]
+        self.forums = [Forum(f"CSEN{100 + i}") for i in range(3)]
+        for forum in self.forums:
+            for user in self.users[:3]:
+                forum.addUser(user)
+        self.forums[0].authorizeUser(self.users[1])
+        self.forums[0].restrictUser(self.users[2])
+
+    def _statements(self, fn):
+        with capture_statements() as statements:
+            result = fn()
+        return result, statements
+
+    def _reloaded(self):
+        registry_clear()
+        return [Forum.load_by_id(f.db_id) for f in self.forums]
+
+    def test_from_model_skips_members(self):
+        registry_clear()
+        forum, statements = self._statements(lambda: Forum.load_by_id(self.forums[0].db_id))
+        self.assertEqual(len(statements), 1)
+        for kind in ('users', 'authorized', 'restricted'):
+            self.assertFalse(getattr(Forum, kind).is_loaded(forum))
+        # first access loads them, in the order members were added
+        self.assertEqual([u.db_id for u in forum.users], [u.db_id for u in self.users[:3]])
+        self.assertEqual([u.db_id for u in forum.authorized], [self.users[1].db_id])
+        self.assertEqual([u.db_id for u in forum.restricted], [self.users[2].db_id])
+
+    def test_batched_loader(self):
+        forums = self._reloaded()
+        _, statements = self._statements(lambda: ForumMembershipService.load_members(forums))
+        # one query for the memberships, one for the users not yet cached
+        self.assertEqual(len(statements), 2)
+        _, statements = self._statements(lambda: [list(f.users) + list(f.authorized) + list(f.restricted) for f in forums])
+        self.assertEqual(statements, [])
+        self.assertEqual([u.db_id for u in forums[2].users], [u.db_id for u in self.users[:3]])
+        self.assertEqual(len(forums[1].restricted), 0)
+        self.assertIs(forums[0].users.get(self.users[0].db_id), User.load_by_db_id(self.users[0].db_id))
+        # already loaded lists are kept
+        _, statements = self._statements(lambda: ForumMembershipService.load_members(forums))
+        self.assertEqual(statements, [])
+
+    def test_member_count_and_is_member(self):
+        forum = self._reloaded()[0]
+        (count, member, outsider), statements = self._statements(lambda: (
+            forum.member_count(), forum.is_member(self.users[0].db_id), forum.is_member(self.users[3].db_id)))
+        self.assertEqual((count, member, outsider), (3, True, False))
+        self.assertEqual(len(statements), 3)
+        self.assertFalse(Forum.users.is_loaded(forum))
+        forum.users
+        _, statements = self._statements(lambda: (forum.member_count(), forum.is_member(self.users[0].db_id)))
+        self.assertEqual(statements, [])
+
+    def test_forum_listing_queries_do_not_grow_with_forums(self):
+        client = app.test_client()
+        url = "/api/forums?fields=course_name,users,authorized_users,restricted_users"
+        client.get(url)
+        registry_clear()
+        _, few = self._statements(lambda: client.get(url))
+        for i in range(3):
+            Forum(f"COEN{i}").addUser(self.users[0])
+        registry_clear()
+        resp, more = self._statements(lambda: client.get(url))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(few), len(more))
+        first = resp.get_json()['forums'][0]
+        self.assertEqual([u['id'] for u in first['authorized_users']], [self.users[1].db_id])
+
+    def _rows(self, table, forum):
+        session = SessionLocal()
+        try:
+            return {row.user_id for row in session.execute(table.select().where(table.c.forum_id == forum.db_id))}
+        finally:
+            session.close()
+
+    def test_member_set(self):
+        members = MemberSet(self.users[:2])
+        self.assertIn(self.users[0], members)
+        self.assertIn(self.users[1].db_id, members)
+        self.assertNotIn(self.users[2], members)
+        self.assertFalse(members.add(self.users[0]))
+        self.assertTrue(members.add(self.users[2]))
+        self.assertTrue(members.discard(self.users[0]))
+        self.assertFalse(members.discard(self.users[0]))
+        self.assertEqual([u.db_id for u in members], [self.users[1].db_id, self.users[2].db_id])
+        self.assertIs(members.get(self.users[2].db_id), self.users[2])
+
+    def test_sets_follow_association_tables(self):
+        forum = self.forums[0]
+        self.assertIsInstance(forum.users, MemberSet)
+        forum.addUser(self.users[0])
+        forum.restrictUser(self.users[1])
+        self.assertEqual(self._rows(forum_users, forum), {u.db_id for u in forum.users})
+        self.assertEqual(self._rows(forum_authorized, forum), set())
+        self.assertEqual(self._rows(forum_restricted, forum), {self.users[1].db_id, self.users[2].db_id})
+        forum.removeUser(self.users[2])
+        self.assertNotIn(self.users[2].db_id, forum.restricted)
+        self.assertEqual(self._rows(forum_restricted, forum), {self.users[1].db_id})
+        self.assertEqual(self._rows(forum_users, forum), {u.db_id for u in forum.users})
+
+    def test_rolled_back_membership_is_dropped(self):
+        begin_unit_of_work(write=True)
+        self.forums[1].addUser(self.users[3])
+        end_unit_of_work(commit=False)
+        forum = Forum.load_by_id(self.forums[1].db_id)
+        self.assertIsNot(forum, self.forums[1])
+        self.assertNotIn(self.users[3], forum.users)
+
+    def test_checks_do_not_grow_with_members(self):
+        small, large = self.forums[1], self.forums[2]
+        for i in range(40):
+            large.addUser(User(f"extra{i}", f"extra{i}@scu.edu", "CSEN", 1, None, None, None))
+        _, few = self._statements(lambda: small.authorizeUser(self.users[0]))
+        _, many = self._statements(lambda: large.authorizeUser(self.users[0]))
+        self.assertEqual(len(few), len(many))
+
+    def test_posting_status_is_one_query(self):
+        forum = self._reloaded()[0]
+        checks = [self.users[0], self.users[2], self.users[3]]
+        results, statements = self._statements(lambda: [forum.posting_status(u.db_id) for u in checks])
+        self.assertEqual(results, [(True, False), (True, True), (False, False)])
+        self.assertEqual(len(statements), len(checks))
+        self.assertFalse(Forum.users.is_loaded(forum))
+        # answered from memory once both sets are loaded
+        forum.users, forum.restricted
+        _, statements = self._statements(lambda: forum.posting_status(self.users[2].db_id))
+        self.assertEqual(statements, [])
+
+    def test_thread_posting_status(self):
+        post = Post(poster=self.users[0], message="Body", title="Title")
+        self.forums[0].addPost(post)
+        reply = Comment(poster=self.users[1], message="Reply", title="Re", parent=post)
+        status, statements = self._statements(
+            lambda: ForumMembershipService.thread_posting_status(reply.db_id, self.users[2].db_id))
+        self.assertEqual(status, (True, True))
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(ForumMembershipService.thread_posting_status(reply.db_id, self.users[3].db_id), (False, False))
+        loose = Post(poster=self.users[3], message="Body", title="No forum")
+        self.assertIsNone(ForumMembershipService.thread_posting_status(loose.db_id, self.users[3].db_id))
+
+    def test_post_and_comment_endpoints_check_membership(self):
+        client = app.test_client()
+        forum = self.forums[0]
+
+        def create(user):
+            return client.post(f"/api/forums/{forum.db_id}/posts",
+                               json={"title": "T", "message": "Body", "user_email": user.email})
+
+        resp = create(self.users[0])
+        self.assertEqual(resp.status_code, 201)
+        post_id = resp.get_json()['post']['id']
+        self.assertEqual(create(self.users[3]).status_code, 403)
+        self.assertEqual(create(self.users[2]).status_code, 400)
+        for user, status in ((self.users[1], 201), (self.users[3], 403), (self.users[2], 400)):
+            resp = client.post(f"/api/posts/{post_id}/comments", json={"message": "Reply", "user_email": user.email})
+            self.assertEqual(resp.status_code, status, user.email)
+
+    def test_post_creation_does_not_grow_with_enrollments(self):
+        client = app.test_client()
+        user = self.users[0]
+
+        def create():
+            resp = client.post(f"/api/forums/{self.forums[1].db_id}/posts",
+                               json={"title": "T", "message": "Body", "user_email": user.email})
+            self.assertEqual(resp.status_code, 201)
+
+        create()
+        registry_clear()
+        _, few = self._statements(create)
+        for i in range(10):
+            Forum(f"COEN{i}").addUser(user)
+        registry_clear()
+        _, many = self._statements(create)
+        self.assertEqual(len(few), len(many))
+
+
+if __name__ == '__main__':
+    unittest.main()
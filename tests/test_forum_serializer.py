@@ -0,0 +1,155 @@
+import unittest
+from backend.app import app, _serialize_forum, _serialize_post
+from backend.cleanup_db import cleanup_db
+from backend.object_registry import _REGISTRY
+from backend.serializers import ForumSerializer, FieldSelection
+from backend.User import User
+from backend.Forum import Forum
+from backend.Messages import Post, Comment, Reaction
+from tests.helpers import capture_statements
+
+
+class TestForumSerializer(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+        self.client = app.test_client()
+        self.user = User("alice", "alice@scu.edu", "CSEN", 2, None, None, None)
+        self.other = User("bob", "bob@scu.edu", "CSEN", 3, None, None, None)
+        self.forum = Forum("CSEN174")
+        self.forum.addUser(self.user)
+        self.forum.addUser(self.other)
+        self.forum.authorizeUser(self.other)
+
+    def _add_thread(self, title, depth):
+        # Post with a reply chain `depth` levels deep and a reaction on each level
+        post = Post(poster=self.user, message="Body", title=title)
+        self.forum.addPost(post)
+        parent = post
+        for level in range(depth):
+            parent.togglereaction(Reaction("like", self.other))
+            poster = self.other if level % 2 == 0 else self.user
+            parent = Comment(poster=poster, message=f"Reply {level}", title="Re", parent=parent)
+        return post
+
+    def _reload_forum(self):
+        # Fresh wrappers straight from the DB rather than the in-memory ones
+        _REGISTRY.clear()
+        return Forum.load_by_id(self.forum.db_id)
+
+    def _count_queries(self, fn):
+        with capture_statements() as statements:
+            result = fn()
+        return result, len(statements)
+
+    def test_matches_wrapper_serializer(self):
+        # Bulk output should be identical to the wrapper based serializer
+        self._add_thread("First", 3)
+        self._add_thread("Second", 1)
+        expected = _serialize_forum(self._reload_forum())
+        self.assertEqual(ForumSerializer.serialize_forum(self.forum.db_id), expected)
+        self.assertEqual(ForumSerializer.serialize_posts(self.forum.db_id), expected['posts'])
+
+    def test_query_count_is_constant(self):
+        # Query count should not grow with posts, comments or reactions
+        self._add_thread("Small", 1)
+        _, small = self._count_queries(lambda: ForumSerializer.serialize_forum(self.forum.db_id))
+        for i in range(5):
+            self._add_thread(f"Big {i}", 4)
+        payload, big = self._count_queries(lambda: ForumSerializer.serialize_forum(self.forum.db_id))
+        self.assertEqual(len(payload['posts']), 6)
+        self.assertEqual(small, big)
+
+    def test_forum_endpoints(self):
+        self._add_thread("Endpoint", 2)
+        resp = self.client.get(f"/api/forums/{self.forum.db_id}")
+        self.assertEqual(resp.status_code, 200)
+        data = resp.get_json()
+        self.assertEqual(data["authorized_users"][0]["username"], "bob")
+        self.assertEqual(data["posts"], _serialize_forum(self._reload_forum())["posts"])
+
+        resp = self.client.get(f"/api/forums/{self.forum.db_id}/posts")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()["posts"][0]["comments"][0]["comments"][0]["message"], "Reply 1")
+
+        self.assertEqual(self.client.get("/api/forums/9999").status_code, 404)
+        self.assertEqual(self.client.get("/api/forums/9999/posts").status_code, 404)
+
+    def test_forum_summaries(self):
+        # Directory view returns counts only and pages by forum id
+        self._add_thread("Counted", 2)
+        Forum("MATH51")
+        Forum("COEN10")
+        resp = self.client.get("/api/forums?view=summary&limit=2")
+        self.assertEqual(resp.status_code, 200)
+        data = resp.get_json()
+        self.assertEqual([f["course_name"] for f in data["forums"]], ["CSEN174", "MATH51"])
+        first = data["forums"][0]
+        self.assertEqual(set(first), {"id", "course_name", "created_at", "member_count", "post_count", "last_activity"})
+        self.assertEqual(first["member_count"], 2)
+        self.assertEqual(first["post_count"], 1)
+        self.assertEqual(data["forums"][1]["last_activity"], data["forums"][1]["created_at"])
+
+        resp = self.client.get(f"/api/forums?view=summary&limit=2&cursor={data['next_cursor']}")
+        data = resp.get_json()
+        self.assertEqual([f["course_name"] for f in data["forums"]], ["COEN10"])
+        self.assertIsNone(data["next_cursor"])
+        self.assertEqual(self.client.get("/api/forums?view=summary&cursor=bogus").status_code, 400)
+
+    def test_sparse_fields_skip_queries(self):
+        # Unrequested relationships are neither emitted nor queried
+        self._add_thread("Sparse", 3)
+        full, full_count = self._count_queries(lambda: ForumSerializer.serialize_forum(self.forum.db_id))
+        sel = FieldSelection(["course_name", "posts", "title"], depth=1)
+        sparse, sparse_count = self._count_queries(lambda: ForumSerializer.serialize_forum(self.forum.db_id, sel))
+        self.assertEqual(sparse, {"id": self.forum.db_id, "course_name": "CSEN174",
+                                  "posts": [{"id": full["posts"][0]["id"], "title": "Sparse"}]})
+        self.assertLess(sparse_count, full_count)
+
+        # depth=2 keeps one level of comments, and only that level is loaded
+        sel = FieldSelection(depth=2)
+        shallow = ForumSerializer.serialize_forum(self.forum.db_id, sel)
+        comment = shallow["posts"][0]["comments"][0]
+        self.assertEqual(comment["message"], "Reply 0")
+        self.assertNotIn("comments", comment)
+        self.assertNotIn("reactions", comment)
+
+    def test_single_post_endpoints(self):
+        # Same payload as the wrapper serializer, and sparse fields read only the row
+        post = self._add_thread("Single", 3)
+        comment = post.comments[0]
+        _REGISTRY.clear()
+        expected = _serialize_post(Post.load_by_id(post.db_id))
+        expected_replies = [_serialize_post(c) for c in Post.load_by_id(comment.db_id).getcomments()]
+        self.assertEqual(self.client.get(f"/api/posts/{post.db_id}").get_json(), expected)
+        resp = self.client.get(f"/api/posts/{comment.db_id}/comments")
+        self.assertEqual(resp.get_json(), {"comments": expected_replies})
+
+        with capture_statements() as statements:
+            resp = self.client.get(f"/api/posts/{post.db_id}?fields=id,title")
+        self.assertEqual(resp.get_json(), {"id": post.db_id, "title": "Single"})
+        self.assertEqual(len(statements), 1)
+        with capture_statements() as statements:
+            resp = self.client.get(f"/api/posts/{post.db_id}/comments?fields=id,message")
+        self.assertEqual(resp.get_json(), {"comments": [{"id": comment.db_id, "message": "Reply 0"}]})
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(self.client.get("/api/posts/9999").status_code, 404)
+        self.assertEqual(self.client.get("/api/posts/9999/comments").status_code, 404)
+
+    def test_user_endpoint_fields_and_depth(self):
+        # /api/users_name honours fields= and depth=
+        self._add_thread("Mine", 1)
+        resp = self.client.get("/api/users_name/alice?fields=username,forums,course_name&depth=1")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json(), {
+            "id": self.user.db_id,
+            "username": "alice",
+            "forums": [{"id": self.forum.db_id, "course_name": "CSEN174"}]
+        })
+        resp = self.client.get("/api/users_name/alice?depth=0")
+        self.assertNotIn("forums", resp.get_json())
+        self.assertNotIn("posts", resp.get_json())
+        self.assertEqual(self.client.get("/api/users_name/alice?depth=-1").status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
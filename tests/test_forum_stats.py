@@ -0,0 +1,100 @@
+import re
+import unittest
+from backend.app import app
+from backend.cleanup_db import cleanup_db
+from backend.db import SessionLocal
+from backend.models import ForumStatsModel
+from backend.rebuild_counters import rebuild_counters
+from backend.User import User, Admin
+from backend.Forum import Forum
+from backend.Messages import Post, Comment
+from tests.helpers import capture_statements
+
+COUNTS = ("member_count", "post_count", "comment_count", "reaction_count")
+
+
+class TestForumStats(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+        self.client = app.test_client()
+        self.alice = User("alice", "alice@scu.edu", "CSEN", 2, None, None, None)
+        self.bob = User("bob", "bob@scu.edu", "CSEN", 3, None, None, None)
+        self.forum = Forum("CSEN174")
+        self.forum.addUser(self.alice)
+        self.forum.addUser(self.bob)
+        self.post = Post(poster=self.alice, message="Body", title="Thread")
+        self.forum.addPost(self.post)
+        self.reply = Comment(poster=self.bob, message="Reply", title="Re", parent=self.post)
+        self.nested = Comment(poster=self.alice, message="Nested", title="Re", parent=self.reply)
+        self.post.react(self.bob, "like")
+        self.nested.react(self.bob, "heart")
+
+    def _counts(self, forum=None):
+        stats = (forum or self.forum).stats()
+        return tuple(stats[name] for name in COUNTS)
+
+    def test_counts_follow_writes(self):
+        self.assertEqual(self._counts(), (2, 1, 2, 2))
+        self.assertEqual(self.forum.stats()["last_post_at"], self.post.created_at)
+        self.post.react(self.bob, "like")
+        self.forum.removeUser(self.bob)
+        self.forum.removeUser(self.bob)
+        self.assertEqual(self._counts(), (1, 1, 2, 1))
+        resp = self.client.post(f"/api/comments/{self.nested.db_id}/delete", json={"actor_email": self.alice.email})
+        self.assertEqual(resp.status_code, 200)
+        resp = self.client.post(f"/api/posts/{self.post.db_id}/delete", json={"actor_email": self.alice.email})
+        self.assertEqual(resp.status_code, 200)
+        # soft-deleted rows keep their reactions
+        self.assertEqual(self._counts(), (1, 0, 1, 1))
+
+    def test_thread_added_to_forum_brings_its_replies(self):
+        other = Forum("MATH51")
+        other.addUser(self.alice)
+        loose = Post(poster=self.alice, message="Body", title="Loose")
+        Comment(poster=self.alice, message="Early reply", title="Re", parent=loose)
+        loose.react(self.alice, "like")
+        self.assertEqual(self._counts(other), (1, 0, 0, 0))
+        other.addPost(loose)
+        self.assertEqual(self._counts(other), (1, 1, 1, 1))
+        self.assertEqual(other.stats()["last_post_at"], loose.created_at)
+
+    def test_endpoint_reads_no_posts(self):
+        with capture_statements() as statements:
+            resp = self.client.get(f"/api/forums/{self.forum.db_id}/stats")
+        self.assertEqual(resp.status_code, 200)
+        body = resp.get_json()
+        self.assertEqual(body["forum_id"], self.forum.db_id)
+        self.assertEqual(tuple(body[name] for name in COUNTS), (2, 1, 2, 2))
+        self.assertEqual(body["last_post_at"], self.post.created_at.isoformat() + "Z")
+        self.assertFalse([s for s in statements if re.search(r"\bposts\b", s)])
+
+        empty = Forum("COEN10")
+        resp = self.client.get(f"/api/forums/{empty.db_id}/stats")
+        self.assertEqual(resp.get_json()["post_count"], 0)
+        self.assertIsNone(resp.get_json()["last_post_at"])
+        self.assertEqual(self.client.get("/api/forums/9999/stats").status_code, 404)
+
+    def test_repair_restores_drifted_rows(self):
+        before = self.forum.stats()
+        session = SessionLocal()
+        try:
+            session.query(ForumStatsModel).update({"post_count": 40, "reaction_count": -3, "last_post_at": None})
+            session.commit()
+        finally:
+            session.close()
+        self.assertEqual(rebuild_counters()["forum_stats"], 1)
+        self.assertEqual(self.forum.stats(), before)
+
+    def test_deleting_forum_drops_its_row(self):
+        admin = Admin("root", "root@scu.edu", "CSEN", 4)
+        resp = self.client.post(f"/api/forums/{self.forum.db_id}/delete", json={"admin_email": admin.email})
+        self.assertEqual(resp.status_code, 200)
+        session = SessionLocal()
+        try:
+            self.assertEqual(session.query(ForumStatsModel).count(), 0)
+        finally:
+            session.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
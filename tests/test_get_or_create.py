@@ -0,0 +1,122 @@
+import sqlite3
+import threading
+import unittest
+from sqlalchemy import event
+from backend.app import app
+from backend.cleanup_db import cleanup_db
+from backend.db import engine, SessionLocal
+from backend.models import UserModel, ForumModel
+from backend.User import User
+from backend.Forum import Forum
+from backend.Messages import Post, Reaction
+from tests.helpers import capture_statements
+
+
+class TestGetOrCreate(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+
+    def _statements(self, fn):
+        # Run fn and return the SQL it sent
+        with capture_statements() as statements:
+            result = fn()
+        return result, statements
+
+    def _count(self, model):
+        session = SessionLocal()
+        try:
+            return session.query(model).count()
+        finally:
+            session.close()
+
+    def test_user_factory(self):
+        (user, created), statements = self._statements(
+            lambda: User.get_or_create("alice", "alice@scu.edu", "CSEN", 2, first_name="Alice"))
+        self.assertTrue(created)
+        self.assertEqual(user.first_name, "Alice")
+        self.assertEqual(len(statements), 1)
+        self.assertIn("ON CONFLICT", statements[0])
+        self.assertIn("RETURNING", statements[0])
+        # an existing row: the insert returns nothing and one SELECT reads it
+        (again, created), statements = self._statements(
+            lambda: User.get_or_create("alice2", "alice@scu.edu", "CSEN", 2))
+        self.assertFalse(created)
+        self.assertIs(again, user)
+        self.assertEqual(len(statements), 2)
+        self.assertIs(User("alice", "alice@scu.edu", "CSEN", 2, None, None, None), user)
+        # the constructor goes through the same single insert
+        bob, statements = self._statements(lambda: User("bob", "bob@scu.edu", "CSEN", 3, None, None, None))
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(bob.email, "bob@scu.edu")
+        self.assertEqual(self._count(UserModel), 2)
+        with self.assertRaises(ValueError):
+            User.get_or_create("bob", "bob@gmail.com", "CSEN", 2)
+
+    def test_forum_and_reaction_factories(self):
+        forum, created = Forum.get_or_create("CSEN174")
+        self.assertTrue(created)
+        self.assertEqual(Forum.get_or_create("CSEN174"), (forum, False))
+        self.assertIs(Forum("CSEN174"), forum)
+
+        user, _ = User.get_or_create("alice", "alice@scu.edu", "CSEN", 2)
+        post = Post(poster=user, message="Body", title="Title")
+        reaction, created = Reaction.get_or_create("like", user, post)
+        self.assertTrue(created)
+        self.assertIs(reaction.parent, post)
+        self.assertEqual(Reaction.get_or_create("like", user, post), (reaction, False))
+        with self.assertRaises(ValueError):
+            Reaction.get_or_create("meh", user, post)
+
+    def test_lost_insert_race_returns_winner(self):
+        # Another process inserts the same course just before our insert
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO forums"):
+                other = sqlite3.connect(engine.url.database, isolation_level=None)
+                other.execute("INSERT INTO forums (course_name, created_at) VALUES ('CSEN174', CURRENT_TIMESTAMP)")
+                other.close()
+
+        event.listen(engine, "before_cursor_execute", _before)
+        try:
+            forum, created = Forum.get_or_create("CSEN174")
+        finally:
+            event.remove(engine, "before_cursor_execute", _before)
+        self.assertFalse(created)
+        self.assertEqual(forum.course_name, "CSEN174")
+        self.assertEqual(self._count(ForumModel), 1)
+
+    def test_concurrent_factories_share_one_row(self):
+        results = []
+        barrier = threading.Barrier(8)
+
+        def worker():
+            try:
+                barrier.wait()
+                results.append(User.get_or_create("alice", "alice@scu.edu", "CSEN", 2))
+            finally:
+                SessionLocal.remove()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(results), 8)
+        self.assertEqual(sum(created for _, created in results), 1)
+        self.assertTrue(all(user is results[0][0] for user, _ in results))
+        self.assertEqual(self._count(UserModel), 1)
+
+    def test_handlers_use_factories(self):
+        client = app.test_client()
+        body = {"email": "alice@scu.edu", "username": "alice", "major": "CSEN", "year": 2}
+        self.assertEqual(client.post("/api/create_user", json=body).status_code, 201)
+        self.assertEqual(client.post("/api/create_user", json=body).status_code, 400)
+        resp = client.post("/api/create_forum", json={"course_name": "CSEN174", "creator_email": "alice@scu.edu"})
+        self.assertEqual(resp.status_code, 201)
+        resp = client.post("/api/create_forum", json={"course_name": "CSEN174"})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.get_json()["error"], "Forum already exists")
+        self.assertEqual(self._count(ForumModel), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
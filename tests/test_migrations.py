@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import create_engine
+from backend.migrations import migrate, latest_version
+
+# Schema as shipped before migrations existed: primary keys only, no thread columns
+LEGACY_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR NOT NULL, email VARCHAR NOT NULL, major VARCHAR NOT NULL, "
+    "year INTEGER NOT NULL, is_deleted BOOLEAN, is_admin BOOLEAN, first_name VARCHAR, last_name VARCHAR)",
+    "CREATE TABLE forums (id INTEGER PRIMARY KEY, course_name VARCHAR NOT NULL)",
+    "CREATE TABLE posts (id INTEGER PRIMARY KEY, poster_id INTEGER, forum_id INTEGER, title VARCHAR NOT NULL, "
+    "message TEXT NOT NULL, is_deleted BOOLEAN, parent_id INTEGER)",
+    "CREATE TABLE reactions (id INTEGER PRIMARY KEY, reaction_type VARCHAR NOT NULL, user_id INTEGER NOT NULL, parent_id INTEGER)",
+    "CREATE TABLE forum_users (forum_id INTEGER, user_id INTEGER, PRIMARY KEY (forum_id, user_id))",
+    "CREATE TABLE forum_authorized (forum_id INTEGER, user_id INTEGER, PRIMARY KEY (forum_id, user_id))",
+    "CREATE TABLE forum_restricted (forum_id INTEGER, user_id INTEGER, PRIMARY KEY (forum_id, user_id))",
+]
+
+LEGACY_ROWS = [
+    "INSERT INTO users VALUES (1, 'alice', 'alice@scu.edu', 'CSEN', 2, 0, 0, NULL, NULL)",
+    "INSERT INTO users VALUES (2, 'alice2', 'alice@scu.edu', 'CSEN', 2, 0, 0, NULL, NULL)",
+    "INSERT INTO users VALUES (3, 'bob', 'bob@scu.edu', 'CSEN', 3, 0, 0, NULL, NULL)",
+    "INSERT INTO forums VALUES (1, 'CSEN174')",
+    "INSERT INTO forums VALUES (2, 'CSEN174')",
+    "INSERT INTO forum_users VALUES (1, 1)",
+    "INSERT INTO forum_users VALUES (2, 2)",
+    "INSERT INTO forum_users VALUES (2, 3)",
+    "INSERT INTO posts VALUES (1, 2, 2, 'Title', 'Body', 0, NULL)",
+    "INSERT INTO posts VALUES (2, 3, NULL, 'Re', 'Reply', 0, 1)",
+    "INSERT INTO posts VALUES (3, 1, NULL, 'Re', 'Reply', 0, 2)",
+    "INSERT INTO reactions VALUES (1, 'like', 1, 1)",
+    "INSERT INTO reactions VALUES (2, 'like', 2, 1)",
+    "INSERT INTO reactions VALUES (3, 'heart', 3, 1)",
+]
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.engine = create_engine("sqlite:///" + os.path.join(self.tmpdir, "legacy.db"))
+        with self.engine.begin() as conn:
+            for statement in LEGACY_SCHEMA + LEGACY_ROWS:
+                conn.exec_driver_sql(statement)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _rows(self, sql):
+        with self.engine.connect() as conn:
+            return [tuple(row) for row in conn.exec_driver_sql(sql)]
+
+    def test_upgrade_legacy_database(self):
+        self.assertEqual(migrate(self.engine), list(range(1, latest_version() + 1)))
+        self.assertEqual(self._rows("PRAGMA user_version"), [(latest_version(),)])
+        # running again is a no-op
+        self.assertEqual(migrate(self.engine), [])
+
+        # duplicates folded into the lowest id, references repointed
+        self.assertEqual(self._rows("SELECT id, email FROM users ORDER BY id"), [(1, 'alice@scu.edu'), (3, 'bob@scu.edu')])
+        self.assertEqual(self._rows("SELECT id FROM forums"), [(1,)])
+        self.assertEqual(self._rows("SELECT forum_id, user_id FROM forum_users ORDER BY user_id"), [(1, 1), (1, 3)])
+        self.assertEqual(self._rows("SELECT id, poster_id, forum_id FROM posts WHERE id = 1"), [(1, 1, 1)])
+        self.assertEqual(self._rows("SELECT id, user_id FROM reactions ORDER BY id"), [(1, 1), (3, 3)])
+
+        # thread columns added and backfilled
+        self.assertEqual(self._rows("SELECT id, depth, path FROM posts ORDER BY path"), [
+            (1, 0, '0000000001'), (2, 1, '0000000001/0000000002'), (3, 2, '0000000001/0000000002/0000000003')])
+        self.assertEqual(self._rows("SELECT COUNT(*) FROM forums WHERE created_at IS NULL"), [(0,)])
+        self.assertEqual(self._rows("SELECT COUNT(*) FROM row_changes"), [(0,)])
+
+        # reaction counters filled from the surviving rows and kept by triggers
+        self.assertEqual(self._rows("SELECT post_id, reaction_type, count FROM post_reaction_counts ORDER BY reaction_type"),
+                         [(1, 'heart', 1), (1, 'like', 1)])
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("DELETE FROM reactions WHERE id = 3")
+        self.assertEqual(self._rows("SELECT reaction_type, count FROM post_reaction_counts"), [('like', 1)])
+
+        # forum stats filled from the merged forum, reactions kept by triggers
+        self.assertEqual(self._rows("SELECT forum_id, member_count, post_count, comment_count, reaction_count FROM forum_stats"),
+                         [(1, 2, 1, 2, 1)])
+
+        # thread stats backfilled from the reply chain
+        self.assertEqual(self._rows("SELECT id, comment_count, descendant_count FROM posts ORDER BY id"),
+                         [(1, 1, 2), (2, 1, 1), (3, 0, 0)])
+        self.assertEqual(self._rows("SELECT COUNT(*) FROM posts WHERE last_activity_at IS NULL"), [(0,)])
+
+        indexes = {row[0] for row in self._rows("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        for name in ("ix_users_email", "ix_users_username", "ix_forums_course_name", "ix_posts_forum_created",
+                     "ix_posts_parent_id", "ix_posts_poster_id", "ix_posts_path", "ix_reactions_parent_id",
+                     "ix_reactions_user_id", "ux_reactions_type_user_parent", "ix_forum_users_user_id",
+                     "ix_posts_forum_activity", "ix_posts_forum_replies"):
+            self.assertIn(name, indexes)
+
+    def test_partial_upgrade(self):
+        # target stops early; the remaining steps run on the next call
+        self.assertEqual(migrate(self.engine, target=2), [1, 2])
+        self.assertEqual(self._rows("SELECT COUNT(*) FROM users"), [(3,)])
+        self.assertEqual(migrate(self.engine), list(range(3, latest_version() + 1)))
+
+    def test_failed_step_rolls_back(self):
+        # A step that fails leaves the version and data untouched
+        from backend import migrations
+        def _boom(conn):
+            conn.exec_driver_sql("DELETE FROM users")
+            raise RuntimeError("boom")
+        migrations.MIGRATIONS.append((latest_version() + 1, 'failing step', _boom))
+        try:
+            with self.assertRaises(RuntimeError):
+                migrate(self.engine)
+        finally:
+            migrations.MIGRATIONS.pop()
+        self.assertEqual(self._rows("PRAGMA user_version"), [(latest_version(),)])
+        self.assertEqual(self._rows("SELECT COUNT(*) FROM users"), [(2,)])
+
+    def test_new_database_from_models(self):
+        # create_all already made the counter table and triggers; migrating must not double count
+        from backend.db import Base
+        import backend.models  # noqa: F401
+        fresh = create_engine("sqlite:///" + os.path.join(self.tmpdir, "fresh.db"))
+        try:
+            Base.metadata.create_all(bind=fresh)
+            with fresh.begin() as conn:
+                conn.exec_driver_sql("INSERT INTO users (id, username, email, major, year) VALUES (1, 'a', 'a@scu.edu', 'CSEN', 2)")
+                conn.exec_driver_sql("INSERT INTO posts (id, title, message, created_at, depth) VALUES (1, 'T', 'B', '2024-01-01', 0)")
+                conn.exec_driver_sql("INSERT INTO reactions (reaction_type, user_id, parent_id) VALUES ('like', 1, 1)")
+            migrate(fresh)
+            with fresh.connect() as conn:
+                self.assertEqual(conn.exec_driver_sql("SELECT post_id, reaction_type, count FROM post_reaction_counts").all(),
+                                 [(1, 'like', 1)])
+        finally:
+            fresh.dispose()
+
+
+if __name__ == '__main__':
+    unittest.main()
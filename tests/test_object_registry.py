@@ -0,0 +1,101 @@
+import gc
+import unittest
+from backend.app import app
+from backend.cleanup_db import cleanup_db
+from backend.object_registry import IdentityCache, configure, get as registry_get, stats
+from backend.User import User
+from backend.Messages import Post
+
+
+class Wrapper:
+    def __init__(self, name):
+        self.name = name
+
+
+class TestIdentityCache(unittest.TestCase):
+    def test_lru_eviction_keeps_referenced_identity(self):
+        cache = IdentityCache('Thing', capacity=2)
+        kept = Wrapper("kept")
+        cache.put(1, kept)
+        cache.put(2, Wrapper("two"))
+        cache.put(3, Wrapper("three"))
+        gc.collect()
+        # 1 fell out of the LRU but is still referenced here, so identity holds
+        self.assertIs(cache.get(1), kept)
+        # 1 is back at the front; 2 was evicted and nothing else held it
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(3).name, "three")
+        s = cache.stats()
+        self.assertEqual((s['hits'], s['misses'], s['strong']), (2, 1, 2))
+        self.assertEqual(s['evictions'], 2)
+        self.assertEqual(s['collected'], 1)
+
+    def test_weak_policy_holds_nothing(self):
+        cache = IdentityCache('Thing', capacity=10, policy='weak')
+        held = Wrapper("held")
+        cache.put(1, held)
+        cache.put(2, Wrapper("dropped"))
+        gc.collect()
+        self.assertIs(cache.get(1), held)
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.stats()['strong'], 0)
+
+    def test_resize_and_discard(self):
+        cache = IdentityCache('Thing', capacity=3)
+        items = [Wrapper(str(i)) for i in range(3)]
+        for i, item in enumerate(items):
+            cache.put(i, item)
+        cache.resize(1)
+        self.assertEqual(cache.stats()['strong'], 1)
+        cache.discard(0)
+        self.assertIsNone(cache.get(0))
+        self.assertIs(cache.get(1), items[1])
+        with self.assertRaises(ValueError):
+            IdentityCache('Thing', policy='fifo')
+
+
+class TestRegistryWrappers(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+        self.user = User("alice", "alice@scu.edu", "CSEN", 2, None, None, None)
+
+    def tearDown(self):
+        configure('Post', capacity=5000)
+
+    def test_wrappers_reload_after_eviction(self):
+        configure('Post', capacity=2)
+        held = Post(poster=self.user, message="Held", title="Held")
+        ids = [Post(poster=self.user, message=f"Body {i}", title="T").db_id for i in range(4)]
+        gc.collect()
+        # still referenced: same object comes back
+        self.assertIs(Post.load_by_id(held.db_id), held)
+        # evicted and unreferenced: a fresh wrapper is loaded from the DB
+        self.assertIsNone(registry_get('Post', ids[0]))
+        reloaded = Post.load_by_id(ids[0])
+        self.assertEqual(reloaded.message, "Body 0")
+        self.assertIs(Post.load_by_id(ids[0]), reloaded)
+        self.assertLessEqual(stats()['Post']['strong'], 2)
+
+    def test_bulk_load_larger_than_capacity(self):
+        configure('Post', capacity=8)
+        for i in range(30):
+            Post(poster=self.user, message=f"Body {i}", title="T")
+        gc.collect()
+        # a few rows cached only by the LRU, which the load below pushes out
+        warm = [Post.load_by_id(post_id).db_id for post_id in (1, 2, 3)]
+        gc.collect()
+        posts = self.user.getposts()
+        self.assertEqual(len(posts), 30)
+        self.assertNotIn(None, posts)
+        self.assertEqual([p.db_id for p in posts[:3]], warm)
+        resp = app.test_client().get("/api/users_name/alice")
+        self.assertEqual(resp.status_code, 200)
+
+    def test_metrics_endpoint_reports_registry(self):
+        data = app.test_client().get("/api/metrics").get_json()
+        self.assertIn("User", data["registry"])
+        self.assertIn("hits", data["registry"]["User"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import sqlite3
+import unittest
+from backend import coherence
+from backend.app import app
+from backend.cleanup_db import cleanup_db
+from backend.coherence import install_triggers, sync_registry
+from backend.db import engine
+from backend.permission_services import PermissionService, TTLCache
+from backend.User import User, Admin
+from backend.Forum import Forum
+from tests.helpers import capture_statements
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_expiry_capacity_and_generation(self):
+        clock = FakeClock()
+        cache = TTLCache(ttl=10, capacity=2, clock=clock)
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        clock.now = 11
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('a'))
+        generation = cache.generation
+        cache.pop_where(lambda key: key == 'b')
+        # computed before the invalidation, so not stored
+        cache.put('b', 2, generation)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats(), {'size': 1, 'hits': 1, 'misses': 3, 'expired': 1, 'invalidated': 1})
+
+    def test_zero_ttl_disables(self):
+        cache = TTLCache(ttl=0)
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+class TestPermissionService(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+        self.client = app.test_client()
+        self.admin = Admin("root", "root@scu.edu", "CSEN", 4)
+        self.moderator = User("mod", "mod@scu.edu", "CSEN", 3, None, None, None)
+        self.student = User("alice", "alice@scu.edu", "CSEN", 2, None, None, None)
+        self.forum = Forum("CSEN174")
+        for user in (self.moderator, self.student):
+            self.forum.addUser(user)
+        self.forum.authorizeUser(self.moderator)
+
+    def _post(self, action, target, actor):
+        return self.client.post(f"/api/forums/{self.forum.db_id}/{action}",
+                                json={"target_email": target.email, "actor_email": actor.email, "admin_email": actor.email})
+
+    def test_repeat_checks_hit_cache(self):
+        self.assertEqual(self._post("restrict_user", self.student, self.moderator).status_code, 200)
+        with capture_statements() as statements:
+            self.assertIs(PermissionService.resolve_actor(self.moderator.email), self.moderator)
+            self.assertTrue(PermissionService.can_moderate(self.moderator, self.forum))
+        self.assertEqual(statements, [])
+        stats = self.client.get("/api/metrics").get_json()['permissions']
+        self.assertGreaterEqual(stats['actors']['hits'], 1)
+        self.assertGreaterEqual(stats['grants']['hits'], 1)
+
+    def test_state_changes_invalidate(self):
+        self.assertEqual(self._post("restrict_user", self.student, self.moderator).status_code, 200)
+        self.assertEqual(self._post("deauthorize_user", self.moderator, self.admin).status_code, 200)
+        resp = self._post("unrestrict_user", self.student, self.moderator)
+        self.assertEqual(resp.status_code, 403)
+        self.forum.authorizeUser(self.moderator)
+        self.assertEqual(self._post("unrestrict_user", self.student, self.moderator).status_code, 200)
+        # restricting a moderator takes their authorization away as well
+        self.forum.restrictUser(self.moderator)
+        self.assertFalse(PermissionService.can_moderate(self.moderator, self.forum))
+        self.assertGreaterEqual(PermissionService.stats()['grants']['invalidated'], 2)
+
+    def test_admin_change_invalidates(self):
+        # is_admin is flipped on the users row by another worker, as the seed scripts do
+        coherence.enable()
+        self.addCleanup(coherence.disable)
+        sync_registry()
+
+        def set_admin(user, is_admin):
+            conn = sqlite3.connect(engine.url.database, isolation_level=None)
+            try:
+                install_triggers(conn, origin='other-worker')
+                conn.execute("UPDATE users SET is_admin = ? WHERE id = ?", (is_admin, user.db_id))
+            finally:
+                conn.close()
+
+        # the student's "no" is cached, then they are promoted
+        self.assertEqual(self._post("restrict_user", self.moderator, self.student).status_code, 403)
+        set_admin(self.student, True)
+        self.assertEqual(self._post("restrict_user", self.moderator, self.student).status_code, 200)
+        self.assertIsNone(PermissionService._grants.get((self.student.db_id, self.forum.db_id)))
+        # a demoted admin loses their rights on the next request, not after the TTL
+        set_admin(self.admin, False)
+        self.assertEqual(self._post("unrestrict_user", self.moderator, self.admin).status_code, 403)
+
+    def test_admin_needs_no_grant(self):
+        self.assertTrue(PermissionService.can_moderate(self.admin, self.forum))
+        self.assertFalse(PermissionService.can_moderate(self.student, self.forum))
+        self.assertIsNone(PermissionService.resolve_actor("nobody@scu.edu"))
+
+
+if __name__ == '__main__':
+    unittest.main()
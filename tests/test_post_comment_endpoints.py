@@ -112,6 +112,87 @@ class TestPostCommentEndpoints(unittest.TestCase):
         self.assertEqual(len(nested_comments), 1)
         self.assertEqual(nested_comments[0].message, "Reply to comment")
 
+    def test_paginated_post_listing(self):
+        """Test GET /api/forums/<id>/posts pages by (created_at, id) with a cursor"""
+        from backend.Messages import Post
+        for i in range(5):
+            post = Post(poster=self.user, message=f"Message {i}", title=f"Post {i}")
+            self.user.addPost(self.forum, post)
+
+        titles = []
+        cursor = None
+        pages = 0
+        while True:
+            url = f"/api/forums/{self.forum.db_id}/posts?limit=2"
+            if cursor:
+                url += f"&cursor={cursor}"
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.get_json()
+            self.assertLessEqual(len(data["posts"]), 2)
+            titles.extend(p["title"] for p in data["posts"])
+            pages += 1
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(titles, [f"Post {i}" for i in range(5)])
+
+        # Unpaginated listing still returns everything
+        data = self.client.get(f"/api/forums/{self.forum.db_id}/posts").get_json()
+        self.assertEqual(len(data["posts"]), 5)
+        self.assertIsNone(data["next_cursor"])
+
+        # Bad parameters are rejected
+        self.assertEqual(self.client.get(f"/api/forums/{self.forum.db_id}/posts?limit=0").status_code, 400)
+        self.assertEqual(self.client.get(f"/api/forums/{self.forum.db_id}/posts?cursor=bogus").status_code, 400)
+
+    def test_truncated_comment_tree(self):
+        """Test max_depth/max_children stubs and expanding a branch"""
+        from backend.Messages import Post, Comment
+        post = Post(poster=self.user, message="Root", title="Root")
+        self.user.addPost(self.forum, post)
+        replies = [Comment(poster=self.user, message=f"Reply {i}", title="Comment", parent=post) for i in range(3)]
+        deep = replies[0]
+        for i in range(3):
+            deep = Comment(poster=self.user, message=f"Deep {i}", title="Comment", parent=deep)
+
+        response = self.client.get(f"/api/posts/{post.db_id}/comments?max_depth=2&max_children=2")
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data["reply_count"], 3)
+        comments = data["comments"]
+        self.assertEqual([c.get("message") for c in comments[:2]], ["Reply 0", "Reply 1"])
+        self.assertEqual(comments[2], {"stub": True, "parent_id": post.db_id, "remaining": 1, "after_id": replies[1].db_id})
+
+        # Second level is loaded, the third comes back as a stub with its count
+        second = comments[0]["comments"][0]
+        self.assertEqual(second["message"], "Deep 0")
+        self.assertEqual(second["reply_count"], 1)
+        self.assertEqual(second["comments"], [{"stub": True, "parent_id": second["id"], "remaining": 1, "after_id": None}])
+
+        # Expand the truncated branch and the remaining sibling
+        response = self.client.get(f"/api/comments/{second['id']}/replies?max_depth=5")
+        self.assertEqual(response.status_code, 200)
+        expanded = response.get_json()["comments"]
+        self.assertEqual(expanded[0]["message"], "Deep 1")
+        self.assertEqual(expanded[0]["comments"][0]["message"], "Deep 2")
+        response = self.client.get(f"/api/comments/{post.db_id}/replies?after={replies[1].db_id}")
+        self.assertEqual([c["message"] for c in response.get_json()["comments"]], ["Reply 2"])
+        # the cursor narrows the page, not the count
+        self.assertEqual(response.get_json()["reply_count"], 3)
+        # counts-only reactions work on the tree like on every other endpoint
+        replies[2].react(self.user, "like")
+        response = self.client.get(f"/api/posts/{post.db_id}/comments?max_depth=1&reactions=counts&fields=id,reactions")
+        self.assertEqual([c["reaction_counts"]["like"] for c in response.get_json()["comments"][:3]], [0, 0, 1])
+
+        # Same tree through the post endpoint
+        response = self.client.get(f"/api/posts/{post.db_id}?max_depth=1&max_children=5")
+        self.assertEqual(response.get_json()["reply_count"], 3)
+        self.assertEqual(response.get_json()["comments"][0]["comments"][0]["stub"], True)
+        self.assertEqual(self.client.get("/api/comments/9999/replies").status_code, 404)
+
 
 if __name__ == "__main__":
     unittest.main()
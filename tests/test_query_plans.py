@@ -0,0 +1,81 @@
+import re
+import unittest
+from backend.cleanup_db import cleanup_db
+from backend.db import engine
+from backend.forum_services import ForumRepository, ForumPostService
+from backend.messages_services import PostRepository, ReactionRepository
+from backend.user_services import UserRepository
+from backend.object_registry import _REGISTRY
+from backend.User import User
+from backend.Forum import Forum
+from backend.Messages import Post, Comment, Reaction
+from tests.helpers import capture_statements
+
+# A full table scan shows up as "SCAN <table>" with no "USING ... INDEX"
+FULL_SCAN = re.compile(r'^SCAN \w+( AS \w+)?$')
+
+
+class TestQueryPlans(unittest.TestCase):
+    # Every hot repository lookup should be answered from an index
+    def setUp(self):
+        cleanup_db()
+        self.user = User("alice", "alice@scu.edu", "CSEN", 2, None, None, None)
+        self.other = User("bob", "bob@scu.edu", "CSEN", 3, None, None, None)
+        self.forum = Forum("CSEN174")
+        self.forum.addUser(self.user)
+        self.post = Post(poster=self.user, message="Body", title="Title")
+        self.forum.addPost(self.post)
+        self.comment = Comment(poster=self.user, message="Reply", title="Re", parent=self.post)
+        self.reaction = Reaction("like", self.other)
+        self.post.togglereaction(self.reaction)
+        _REGISTRY.clear()
+
+    def _plans(self, fn):
+        # Run fn and return (sql, plan lines) for every SELECT it issued
+        with capture_statements(parameters=True) as statements:
+            fn()
+        captured = [(sql, params) for sql, params in statements if sql.lstrip().upper().startswith('SELECT')]
+        self.assertTrue(captured)
+        plans = []
+        with engine.connect() as conn:
+            for statement, parameters in captured:
+                rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+                plans.append((statement, [row[-1] for row in rows]))
+        return plans
+
+    def assertIndexed(self, fn, no_sort=False):
+        for statement, plan in self._plans(fn):
+            for line in plan:
+                self.assertIsNone(FULL_SCAN.match(line), f"{line!r} in plan for: {statement}")
+                if no_sort:
+                    self.assertNotIn("TEMP B-TREE", line, statement)
+
+    def test_user_lookups(self):
+        self.assertIndexed(lambda: UserRepository.find_by_email("alice@scu.edu"))
+        self.assertIndexed(lambda: UserRepository.load_by_username("alice"))
+        self.assertIndexed(lambda: UserRepository.get_posts(self.user))
+        self.assertIndexed(lambda: UserRepository.get_forums(self.user))
+        self.assertIndexed(lambda: UserRepository.get_reactions(self.other))
+
+    def test_forum_lookups(self):
+        self.assertIndexed(lambda: ForumRepository.find_by_course_name("CSEN174"))
+        self.assertIndexed(lambda: ForumPostService.get_posts(self.forum))
+        self.assertIndexed(lambda: PostRepository.load_forum_page(self.forum.db_id, 20), no_sort=True)
+        for sort in ('activity', 'comments'):
+            self.assertIndexed(lambda: PostRepository.load_forum_page(self.forum.db_id, 1, sort=sort), no_sort=True)
+
+    def test_post_lookups(self):
+        self.assertIndexed(lambda: PostRepository.load_by_id(self.post.db_id))
+        self.assertIndexed(lambda: PostRepository.get_comments(self.post))
+        self.assertIndexed(lambda: PostRepository.get_reactions(self.post))
+        self.assertIndexed(lambda: ReactionRepository.find_by_type_user_parent("like", self.other.db_id, self.post.db_id))
+
+    def test_unique_indexes(self):
+        with engine.connect() as conn:
+            unique = {row[1] for table in ("users", "forums", "reactions")
+                      for row in conn.exec_driver_sql(f"PRAGMA index_list({table})") if row[2]}
+        self.assertTrue({"ix_users_email", "ix_forums_course_name", "ux_reactions_type_user_parent"} <= unique)
+
+
+if __name__ == '__main__':
+    unittest.main()
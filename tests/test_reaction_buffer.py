@@ -0,0 +1,170 @@
+import threading
+import time
+import unittest
+from unittest import mock
+from sqlalchemy import event
+from backend.app import app
+from backend.cleanup_db import cleanup_db
+from backend.db import SessionLocal, engine
+from backend.models import ReactionModel
+from backend.messages_services import ReactionRepository
+from backend import reaction_buffer
+from backend.reaction_buffer import ReactionBuffer
+from backend.User import User, Admin
+from backend.Forum import Forum
+from backend.Messages import Post
+
+
+class TestReactionBuffer(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+        # a long interval so only the tests decide when to flush
+        ReactionBuffer.configure(enabled=True, interval=60, size_limit=1000)
+        self.client = app.test_client()
+        self.forum = Forum("CSEN174")
+        self.users = [User(f"user{i}", f"user{i}@scu.edu", "CSEN", 2, None, None, None) for i in range(3)]
+        for user in self.users:
+            self.forum.addUser(user)
+        self.post = Post(poster=self.users[0], message="Announcement", title="News")
+        self.forum.addPost(self.post)
+
+    def tearDown(self):
+        ReactionBuffer.shutdown()
+        ReactionBuffer.configure(enabled=False, interval=reaction_buffer.FLUSH_INTERVAL,
+                                 size_limit=reaction_buffer.FLUSH_SIZE)
+
+    def _like(self, user, reaction_id=1):
+        return self.client.get(f"/api/posts/react/{self.post.db_id}/{reaction_id}/{user.db_id}")
+
+    def _rows(self):
+        session = SessionLocal()
+        try:
+            return sorted((r.user_id, r.reaction_type) for r in session.query(ReactionModel))
+        finally:
+            session.close()
+
+    def test_toggles_coalesce_into_one_transaction(self):
+        coalesced = ReactionBuffer.stats()["coalesced"]
+        for user in self.users:
+            self.assertEqual(self._like(user).status_code, 201)
+        resp = self._like(self.users[2])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()["counts"]["like"], 2)
+        self.assertEqual(self._rows(), [])
+        commits = []
+
+        def _commit(conn):
+            commits.append(conn)
+
+        event.listen(engine, "commit", _commit)
+        try:
+            self.assertEqual(ReactionBuffer.flush(), 2)
+        finally:
+            event.remove(engine, "commit", _commit)
+        self.assertEqual(len(commits), 1)
+        self.assertEqual(self._rows(), [(self.users[0].db_id, "like"), (self.users[1].db_id, "like")])
+        self.assertEqual(ReactionBuffer.stats()["coalesced"], coalesced + 1)
+        self.assertEqual(ReactionBuffer.stats()["buffered"], 0)
+
+    def test_acting_user_reads_own_toggles(self):
+        self._like(self.users[1])
+        self._like(self.users[1], 3)
+        body = self.client.get(f"/api/posts/{self.post.db_id}?reactions=counts&viewer_id={self.users[1].db_id}").get_json()
+        self.assertEqual(body["reaction_counts"], {"like": 1, "dislike": 0, "heart": 1, "flag": 0})
+        self.assertEqual(sorted(body["viewer_reactions"]), ["heart", "like"])
+        feed = self.client.get(f"/api/forums/{self.forum.db_id}/posts?reactions=counts").get_json()["posts"]
+        self.assertEqual(feed[0]["reaction_counts"]["heart"], 1)
+        self.assertEqual(self._rows(), [])
+        ReactionBuffer.flush()
+        # same answer once written
+        again = self.client.get(f"/api/posts/{self.post.db_id}?reactions=counts&viewer_id={self.users[1].db_id}").get_json()
+        self.assertEqual(again["reaction_counts"], body["reaction_counts"])
+
+    def test_toggle_after_flush_starts_from_table(self):
+        self._like(self.users[1])
+        ReactionBuffer.flush()
+        resp = self._like(self.users[1])
+        self.assertFalse(resp.get_json()["added"])
+        self.assertEqual(resp.get_json()["counts"]["like"], 0)
+        ReactionBuffer.flush()
+        self.assertEqual(self._rows(), [])
+
+    def test_cached_post_sees_flushed_reactions(self):
+        self.post.getreactions()
+        self._like(self.users[1])
+        ReactionBuffer.flush()
+        self.assertEqual([r.user for r in self.post.reactions], [self.users[1]])
+        self._like(self.users[1])
+        ReactionBuffer.flush()
+        self.assertEqual(self.post.reactions, [])
+
+    def test_count_reads_do_not_hold_the_buffer(self):
+        self._like(self.users[1])
+        started, release, result = threading.Event(), threading.Event(), {}
+
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            # stall the reader's first table read
+            if threading.current_thread() is reader and not started.is_set():
+                started.set()
+                release.wait(5)
+
+        def _read():
+            try:
+                result["counts"] = ReactionRepository.count_by_type(self.post.db_id)
+            finally:
+                SessionLocal.remove()
+
+        reader = threading.Thread(target=_read)
+        event.listen(engine, "before_cursor_execute", _before)
+        try:
+            reader.start()
+            self.assertTrue(started.wait(5))
+            # a toggle and a flush both finish while the read is stuck
+            self.assertEqual(self._like(self.users[2]).status_code, 201)
+            self.assertEqual(ReactionBuffer.flush(), 2)
+            release.set()
+            reader.join(5)
+        finally:
+            release.set()
+            event.remove(engine, "before_cursor_execute", _before)
+        # the read noticed the flush and read again instead of counting user1 twice
+        self.assertEqual(result["counts"]["like"], 2)
+
+    def test_size_limit_wakes_flusher(self):
+        ReactionBuffer.configure(size_limit=2)
+        self._like(self.users[1])
+        self._like(self.users[2])
+        deadline = time.monotonic() + 5
+        while len(self._rows()) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self._rows()), 2)
+
+    def test_failed_flush_keeps_toggles(self):
+        self._like(self.users[1])
+        self._like(self.users[1], 3)
+        with mock.patch.object(reaction_buffer, "begin_write", side_effect=RuntimeError("busy")):
+            with self.assertRaises(RuntimeError):
+                ReactionBuffer.flush()
+        self.assertEqual(ReactionBuffer.stats()["buffered"], 2)
+        # a toggle made after the failure builds on the requeued one
+        self.assertFalse(self._like(self.users[1], 3).get_json()["added"])
+        ReactionBuffer.flush()
+        self.assertEqual(self._rows(), [(self.users[1].db_id, "like")])
+
+    def test_shutdown_writes_buffer(self):
+        self._like(self.users[1])
+        ReactionBuffer.shutdown()
+        self.assertEqual(self._rows(), [(self.users[1].db_id, "like")])
+        self.assertEqual(ReactionBuffer.stats()["buffered"], 0)
+
+    def test_deleted_posts_are_skipped(self):
+        self._like(self.users[1])
+        admin = Admin("root", "root@scu.edu", "CSEN", 4)
+        resp = self.client.post(f"/api/forums/{self.forum.db_id}/delete", json={"admin_email": admin.email})
+        self.assertEqual(resp.status_code, 200)
+        ReactionBuffer.flush()
+        self.assertEqual(self._rows(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import threading
+import unittest
+from backend.app import app
+from backend.cleanup_db import cleanup_db
+from backend.db import SessionLocal
+from backend.models import ReactionModel, PostReactionCountModel
+from backend.rebuild_counters import rebuild_counters
+from backend.messages_services import ReactionRepository
+from backend.User import User, Admin
+from backend.Forum import Forum
+from backend.Messages import Post, Comment, Reaction
+from tests.helpers import capture_statements
+
+THREADS = 8
+
+
+class TestReactionToggle(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+        self.forum = Forum("CSEN174")
+        self.users = [User(f"user{i}", f"user{i}@scu.edu", "CSEN", 2, None, None, None) for i in range(THREADS)]
+        for user in self.users:
+            self.forum.addUser(user)
+        self.post = Post(poster=self.users[0], message="Announcement", title="News")
+        self.forum.addPost(self.post)
+
+    def _rows(self, **filters):
+        session = SessionLocal()
+        try:
+            return session.query(ReactionModel).filter_by(**filters).count()
+        finally:
+            session.close()
+
+    def test_react_returns_counts(self):
+        added, counts = self.post.react(self.users[1], "like")
+        self.assertTrue(added)
+        self.assertEqual(counts, {"like": 1, "dislike": 0, "heart": 0, "flag": 0})
+        added, counts = self.post.react(self.users[2], "heart")
+        self.assertEqual(counts["heart"], 1)
+        added, counts = self.post.react(self.users[1], "like")
+        self.assertFalse(added)
+        self.assertEqual(counts, {"like": 0, "dislike": 0, "heart": 1, "flag": 0})
+        self.assertEqual(self.post.reactioncounts(), counts)
+        self.assertEqual([r.reaction_type for r in self.post.reactions], ["heart"])
+        with self.assertRaises(ValueError):
+            self.post.react(self.users[1], "invalid")
+
+    def test_endpoint_needs_no_parentless_rows(self):
+        client = app.test_client()
+        resp = client.get(f"/api/posts/react/{self.post.db_id}/1/{self.users[1].db_id}")
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.get_json()["counts"]["like"], 1)
+        resp = client.get(f"/api/posts/react/{self.post.db_id}/1/{self.users[1].db_id}")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()["counts"]["like"], 0)
+        self.assertEqual(self._rows(), 0)
+
+    def test_toggle_attaches_existing_wrapper(self):
+        reaction = Reaction("like", self.users[1])
+        self.assertTrue(self.post.togglereaction(reaction))
+        self.assertIs(reaction.parent, self.post)
+        self.assertEqual(self._rows(parent_id=None), 0)
+        self.assertFalse(self.post.togglereaction(reaction))
+        self.assertEqual(self._rows(), 0)
+
+    def test_concurrent_toggles(self):
+        # every user toggles twice and one user once more: counts settle exactly
+        client = app.test_client()
+        barrier = threading.Barrier(THREADS)
+        errors = []
+
+        def worker(index):
+            try:
+                barrier.wait()
+                for _ in range(3 if index == 0 else 2):
+                    client.get(f"/api/posts/react/{self.post.db_id}/1/{self.users[index].db_id}")
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self._rows(parent_id=self.post.db_id), 1)
+        self.assertEqual(self.post.reactioncounts()["like"], 1)
+        self.assertEqual([r.user for r in self.post.reactions], [self.users[0]])
+
+
+class TestReactionCounters(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+        self.client = app.test_client()
+        self.forum = Forum("CSEN174")
+        self.users = [User(f"user{i}", f"user{i}@scu.edu", "CSEN", 2, None, None, None) for i in range(3)]
+        for user in self.users:
+            self.forum.addUser(user)
+        self.post = Post(poster=self.users[0], message="Announcement", title="News")
+        self.forum.addPost(self.post)
+        self.comment = Comment(poster=self.users[1], message="Reply", title="Re", parent=self.post)
+        for user in self.users:
+            self.post.react(user, "like")
+        self.post.react(self.users[1], "heart")
+        self.comment.react(self.users[2], "flag")
+
+    def _counter_rows(self):
+        session = SessionLocal()
+        try:
+            return sorted((r.post_id, r.reaction_type, r.count) for r in session.query(PostReactionCountModel))
+        finally:
+            session.close()
+
+    def test_counters_follow_every_write(self):
+        self.assertEqual(self._counter_rows(), [(self.post.db_id, "heart", 1), (self.post.db_id, "like", 3),
+                                                (self.comment.db_id, "flag", 1)])
+        self.post.react(self.users[1], "heart")
+        self.assertEqual(self.client.get(f"/api/posts/react/{self.post.db_id}/2/{self.users[0].db_id}").status_code, 201)
+        self.assertEqual(ReactionRepository.count_by_type(self.post.db_id), {"like": 3, "dislike": 1, "heart": 0, "flag": 0})
+        # deleting the forum deletes its reactions, and their counters with them
+        admin = Admin("root", "root@scu.edu", "CSEN", 4)
+        resp = self.client.post(f"/api/forums/{self.forum.db_id}/delete", json={"admin_email": admin.email})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self._counter_rows(), [])
+
+    def test_rebuild_matches_triggers(self):
+        before = self._counter_rows()
+        session = SessionLocal()
+        try:
+            session.query(PostReactionCountModel).delete()
+            session.commit()
+        finally:
+            session.close()
+        self.assertEqual(rebuild_counters()["post_reaction_counts"], 3)
+        self.assertEqual(self._counter_rows(), before)
+
+    def test_counts_only_serialization(self):
+        viewer = self.users[1].db_id
+        query = f"reactions=counts&viewer_id={viewer}"
+        bodies = [
+            self.client.get(f"/api/posts/{self.post.db_id}?{query}").get_json(),
+            self.client.get(f"/api/forums/{self.forum.db_id}/posts?{query}").get_json()["posts"][0],
+            self.client.get(f"/api/posts/{self.post.db_id}/comments?max_depth=2&{query}").get_json(),
+        ]
+        for body in bodies:
+            if "id" in body:
+                self.assertEqual(body["reaction_counts"], {"like": 3, "dislike": 0, "heart": 1, "flag": 0})
+                self.assertEqual(sorted(body["viewer_reactions"]), ["heart", "like"])
+                self.assertNotIn("reactions", body)
+            comment = body["comments"][0]
+            self.assertEqual(comment["reaction_counts"]["flag"], 1)
+            self.assertEqual(comment["viewer_reactions"], [])
+        resp = self.client.get(f"/api/posts/{self.post.db_id}?reactions=bogus")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_counts_only_skips_reaction_rows(self):
+        with capture_statements() as statements:
+            resp = self.client.get(f"/api/forums/{self.forum.db_id}/posts?reactions=counts")
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse([s for s in statements if "FROM reactions" in s])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from backend.cleanup_db import cleanup_db
+from backend.db import init_db, SessionLocal
+from backend.Forum import Forum
+from backend.models import UserModel
+from tests.helpers import capture_statements
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imports every wrapper and the app without serving, then serves one request
+PROBE = """
+import json, sqlite3, sys
+import backend.User, backend.Forum, backend.Messages
+from backend.app import app
+database = sys.argv[1]
+tables = lambda: [r[0] for r in sqlite3.connect(database).execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+before = tables()
+google_at_import = 'google.auth' in sys.modules
+status = app.test_client().get('/api/forums').status_code
+print(json.dumps({'before': before, 'after': tables(), 'status': status, 'google': google_at_import}))
+"""
+
+
+class TestStartup(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+
+    def test_import_does_no_database_work(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            database = os.path.join(tmpdir, "cold.db")
+            env = dict(os.environ, SCU_FORUMS_DATABASE_URL="sqlite:///" + database)
+            out = subprocess.run([sys.executable, "-c", PROBE, database], cwd=ROOT, env=env,
+                                 check=True, capture_output=True, text=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        self.assertEqual(result['before'], [])
+        self.assertFalse(result['google'])
+        # the schema is created when the first request arrives
+        self.assertEqual(result['status'], 200)
+        self.assertIn('posts', result['after'])
+        self.assertIn('row_changes', result['after'])
+
+    def test_init_db_on_current_schema_is_one_query(self):
+        init_db()
+        with capture_statements() as statements:
+            init_db()
+        self.assertEqual(statements, ['PRAGMA user_version'])
+
+    def test_deleted_user_created_on_first_use(self):
+        session = SessionLocal()
+        try:
+            self.assertEqual(session.query(UserModel).count(), 0)
+        finally:
+            session.close()
+        deleted = Forum.DELETED_USER
+        self.assertEqual(deleted.email, "deleted@scu.edu")
+        self.assertIs(Forum.DELETED_USER, deleted)
+        # a recreated database gets its own sentinel row
+        cleanup_db()
+        self.assertIsNot(Forum.DELETED_USER, deleted)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import unittest
+from sqlalchemy import text
+from backend.app import app
+from backend.cleanup_db import cleanup_db
+from backend.db import SessionLocal, engine
+from backend.models import PostModel, ReactionModel
+from backend.object_registry import _REGISTRY
+from backend.thread_services import ThreadRepository
+from backend.User import User
+from backend.Forum import Forum
+from backend.Messages import Post, Comment, Reaction
+from tests.helpers import capture_statements
+
+
+class TestThreadRepository(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+        self.client = app.test_client()
+        self.user = User("alice", "alice@scu.edu", "CSEN", 2, None, None, None)
+        self.admin = User("root", "root@scu.edu", "CSEN", 4, None, None, None, is_admin=True)
+        self.forum = Forum("CSEN174")
+        self.forum.addUser(self.user)
+
+    def _add_chain(self, depth, title="Deep"):
+        # Post with a single reply chain `depth` levels deep
+        post = Post(poster=self.user, message="Body", title=title)
+        self.forum.addPost(post)
+        parent = post
+        for level in range(depth):
+            parent.togglereaction(Reaction("like", self.user))
+            parent = Comment(poster=self.user, message=f"Reply {level}", title="Re", parent=parent)
+        return post
+
+    def _count_queries(self, fn):
+        with capture_statements() as statements:
+            result = fn()
+        return result, len(statements)
+
+    def test_subtree_rows(self):
+        post = self._add_chain(4)
+        first = post.comments[0]
+        rows = ThreadRepository.subtree([post.db_id])
+        self.assertEqual([r.depth for r in rows], [0, 1, 2, 3, 4])
+        self.assertEqual(rows[1].id, first.db_id)
+        self.assertEqual(rows[1].parent_id, post.db_id)
+        # max_depth stops the walk
+        self.assertEqual(len(ThreadRepository.subtree([post.db_id], max_depth=2)), 3)
+        # a subtree can start below the top-level post
+        self.assertEqual([r.id for r in ThreadRepository.subtree([first.db_id])][0], first.db_id)
+
+    def test_post_load_uses_fixed_queries(self):
+        # Loading a thread should not cost one query per comment
+        shallow = self._add_chain(2, "Shallow")
+        deep = self._add_chain(30, "Deep")
+        _REGISTRY.clear()
+        _, small = self._count_queries(lambda: Post.load_by_id(shallow.db_id))
+        _REGISTRY.clear()
+        loaded, big = self._count_queries(lambda: Post.load_by_id(deep.db_id))
+        self.assertEqual(small, big)
+
+        node, levels = loaded, 0
+        while node.comments:
+            self.assertEqual(len(node.reactions), 1)
+            self.assertIs(node.comments[0].parent, node)
+            node = node.comments[0]
+            levels += 1
+        self.assertEqual(levels, 30)
+        self.assertEqual(node.message, "Reply 29")
+
+    def test_comment_listing_reuses_wrappers(self):
+        post = self._add_chain(3)
+        existing = post.comments[0]
+        self.assertEqual(post.getcomments(), [existing])
+        self.assertEqual(len(post.comments), 1)
+
+        _REGISTRY.clear()
+        reloaded = Post.load_by_id(post.db_id)
+        comments = reloaded.getcomments()
+        self.assertEqual(len(comments), 1)
+        self.assertEqual(comments[0].comments[0].message, "Reply 1")
+
+    def test_delete_forum_removes_whole_threads(self):
+        self._add_chain(12)
+        other = Forum("MATH51")
+        keep = Post(poster=self.user, message="Keep", title="Other forum")
+        other.addUser(self.user)
+        other.addPost(keep)
+        resp = self.client.post(f"/api/forums/{self.forum.db_id}/delete", json={"admin_email": self.admin.email})
+        self.assertEqual(resp.status_code, 200)
+
+        session = SessionLocal()
+        try:
+            self.assertEqual([p.id for p in session.query(PostModel).all()], [keep.db_id])
+            self.assertEqual(session.query(ReactionModel).count(), 0)
+        finally:
+            session.close()
+
+    def _models(self, session, wrappers):
+        return [session.get(PostModel, w.db_id) for w in wrappers]
+
+    def test_paths_follow_parents(self):
+        post = self._add_chain(2)
+        first = post.comments[0]
+        sibling = Comment(poster=self.user, message="Sibling", title="Re", parent=post)
+        session = SessionLocal()
+        try:
+            root, first_m, second_m, sibling_m = self._models(session, [post, first, first.comments[0], sibling])
+            self.assertEqual(root.path, ThreadRepository.child_path(None, post.db_id))
+            self.assertEqual(first_m.path, f"{root.path}/{first.db_id:010d}")
+            self.assertEqual([root.depth, first_m.depth, second_m.depth, sibling_m.depth], [0, 1, 2, 1])
+            self.assertEqual(ThreadRepository.ancestor_ids(second_m.path), [post.db_id, first.db_id])
+
+            # display order: each reply right after its parent, siblings by id
+            thread = ThreadRepository.load_thread(session, root.path)
+            self.assertEqual([m.id for m in thread], [post.db_id, first.db_id, second_m.id, sibling.db_id])
+            self.assertEqual([m.id for m in ThreadRepository.load_thread(session, first_m.path, include_root=False)], [second_m.id])
+            self.assertEqual(ThreadRepository.count_subtree(session, root.path), 3)
+        finally:
+            session.close()
+
+    def test_backfill_paths(self):
+        post = self._add_chain(3)
+        session = SessionLocal()
+        try:
+            expected = [(m.id, m.path, m.depth) for m in ThreadRepository.load_thread(session, self._models(session, [post])[0].path)]
+            session.query(PostModel).update({PostModel.path: None, PostModel.depth: 0})
+            session.commit()
+            self.assertEqual(ThreadRepository.backfill_paths(session), 4)
+            session.expire_all()
+            rows = session.query(PostModel).order_by(PostModel.path).all()
+            self.assertEqual([(m.id, m.path, m.depth) for m in rows], expected)
+            self.assertEqual(ThreadRepository.backfill_paths(session), 0)
+        finally:
+            session.close()
+
+    def test_subtree_is_index_range_scan(self):
+        session = SessionLocal()
+        try:
+            query = session.query(PostModel).filter(ThreadRepository.in_subtree("0000000001")).order_by(PostModel.path)
+            sql = str(query.statement.compile(engine, compile_kwargs={"literal_binds": True}))
+            plan = " ".join(row[-1] for row in session.execute(text("EXPLAIN QUERY PLAN " + sql)))
+        finally:
+            session.close()
+        self.assertIn("USING INDEX ix_posts_path (path>? AND path<?)", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_thread_endpoint_pages_in_display_order(self):
+        post = self._add_chain(3)
+        Comment(poster=self.user, message="Sibling", title="Re", parent=post)
+        resp = self.client.get(f"/api/posts/{post.db_id}/thread?limit=2")
+        self.assertEqual(resp.status_code, 200)
+        data = resp.get_json()
+        self.assertEqual(data["reply_count"], 4)
+        self.assertEqual([(c["message"], c["depth"]) for c in data["comments"]], [("Reply 0", 1), ("Reply 1", 2)])
+        self.assertEqual(data["comments"][0]["reactions"][0]["reaction_type"], "like")
+
+        resp = self.client.get(f"/api/posts/{post.db_id}/thread?limit=2&cursor={data['next_cursor']}")
+        data = resp.get_json()
+        self.assertEqual([(c["message"], c["depth"]) for c in data["comments"]], [("Reply 2", 3), ("Sibling", 1)])
+        self.assertIsNone(data["next_cursor"])
+
+        self.assertEqual(self.client.get(f"/api/posts/{post.db_id}/thread?cursor=bogus").status_code, 400)
+        self.assertEqual(self.client.get("/api/posts/9999/thread").status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+from backend.app import app
+from backend.cleanup_db import cleanup_db
+from backend.db import SessionLocal
+from backend.models import PostModel
+from backend.messages_services import PostRepository
+from backend.object_registry import _REGISTRY
+from backend.User import User
+from backend.Forum import Forum
+from backend.Messages import Post, Comment
+
+
+class TestThreadStats(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+        self.client = app.test_client()
+        self.user = User("alice", "alice@scu.edu", "CSEN", 2, None, None, None)
+        self.forum = Forum("CSEN174")
+        self.forum.addUser(self.user)
+        self.post = Post(poster=self.user, message="Body", title="Thread")
+        self.forum.addPost(self.post)
+        self.reply = Comment(poster=self.user, message="Reply", title="Re", parent=self.post)
+        self.nested = Comment(poster=self.user, message="Nested", title="Re", parent=self.reply)
+        self.latest = Comment(poster=self.user, message="Latest", title="Re", parent=self.post)
+
+    def _stats(self, post_id):
+        session = SessionLocal()
+        try:
+            row = session.get(PostModel, post_id)
+            return row.comment_count, row.descendant_count, row.last_activity_at
+        finally:
+            session.close()
+
+    def _delete(self, comment):
+        return self.client.post(f"/api/comments/{comment.db_id}/delete", json={"actor_email": self.user.email})
+
+    def test_replies_update_every_ancestor(self):
+        self.assertEqual(self._stats(self.post.db_id), (2, 3, self.latest.created_at))
+        self.assertEqual(self._stats(self.reply.db_id), (1, 1, self.nested.created_at))
+        self.assertEqual(self._stats(self.nested.db_id), (0, 0, self.nested.created_at))
+        # cached wrappers follow without reloading the tree
+        self.assertEqual((self.post.comment_count, self.post.descendant_count), (2, 3))
+        self.assertEqual(self.post.last_activity_at, self.latest.created_at)
+
+    def test_soft_delete_counts_once(self):
+        self.assertEqual(self._delete(self.nested).status_code, 200)
+        self.assertEqual(self._delete(self.nested).status_code, 200)
+        self.assertEqual(self._stats(self.post.db_id), (2, 2, self.latest.created_at))
+        self.assertEqual(self._stats(self.reply.db_id), (0, 0, self.nested.created_at))
+        self.assertEqual(self.reply.comment_count, 0)
+        # a reply deleted through the post endpoint leaves the counts too
+        resp = self.client.post(f"/api/posts/{self.latest.db_id}/delete", json={"actor_email": self.user.email})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self._stats(self.post.db_id)[:2], (1, 1))
+
+    def test_serializers_agree(self):
+        wrapper = self.client.get(f"/api/posts/{self.post.db_id}?fields=comment_count,descendant_count,last_activity_at").get_json()
+        _REGISTRY.clear()
+        listed = self.client.get(f"/api/forums/{self.forum.db_id}/posts?fields=comment_count,descendant_count,last_activity_at").get_json()
+        self.assertEqual(listed["posts"][0], wrapper)
+        self.assertEqual(wrapper["comment_count"], 2)
+        self.assertEqual(wrapper["descendant_count"], 3)
+        self.assertEqual(wrapper["last_activity_at"], self.latest.created_at.isoformat() + "Z")
+
+    def test_listing_sort_keys(self):
+        quiet = Post(poster=self.user, message="Body", title="Quiet")
+        self.forum.addPost(quiet)
+        busy = Post(poster=self.user, message="Body", title="Busy")
+        self.forum.addPost(busy)
+        Comment(poster=self.user, message="Reply", title="Re", parent=busy)
+        # the first thread gets the newest reply, so it leads by activity again
+        Comment(poster=self.user, message="Bump", title="Re", parent=self.post)
+        expected = {
+            "created": [self.post.db_id, quiet.db_id, busy.db_id],
+            "activity": [self.post.db_id, busy.db_id, quiet.db_id],
+            "comments": [self.post.db_id, busy.db_id, quiet.db_id],
+        }
+        base = f"/api/forums/{self.forum.db_id}/posts?fields=id&sort="
+        for sort, ids in expected.items():
+            whole = self.client.get(base + sort).get_json()["posts"]
+            self.assertEqual([p["id"] for p in whole], ids, sort)
+            paged, cursor = [], None
+            while True:
+                url = base + sort + "&limit=1" + (f"&cursor={cursor}" if cursor else "")
+                body = self.client.get(url).get_json()
+                paged.extend(p["id"] for p in body["posts"])
+                cursor = body["next_cursor"]
+                if cursor is None:
+                    break
+            self.assertEqual(paged, ids, sort)
+        self.assertEqual(self.client.get(base + "bogus").status_code, 400)
+
+    def test_rebuild_matches_incremental(self):
+        self._delete(self.nested)
+        ids = [self.post.db_id, self.reply.db_id, self.nested.db_id, self.latest.db_id]
+        before = [self._stats(post_id) for post_id in ids]
+        session = SessionLocal()
+        try:
+            session.query(PostModel).update({"comment_count": 0, "descendant_count": 0, "last_activity_at": None})
+            session.commit()
+        finally:
+            session.close()
+        self.assertEqual(PostRepository.rebuild_thread_stats(), 4)
+        self.assertEqual([self._stats(post_id) for post_id in ids], before)
+
+
+if __name__ == '__main__':
+    unittest.main()
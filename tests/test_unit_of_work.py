@@ -0,0 +1,103 @@
+import unittest
+from unittest import mock
+from sqlalchemy import event
+from backend.app import app
+from backend.cleanup_db import cleanup_db
+from backend.db import SessionLocal, engine, begin_unit_of_work, end_unit_of_work, in_unit_of_work
+from backend.models import PostModel
+from backend.object_registry import get as registry_get
+from backend.User import User
+from backend.Forum import Forum
+from backend.Messages import Post
+
+
+class TestUnitOfWork(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+        self.client = app.test_client()
+        self.user = User("test_poster", "poster@scu.edu", "CSEN", 2025, None, None, None)
+        self.forum = Forum("TEST101")
+        self.user.addForum(self.forum)
+        self.forum.addUser(self.user)
+
+    def _count_commits(self, fn):
+        commits = []
+
+        def _commit(conn):
+            commits.append(conn)
+
+        event.listen(engine, "commit", _commit)
+        try:
+            result = fn()
+        finally:
+            event.remove(engine, "commit", _commit)
+        return result, len(commits)
+
+    def _post_count(self):
+        session = SessionLocal()
+        try:
+            return session.query(PostModel).count()
+        finally:
+            session.close()
+
+    def test_write_request_commits_once(self):
+        # Creating a post spans several repository calls but a single transaction
+        resp, commits = self._count_commits(lambda: self.client.post(
+            f"/api/forums/{self.forum.db_id}/posts",
+            json={"title": "Title", "message": "Body", "user_email": self.user.email}
+        ))
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(commits, 1)
+        self.assertEqual(self._post_count(), 1)
+        self.assertFalse(in_unit_of_work())
+
+        post_id = resp.get_json()["post"]["id"]
+        resp, commits = self._count_commits(lambda: self.client.post(
+            f"/api/posts/{post_id}/comments",
+            json={"message": "Reply", "user_email": self.user.email}
+        ))
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(commits, 1)
+
+    def test_failed_request_rolls_back(self):
+        # The post row is flushed, then serializing it fails: nothing may persist
+        created = []
+
+        def _fail(post, sel=None):
+            created.append(post.db_id)
+            raise ValueError("serializer failed")
+
+        with mock.patch('backend.app._serialize_post', side_effect=_fail):
+            resp = self.client.post(
+                f"/api/forums/{self.forum.db_id}/posts",
+                json={"title": "Title", "message": "Body", "user_email": self.user.email}
+            )
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(len(created), 1)
+        self.assertIsNotNone(created[0])
+        self.assertEqual(self._post_count(), 0)
+        self.assertIsNone(registry_get('Post', created[0]))
+        self.assertIsNone(Post.load_by_id(created[0]))
+
+        # the rolled back id must not resolve to the stale wrapper
+        post = Post(poster=self.user, message="Later", title="Later")
+        self.assertIs(registry_get('Post', post.db_id), post)
+        self.assertEqual(Post.load_by_id(post.db_id).message, "Later")
+
+    def test_commit_is_flush_inside_unit(self):
+        begin_unit_of_work()
+        try:
+            post = Post(poster=self.user, message="Pending", title="Pending")
+        finally:
+            end_unit_of_work(commit=False)
+        self.assertEqual(self._post_count(), 0)
+        self.assertIsNone(registry_get('Post', post.db_id))
+
+        begin_unit_of_work()
+        Post(poster=self.user, message="Kept", title="Kept")
+        end_unit_of_work()
+        self.assertEqual(self._post_count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
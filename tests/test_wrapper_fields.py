@@ -0,0 +1,74 @@
+import threading
+import unittest
+import weakref
+from backend.cleanup_db import cleanup_db
+from backend.object_registry import clear as registry_clear
+from backend.wrapper_fields import lazy_list
+from backend.User import User, Admin
+from backend.Forum import Forum
+from backend.Messages import Post, Comment, Reaction
+
+
+class TestWrapperFields(unittest.TestCase):
+    def setUp(self):
+        cleanup_db()
+        self.user = User("alice", "alice@scu.edu", "CSEN", 2, None, None, None)
+        self.forum = Forum("CSEN174")
+        self.forum.addUser(self.user)
+        self.post = Post(poster=self.user, message="Body", title="Title")
+        self.forum.addPost(self.post)
+        self.comment = Comment(poster=self.user, message="Reply", title="Re", parent=self.post)
+
+    def test_wrappers_have_no_instance_dict(self):
+        admin = Admin("root", "root@scu.edu", "CSEN", 4)
+        reaction = Reaction("like", self.user, self.post)
+        for wrapper in (self.user, admin, self.forum, self.post, self.comment, reaction):
+            self.assertFalse(hasattr(wrapper, '__dict__'), type(wrapper).__name__)
+            self.assertIs(weakref.ref(wrapper)(), wrapper)
+        with self.assertRaises(AttributeError):
+            self.post.unexpected = 1
+
+    def test_loaded_lists_allocated_on_first_access(self):
+        registry_clear()
+        root = Post.load_by_id(self.post.db_id)
+        leaf = root.comments[0]
+        self.assertTrue(Post.comments.is_loaded(root))
+        self.assertFalse(Post.comments.is_loaded(leaf))
+        self.assertFalse(Post.reactions.is_loaded(leaf))
+        self.assertEqual(leaf.comments, [])
+        self.assertIs(leaf.comments, leaf.comments)
+        user = User.load_by_db_id(self.user.db_id)
+        self.assertFalse(User.posts.is_loaded(user))
+
+    def test_concurrent_first_access_builds_one_list(self):
+        built = []
+
+        class Holder:
+            __slots__ = ('_items',)
+
+            def _make(self):
+                built.append(1)
+                return []
+
+            items = lazy_list(_make)
+
+        holder = Holder()
+        barrier = threading.Barrier(8)
+        seen = []
+
+        def worker():
+            barrier.wait()
+            seen.append(holder.items)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertTrue(all(items is seen[0] for items in seen))
+        del holder.items
+        self.assertIsNot(holder.items, seen[0])
+
+
+if __name__ == '__main__':
+    unittest.main()